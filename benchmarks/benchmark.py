@@ -0,0 +1,313 @@
+#! /usr/bin/env python3
+
+import json
+import platform
+import struct
+import sys
+import zipfile
+from base64 import b64decode
+from io import BytesIO
+from multiprocessing import Pool
+from optparse import OptionParser
+from os.path import join, getsize
+from random import Random
+from resource import getrusage, RUSAGE_SELF
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import perf_counter, strftime
+""" Benchmarks for the hot paths of jsnoop. All input is generated locally
+(jars, nested wars/ears, signed jars and manifests), nothing is fetched from
+the network. Every benchmark runs in a fresh process so that the reported
+peak RSS belongs to that benchmark alone. The results are written as a single
+JSON document so that runs of different versions can be compared."""
+
+# Signature block (PKCS#7 SignedData) used for the generated signed jars
+SIGNATURE_BLOCK = b64decode("""
+MIIDmQYJKoZIhvcNAQcCoIIDijCCA4YCAQExDzANBglghkgBZQMEAgEFADALBgkqhkiG9w0BBwGg
+ggJkMIICYDCCAcmgAwIBAgICEjQwDQYJKoZIhvcNAQELBQAwSzELMAkGA1UEBhMCQVUxDzANBgNV
+BAoMBmpzbm9vcDEOMAwGA1UECwwFVGVzdHMxGzAZBgNVBAMMEmpzbm9vcCB0ZXN0IHNpZ25lcjAe
+Fw0yNjEwMTcxOTEwNTNaFw0zNjEwMTQxOTEwNTNaMEsxCzAJBgNVBAYTAkFVMQ8wDQYDVQQKDAZq
+c25vb3AxDjAMBgNVBAsMBVRlc3RzMRswGQYDVQQDDBJqc25vb3AgdGVzdCBzaWduZXIwgZ8wDQYJ
+KoZIhvcNAQEBBQADgY0AMIGJAoGBAPZR5Hr7v971BVgUdQzq1PlcE1LFNrSKoNO3zNrGL1Z+wR9d
+M4UX9pmo35ekANFfc/nbt0ZQZVM8UZrW5ic0vj5fyfLE84htU2VT/X70AhdplWbvXOGQ3OvGyyrc
+RcK8ZqZJBECwEFiqf5DyuTkzMS8IufPGsqWrOs/gt/uDOH3FAgMBAAGjUzBRMB0GA1UdDgQWBBTB
+Pi7WLgp1bFeh7xQ26pKNjJKVWTAfBgNVHSMEGDAWgBTBPi7WLgp1bFeh7xQ26pKNjJKVWTAPBgNV
+HRMBAf8EBTADAQH/MA0GCSqGSIb3DQEBCwUAA4GBAGPjxbseiFpcocfciNsG2nE9SGNpWQtOo16M
+l7HBHbL1Nbf30Qw83HiqbTZpDCRiLdg1gM27MUlcPr08v8PG6QVzU4NIwCJjilwYyn7BH/hMQx57
+oqkpiWdbaxc9Q+Q3recKNrQD2vDdI8UomyscJKDSnDbh2YLd+pUdeTKXGbFpMYH6MIH3AgEBMFEw
+SzELMAkGA1UEBhMCQVUxDzANBgNVBAoMBmpzbm9vcDEOMAwGA1UECwwFVGVzdHMxGzAZBgNVBAMM
+Empzbm9vcCB0ZXN0IHNpZ25lcgICEjQwDQYJYIZIAWUDBAIBBQAwDQYJKoZIhvcNAQEBBQAEgYAq
+BSjVdGXYkhgfePsoozOXBJ9rHujHx49t4oABHhys2HVDltgaxaan0vGg9M75KJRCzSV8k+kAkVP9
+OoM1tMcNwxLnkDe4mRYhy6CnW7kXKcPI9eQfcB4IQ4bLUcZhIgnWvuplEDQr6lWm3NE/IhS6yaxX
+CXdjZBhCaWlrbh/oWA==
+""")
+
+"""
+Synthetic input generation
+"""
+def make_class(name, rnd, size=2048):
+	"""Returns a minimal, valid class file for name padded with a random
+	attribute so that the class is roughly size bytes."""
+	def utf8(value):
+		data = value.encode('utf-8')
+		return struct.pack('>BH', 1, len(data)) + data
+	pool = [utf8(name), struct.pack('>BH', 7, 1), utf8('java/lang/Object'),
+			struct.pack('>BH', 7, 3), utf8('Padding')]
+	padding = rnd.getrandbits(8 * size).to_bytes(size, 'big')
+	data = b'\xca\xfe\xba\xbe' + struct.pack('>HHH', 0, 0x32, len(pool) + 1)
+	data += b''.join(pool) + struct.pack('>HHHH', 0x21, 2, 4, 0)
+	data += struct.pack('>HHH', 0, 0, 1)
+	data += struct.pack('>HI', 5, len(padding)) + padding
+	return data
+
+def make_manifest(name, entries=0):
+	lines = ['Manifest-Version: 1.0', 'Created-By: jsnoop benchmark',
+			'Implementation-Title: %s' % name,
+			'Implementation-Version: 1.0.0']
+	lines.append('')
+	for i in range(entries):
+		lines += ['Name: org/example/%s/Class%d.class' % (name, i),
+				'SHA-256-Digest: %s' % ('A' * 44), '']
+	return ('\n'.join(lines) + '\n').encode('utf-8')
+
+def make_jar(name, classes, rnd, signed=False, class_size=2048):
+	buf = BytesIO()
+	with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as jar:
+		jar.writestr('META-INF/MANIFEST.MF',
+					make_manifest(name, classes if signed else 0))
+		if signed:
+			jar.writestr('META-INF/SIGNER.SF', make_manifest(name, classes))
+			jar.writestr('META-INF/SIGNER.RSA', SIGNATURE_BLOCK)
+		for i in range(classes):
+			cname = 'org/example/%s/Class%d' % (name, i)
+			jar.writestr(cname + '.class', make_class(cname, rnd, class_size))
+		jar.writestr('org/example/%s/messages.properties' % name,
+					'greeting=hello\n' * 32)
+	return buf.getvalue()
+
+def make_war(name, jars, classes, rnd):
+	buf = BytesIO()
+	with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as war:
+		war.writestr('META-INF/MANIFEST.MF', make_manifest(name))
+		war.writestr('WEB-INF/web.xml', '<web-app/>\n')
+		for i in range(jars):
+			jar = make_jar('%slib%d' % (name, i), classes, rnd, signed=i % 4 == 0)
+			# Jars are usually stored as is in wars
+			war.writestr('WEB-INF/lib/%slib%d.jar' % (name, i), jar,
+						compress_type=zipfile.ZIP_STORED)
+		for i in range(classes):
+			cname = 'org/example/%s/web/Servlet%d' % (name, i)
+			war.writestr('WEB-INF/classes/%s.class' % cname,
+						make_class(cname, rnd))
+	return buf.getvalue()
+
+def make_ear(name, wars, jars, classes, rnd):
+	buf = BytesIO()
+	with zipfile.ZipFile(buf, 'w', zipfile.ZIP_STORED) as ear:
+		ear.writestr('META-INF/MANIFEST.MF', make_manifest(name))
+		ear.writestr('META-INF/application.xml', '<application/>\n')
+		for i in range(wars):
+			ear.writestr('%sweb%d.war' % (name, i),
+						make_war('%sweb%d' % (name, i), jars, classes, rnd))
+	return buf.getvalue()
+
+def generate(workdir, scale, seed=0):
+	"""Writes the synthetic archives to workdir and returns a dict mapping
+	their kind to their path."""
+	rnd = Random(seed)
+	archives = {
+		'jar'		: make_jar('plain', 50 * scale, rnd),
+		'signed-jar': make_jar('signed', 50 * scale, rnd, signed=True),
+		'war'		: make_war('webapp', 8 * scale, 20, rnd),
+		'ear'		: make_ear('enterprise', 2 * scale, 6, 20, rnd),
+	}
+	paths = {}
+	for kind, data in archives.items():
+		path = join(workdir, '%s.%s' % (kind, kind.split('-')[-1]))
+		with open(path, 'wb') as f:
+			f.write(data)
+		paths[kind] = path
+	return paths
+
+"""
+Benchmarks, each returns a dict of measurements
+"""
+def timed(function, iterations):
+	"""Calls function iterations times, returns the per call latencies."""
+	latencies = []
+	for _ in range(iterations):
+		start = perf_counter()
+		function()
+		latencies.append(perf_counter() - start)
+	return latencies
+
+def summarize(latencies):
+	latencies = sorted(latencies)
+	count = len(latencies)
+	return {
+		'calls'		: count,
+		'mean-us'	: 1e6 * sum(latencies) / count,
+		'p50-us'	: 1e6 * latencies[count // 2],
+		'p99-us'	: 1e6 * latencies[min(count - 1, int(count * 0.99))],
+	}
+
+def bench_get_handler_obj(paths, workdir, iterations):
+	from jsnoop.handlers import get_handler_obj
+	rnd = Random(1)
+	samples = {
+		'class'		: ('org/example/A.class', make_class('org/example/A', rnd)),
+		'manifest'	: ('META-INF/MANIFEST.MF', make_manifest('bench', 100)),
+		'signature'	: ('META-INF/SIGNER.RSA', SIGNATURE_BLOCK),
+		'text'		: ('readme.txt', b'hello world\n' * 64),
+		'jar'		: ('lib/bench.jar', make_jar('bench', 10, rnd)),
+	}
+	results = {}
+	for kind, (filename, data) in samples.items():
+		def run():
+			get_handler_obj(filename, BytesIO(data), '', None).info()
+		results[kind] = summarize(timed(run, iterations))
+	return results
+
+def bench_prepare_checksums(paths, workdir, iterations):
+	from jsnoop.handlers.simplefile import SimpleFile
+	results = {}
+	digest_sets = (('default', None), ('sha1', ['sha1']),
+				('blake2b', ['blake2b']))
+	for size in (1024, 64 * 1024, 4 * 1024 * 1024):
+		data = Random(size).getrandbits(8 * size).to_bytes(size, 'big')
+		count = max(1, iterations * 1024 // size) if size > 1024 else iterations
+		for name, checksums in digest_sets:
+			handler = SimpleFile('data.bin', BytesIO(data), checksums=checksums)
+			result = summarize(timed(handler.prepare_checksums, count))
+			result['mb-per-s'] = size / (result['mean-us'] / 1e6) / 2 ** 20
+			results['%d-bytes-%s' % (size, name)] = result
+	return results
+
+def bench_manifest_parse(paths, workdir, iterations):
+	from jsnoop.handlers.manifest import ManifestFile
+	results = {}
+	for entries in (0, 1000):
+		handler = ManifestFile('META-INF/MANIFEST.MF',
+							BytesIO(make_manifest('bench', entries)))
+		def run():
+			handler.fileobj.seek(0)
+			handler.parse()
+		results['%d-entries' % entries] = summarize(timed(run, iterations))
+	return results
+
+def bench_package(paths, workdir, iterations):
+	from jsnoop.package import Package
+	results = {}
+	for kind, path in sorted(paths.items()):
+		for mode, process_all_files, mmap in (('all', True, False),
+				('selected', False, False), ('all-mmap', True, True)):
+			files = 0
+			def run():
+				nonlocal files
+				files = len(Package(path, process_all_files=process_all_files,
+							mmap=mmap).info)
+			latencies = timed(run, max(1, iterations // 100))
+			result = summarize(latencies)
+			seconds = result['mean-us'] / 1e6
+			result['files'] = files
+			result['files-per-s'] = files / seconds
+			result['mb-per-s'] = getsize(path) / seconds / 2 ** 20
+			results['%s-%s' % (kind, mode)] = result
+	return results
+
+def bench_victims(paths, workdir, iterations):
+	from jsnoop.plugins import victims
+	rnd = Random(2)
+	def digest():
+		return '%0128x' % rnd.getrandbits(512)
+	entries = []
+	for i in range(2000):
+		classes = {'C%d.class' % j: digest() for j in range(50)}
+		entries.append({'fields': {'hash': digest(), 'cves': ['CVE-2013-%04d' % i],
+				'name': 'lib%d' % i, 'vendor': 'vendor', 'version': '1.0',
+				'hashes': {'sha512': {'files': classes}}}})
+	fetch_json = victims.fetch_json
+	victims.fetch_json = lambda timestamp, server=None, is_removals=False: \
+			[] if is_removals else entries
+	try:
+		db = victims.LocalDatabase(cache=join(workdir, 'victims.db'))
+	finally:
+		victims.fetch_json = fetch_json
+	known = [entry['fields']['hash'] for entry in entries]
+	shaded = list(entries[7]['fields']['hashes']['sha512']['files'].values())
+	shaded += [digest() for _ in range(500)]
+	results = {
+		'match_archive-hit'		: summarize(timed(
+				lambda: db.match_archive(rnd.choice(known)), iterations)),
+		'match_archive-miss'	: summarize(timed(
+				lambda: db.match_archive(digest()), iterations)),
+		'match_file_set'		: summarize(timed(
+				lambda: db.match_file_set(shaded), max(1, iterations // 10))),
+	}
+	db.close()
+	return results
+
+BENCHMARKS = {
+	'get_handler_obj'	: bench_get_handler_obj,
+	'prepare_checksums'	: bench_prepare_checksums,
+	'manifest_parse'	: bench_manifest_parse,
+	'package'			: bench_package,
+	'victims'			: bench_victims,
+}
+
+def _run(name, paths, workdir, iterations):
+	"""Runs a single benchmark, meant to be called in a fresh process."""
+	start = perf_counter()
+	results = BENCHMARKS[name](paths, workdir, iterations)
+	return {
+		'benchmark'		: name,
+		'seconds'		: perf_counter() - start,
+		# ru_maxrss is reported in KiB on Linux
+		'peak-rss-kb'	: getrusage(RUSAGE_SELF).ru_maxrss,
+		'results'		: results,
+	}
+
+def run(names, scale=1, iterations=1000):
+	workdir = mkdtemp(prefix='jsnoop.benchmark.')
+	try:
+		paths = generate(workdir, scale)
+		runs = []
+		for name in names:
+			with Pool(processes=1, maxtasksperchild=1) as pool:
+				runs.append(pool.apply(_run, (name, paths, workdir, iterations)))
+		return {
+			'timestamp'	: strftime('%Y-%m-%dT%H:%M:%S'),
+			'python'	: platform.python_version(),
+			'platform'	: platform.platform(),
+			'scale'		: scale,
+			'iterations': iterations,
+			'inputs'	: {kind: getsize(path) for kind, path in paths.items()},
+			'benchmarks': runs,
+		}
+	finally:
+		rmtree(workdir, ignore_errors=True)
+
+def main():
+	usage = 'usage: %prog [options] [benchmark ...]'
+	parser = OptionParser(usage)
+	parser.add_option('-s', '--scale', dest='scale', type='int', default=1,
+					help='size multiplier for the generated archives')
+	parser.add_option('-n', '--iterations', dest='iterations', type='int',
+					default=1000, help='iterations for micro benchmarks')
+	parser.add_option('-o', '--output', dest='output',
+					help='write the JSON results to OUTPUT instead of stdout')
+	(options, args) = parser.parse_args()
+	names = args if args else sorted(BENCHMARKS)
+	unknown = [name for name in names if name not in BENCHMARKS]
+	if unknown:
+		parser.error('Unknown benchmark(s): %s' % ', '.join(unknown))
+	report = run(names, options.scale, options.iterations)
+	if options.output:
+		with open(options.output, 'w') as output:
+			json.dump(report, output, indent=2, sort_keys=True)
+	else:
+		json.dump(report, sys.stdout, indent=2, sort_keys=True)
+		sys.stdout.write('\n')
+
+if __name__ == '__main__':
+	main()
@@ -3,27 +3,33 @@
 import sys
 from os.path import basename, join, isfile, isdir
 from os import listdir
-from jsnoop.package import Package
-from jsnoop.plugins.victims import LocalDatabase
+from jsnoop.batch import WorkQueue, BatchScanner, BATCH_QUEUE
+from jsnoop.checksum import required_by, check_algorithms
+from jsnoop.output import open_writer, FORMATS
+from jsnoop.plugins.victims import LocalDatabase, shared_database
 from optparse import OptionParser
-from multiprocessing import Pool
 """ This is an example script that takes as input an archive file, snoops it
-and writes the results to an output text file. No fancy stuff is done to the
-output, all info is output as a string(dictionary)."""
+and writes the results to an output file, either as JSON Lines or in the
+compact binary format of jsnoop.output."""
 
-output_ext = 'manifest'
+# Output file extension per format
+output_exts = {
+	'jsonl'		: 'jsonl',
+	'binary'	: 'jsnoop'
+}
+output_format = 'jsonl'
 
-def write_to_file(filepath, pkg):
-	output_file = '%s.%s' % (basename(filepath), output_ext)
-	with open(output_file, 'w') as output:
-		for child in pkg.info:
-			output.write(str(child) + '\n')
+def write_to_file(filepath, info):
+	output_file = '%s.%s' % (basename(filepath), output_exts[output_format])
+	with open_writer(output_file, output_format) as writer:
+		writer.write_all(info)
 	print('Manifest written to %s' % output_file)
 
-def scan_victims(pkg):
-	print('Scaning for victims: %s' % (pkg.handler.info()['name']))
-	vdb = LocalDatabase()
-	for child in pkg.info:
+def scan_victims(info):
+	print('Scaning for victims: %s' % (info[0]['name']))
+	# The database was updated before the scan, we only attach to it
+	vdb = shared_database()
+	for child in info:
 		if child['type'] == '.jar':
 			matches = vdb.match_archive(child['sha512'])
 			if len(matches) > 0:
@@ -32,18 +38,32 @@ def scan_victims(pkg):
 				print('Victim-Match : %s\n%s\n' % (cve_str,
                                         filename))
 
-def _process(filepath, process_all_files):
-	print('Snooping file: %s' % filepath)
-	pkg = Package(filepath, process_all_files=process_all_files)
-	scan_victims(pkg)
-	write_to_file(filepath, pkg)
+def _process(filepath, info):
+	print('Snooped file: %s' % filepath)
+	scan_victims(info)
+	write_to_file(filepath, info)
 
-def process(files, process_all_files=False):
-	pool = Pool(processes=4)
-	for filepath in files:
-		pool.apply_async(_process, (filepath, process_all_files))
-	pool.close()
-	pool.join()
+def _error(filepath, error):
+	print('Failed to snoop %s: %s' % (filepath, error))
+
+def process(files, process_all_files=False, queue_path=BATCH_QUEUE,
+			resume=False, workers=4, checksums=(), mmap=False):
+	# Fetch updates once, before attaching to the database
+	LocalDatabase().close()
+	queue = WorkQueue(queue_path)
+	if not resume:
+		queue.clear()
+	queue.add(files)
+	# Only compute the digests the victims database matches on, and any
+	# others asked for
+	checksums = check_algorithms(required_by(LocalDatabase) + list(checksums))
+	scanner = BatchScanner(queue, workers, _process, _error,
+						process_all_files=process_all_files,
+						checksums=checksums, mmap=mmap)
+	counts = scanner.run()
+	print('Done: %d files snooped, %d failed' % (counts['done'],
+			counts['failed']))
+	queue.close()
 
 def main():
 	usage = 'usage: %prog [options] filename'
@@ -51,10 +71,27 @@ def main():
 	parser.add_option('-d', '--dir', dest='directory',
 					help='snoop all files in DIRECTORY')
 	parser.add_option('-a', '--all-files', dest='allfiles',
-					action='store_false', help='process all files in archive')
+					action='store_true', default=False,
+					help='process all files in archive, not only archives, '
+					'manifests and signatures')
+	parser.add_option('-q', '--queue', dest='queue', default=BATCH_QUEUE,
+					help='keep the work queue in QUEUE [default: %default]')
+	parser.add_option('-r', '--resume', dest='resume', action='store_true',
+					default=False, help='resume an interrupted run')
+	parser.add_option('-w', '--workers', dest='workers', type='int',
+					default=4, help='number of worker processes')
+	parser.add_option('-f', '--format', dest='format', default='jsonl',
+					choices=FORMATS, help='output format, one of %s '
+					'[default: %%default]' % ', '.join(FORMATS))
+	parser.add_option('-c', '--checksums', dest='checksums', default='',
+					help='comma separated digests to compute in addition to '
+					'those the victims database needs, eg: md5,sha1')
+	parser.add_option('-m', '--mmap', dest='mmap', action='store_true',
+					default=False, help='memory-map input files, so each is '
+					'read only once')
 	(options, args) = parser.parse_args()
 	files = []
-	if len(args) < 1 and not options.directory:
+	if len(args) < 1 and not options.directory and not options.resume:
 		parser.error('No input specified.')
 	if len(args) == 1:
 		files.append(args[0])
@@ -67,7 +104,15 @@ def main():
 			if isfile(path):
 				files.append(path)
 				print('adding ', path)
-	process(files, options.allfiles)
+	global output_format
+	output_format = options.format
+	try:
+		checksums = check_algorithms([c for c in options.checksums.split(',')
+									if c])
+	except ValueError as e:
+		parser.error(str(e))
+	process(files, options.allfiles, options.queue, options.resume,
+			options.workers, checksums, options.mmap)
 
 if __name__ == '__main__':
 	main()
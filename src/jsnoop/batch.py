@@ -0,0 +1,215 @@
+"""
+Batch scanning of many files. Input paths are kept in a persistent work queue
+and every completed file is checkpointed, so an interrupted run resumes where
+it stopped instead of starting over.
+"""
+import sqlite3
+from collections import deque
+from multiprocessing import Pool, TimeoutError
+from os import getpid
+from threading import Lock
+from time import time
+from jsnoop.package import Package
+
+BATCH_QUEUE = 'jsnoop.queue'
+# Seconds to wait for the result of a file before it is given up on
+TIMEOUT = 60 * 60
+
+# Job states
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+class WorkQueue():
+	"""
+	Persistent queue of paths to scan, backed by SQLite. Paths are handed out
+	in the order they were added. A path claimed by a run that never completed
+	it (eg: because the process was killed) is handed out again once
+	recover() is called. Every claim counts as an attempt.
+	"""
+	def __init__(self, path=BATCH_QUEUE):
+		self.path = path
+		self.__lock = Lock()
+		self.__connection = None
+		self.__pid = None
+
+	def __getstate__(self):
+		return {'path': self.path}
+
+	def __setstate__(self, state):
+		self.__init__(state['path'])
+
+	@property
+	def connection(self):
+		if self.__connection is None or self.__pid != getpid():
+			connection = sqlite3.connect(self.path, timeout=60,
+										check_same_thread=False)
+			with connection:
+				connection.execute('CREATE TABLE IF NOT EXISTS jobs ('
+						'id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, '
+						'state TEXT NOT NULL, attempts INTEGER NOT NULL, '
+						'error TEXT, updated REAL NOT NULL)')
+				connection.execute('CREATE INDEX IF NOT EXISTS jobs_state '
+						'ON jobs (state, id)')
+			self.__connection = connection
+			self.__pid = getpid()
+		return self.__connection
+
+	def add(self, paths):
+		"""Adds paths to the queue. Paths already in the queue are left
+		alone, whatever their state. paths can be any iterable, it is consumed
+		in chunks."""
+		paths = iter(paths)
+		while True:
+			chunk = [(path, PENDING, time()) for path, _ in zip(paths,
+					range(1000))]
+			if not chunk:
+				break
+			with self.__lock, self.connection as connection:
+				connection.executemany('INSERT OR IGNORE INTO jobs (path, '
+						'state, attempts, updated) VALUES (?, ?, 0, ?)', chunk)
+
+	def claim(self, count=1):
+		"""Marks up to count pending paths as running and returns them."""
+		with self.__lock, self.connection as connection:
+			rows = connection.execute('SELECT id, path FROM jobs WHERE '
+					'state = ? ORDER BY id LIMIT ?', (PENDING, count)).fetchall()
+			connection.executemany('UPDATE jobs SET state = ?, attempts = '
+					'attempts + 1, updated = ? WHERE id = ?',
+					[(RUNNING, time(), row[0]) for row in rows])
+		return [path for _, path in rows]
+
+	def complete(self, path):
+		self.__set_state(path, DONE, None)
+
+	def fail(self, path, error):
+		self.__set_state(path, FAILED, error)
+
+	def __set_state(self, path, state, error):
+		with self.__lock, self.connection as connection:
+			connection.execute('UPDATE jobs SET state = ?, error = ?, '
+					'updated = ? WHERE path = ?', (state, error, time(), path))
+
+	def recover(self, max_attempts=None):
+		"""Returns paths left running by an interrupted run to the queue. If
+		max_attempts is given, failed paths that were attempted fewer times
+		are queued again as well, while running paths that were attempted as
+		many times fail (eg: inputs that crash the run every time). Returns
+		the number of paths queued."""
+		with self.__lock, self.connection as connection:
+			if max_attempts is not None:
+				connection.execute('UPDATE jobs SET state = ?, error = ?, '
+						'updated = ? WHERE state = ? AND attempts >= ?',
+						(FAILED, 'Interrupted %d times' % max_attempts, time(),
+						RUNNING, max_attempts))
+			count = connection.execute('UPDATE jobs SET state = ? WHERE '
+					'state = ?', (PENDING, RUNNING)).rowcount
+			if max_attempts is not None:
+				count += connection.execute('UPDATE jobs SET state = ?, '
+						'error = NULL WHERE state = ? AND attempts < ?',
+						(PENDING, FAILED, max_attempts)).rowcount
+		return count
+
+	def counts(self):
+		"""Returns a dict mapping each state to the number of paths in it."""
+		with self.__lock:
+			rows = self.connection.execute('SELECT state, COUNT(*) FROM jobs '
+					'GROUP BY state').fetchall()
+		counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+		counts.update(rows)
+		return counts
+
+	def failures(self):
+		"""Returns a list of (path, error) of all failed paths."""
+		with self.__lock:
+			return self.connection.execute('SELECT path, error FROM jobs '
+					'WHERE state = ? ORDER BY id', (FAILED,)).fetchall()
+
+	def clear(self):
+		with self.__lock, self.connection as connection:
+			connection.execute('DELETE FROM jobs')
+
+	def close(self):
+		with self.__lock:
+			if self.__connection is not None and self.__pid == getpid():
+				self.__connection.close()
+			self.__connection = None
+
+def _scan(path, options):
+	"""Worker entry point. Returns a tuple of (path, info, error) where either
+	info is the collected info list or error describes why there is none."""
+	try:
+		return path, Package(path, **options).info, None
+	except Exception as e:
+		return path, None, '%s: %s' % (e.__class__.__name__, e)
+
+class BatchScanner():
+	"""
+	Scans the paths of a WorkQueue using a pool of worker processes. Each
+	file's info list is passed to on_result(path, info) in the parent process
+	as soon as it is available, failures are passed to on_error(path, error).
+	A path is checkpointed as done (or failed) right after its callback
+	returned, so a crash never loses more than the files in flight.
+
+	At most window files (twice the number of workers by default) are in
+	flight at any time, so memory use does not depend on the size of the
+	queue. A file whose result is not available timeout seconds after it is
+	next in line fails, so a worker that was killed or hangs does not stall
+	the run. Any other keyword arguments are passed on to Package. Note that
+	Package cannot use a process pool of its own within a worker.
+	"""
+	def __init__(self, queue, workers=4, on_result=None, on_error=None,
+				window=None, maxtasksperchild=None, timeout=TIMEOUT,
+				**options):
+		self.queue = queue
+		self.workers = workers
+		self.on_result = on_result
+		self.on_error = on_error
+		self.window = window or workers * 2
+		self.maxtasksperchild = maxtasksperchild
+		self.timeout = timeout
+		self.options = options
+
+	def run(self, max_attempts=None):
+		"""Scans all pending paths, after requeueing those left over by an
+		interrupted run (see WorkQueue.recover()). Returns the queue's
+		counts() when done."""
+		self.queue.recover(max_attempts)
+		window = deque()
+		with Pool(self.workers, maxtasksperchild=self.maxtasksperchild) \
+				as pool:
+			def submit():
+				free = self.window - len(window)
+				if free > 0:
+					for path in self.queue.claim(free):
+						window.append((path, pool.apply_async(_scan,
+								(path, self.options))))
+			submit()
+			while window:
+				path, result = window.popleft()
+				try:
+					path, info, error = result.get(self.timeout)
+				except TimeoutError:
+					info, error = None, 'TimeoutError: no result after %s ' \
+							'seconds' % self.timeout
+				if error is None:
+					self.handle_result(path, info)
+				else:
+					self.handle_error(path, error)
+				submit()
+		return self.queue.counts()
+
+	def handle_result(self, path, info):
+		try:
+			if self.on_result is not None:
+				self.on_result(path, info)
+		except Exception as e:
+			self.handle_error(path, '%s: %s' % (e.__class__.__name__, e))
+		else:
+			self.queue.complete(path)
+
+	def handle_error(self, path, error):
+		if self.on_error is not None:
+			self.on_error(path, error)
+		self.queue.fail(path, error)
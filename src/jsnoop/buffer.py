@@ -0,0 +1,129 @@
+import mmap
+from io import BufferedIOBase, SEEK_SET, SEEK_CUR, SEEK_END
+
+class BufferReader(BufferedIOBase):
+	"""Read-only, seekable file-like-object over any bytes-like-object. Unlike
+	BytesIO, no copy of the underlying data is made, the reader only holds a
+	memoryview into it. The view is released when the reader is closed."""
+	def __init__(self, buf):
+		BufferedIOBase.__init__(self)
+		self.__view = memoryview(buf).cast('B')
+		self.__pos = 0
+
+	def __len__(self):
+		return self.__view.nbytes
+
+	def __reduce__(self):
+		# Views cannot cross process boundaries, ship a copy of the data instead
+		return (self.__class__, (self.__view.tobytes(),))
+
+	def readable(self):
+		return True
+
+	def seekable(self):
+		return True
+
+	def getbuffer(self):
+		"""Returns a new view of the complete buffer, similar to
+		BytesIO.getbuffer()."""
+		self._checkClosed()
+		return memoryview(self.__view)
+
+	def tell(self):
+		self._checkClosed()
+		return self.__pos
+
+	def seek(self, offset, whence=SEEK_SET):
+		self._checkClosed()
+		if whence == SEEK_SET:
+			position = offset
+		elif whence == SEEK_CUR:
+			position = self.__pos + offset
+		elif whence == SEEK_END:
+			position = self.__view.nbytes + offset
+		else:
+			raise ValueError('Invalid whence (%s)' % whence)
+		if position < 0:
+			raise ValueError('Negative seek position %d' % position)
+		self.__pos = position
+		return position
+
+	def read(self, size=-1):
+		self._checkClosed()
+		start = min(self.__pos, self.__view.nbytes)
+		if size is None or size < 0:
+			end = self.__view.nbytes
+		else:
+			end = min(start + size, self.__view.nbytes)
+		self.__pos = end
+		return self.__view[start:end].tobytes()
+
+	read1 = read
+
+	def readinto(self, b):
+		self._checkClosed()
+		start = min(self.__pos, self.__view.nbytes)
+		with memoryview(b).cast('B') as target:
+			count = min(target.nbytes, self.__view.nbytes - start)
+			target[:count] = self.__view[start:start + count]
+		self.__pos = start + count
+		return count
+
+	readinto1 = readinto
+
+	def readline(self, size=-1):
+		self._checkClosed()
+		start = min(self.__pos, self.__view.nbytes)
+		limit = self.__view.nbytes
+		if size is not None and size >= 0:
+			limit = min(start + size, limit)
+		end = start
+		# Scan in small chunks, lines in the files we care about are short
+		while end < limit:
+			chunk = self.__view[end:min(end + 256, limit)].tobytes()
+			newline = chunk.find(b'\n')
+			if newline >= 0:
+				end += newline + 1
+				break
+			end += len(chunk)
+		self.__pos = end
+		return self.__view[start:end].tobytes()
+
+	def close(self):
+		if not self.closed:
+			self.__view.release()
+		BufferedIOBase.close(self)
+
+class MappedFile(BufferReader):
+	"""BufferReader over a read-only memory mapping of the file at path. All
+	readers of the file share the mapping: hashing, magic sniffing, parsing
+	the zip central directory and serving stored members as views (see
+	ArchiveFile.get_stored_member()). The file is therefore read from disk
+	only once. name is the path, so handlers that need a file on disk use the
+	file itself."""
+	def __init__(self, path):
+		with open(path, 'rb') as f:
+			self.__mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		BufferReader.__init__(self, self.__mapping)
+		self.name = path
+
+	def __reduce__(self):
+		# Other processes map the file themselves
+		return (self.__class__, (self.name,))
+
+	def close(self):
+		BufferReader.close(self)
+		try:
+			self.__mapping.close()
+		except BufferError:
+			# Views handed out are still in use, the mapping goes once they
+			# are released
+			pass
+
+def map_file(path):
+	"""Returns a MappedFile of path, None if it cannot be mapped (eg: it is
+	empty or not a regular file)."""
+	try:
+		return MappedFile(path)
+	except (OSError, ValueError):
+		return None
@@ -0,0 +1,142 @@
+"""
+Single pass checksum computation. Every requested algorithm is fed from the
+same chunk of data, so a file is read exactly once regardless of how many
+digests are required.
+
+Any algorithm provided by hashlib can be used, including the fast blake2b and
+blake2s. If the xxhash module is installed, its non-cryptographic xxh32,
+xxh64, xxh3_64 and xxh128 digests are available as well. These are only meant
+for deduplication, not for matching against published checksums.
+"""
+import hashlib
+from hashlib import new as new_hash
+
+try:
+	import xxhash
+except ImportError:
+	xxhash = None
+
+# Size of the reusable read buffer used when digesting file-like-objects
+BUFFER_SIZE = 256 * 1024
+
+# Digests computed when no algorithms are specified
+DEFAULT_ALGORITHMS = ['md5', 'sha1', 'sha256', 'sha512']
+
+# Constructors of the algorithms not provided by hashlib
+_CONSTRUCTORS = {}
+if xxhash is not None:
+	for _name in ('xxh32', 'xxh64', 'xxh3_64', 'xxh128'):
+		if hasattr(xxhash, _name):
+			_CONSTRUCTORS[_name] = getattr(xxhash, _name)
+
+# The variable length shake digests are left out
+_AVAILABLE = frozenset(algorithm for algorithm in hashlib.algorithms_available
+					if not algorithm.startswith('shake')) | set(_CONSTRUCTORS)
+
+def available_algorithms():
+	"""Returns the set of algorithm names that can be computed."""
+	return _AVAILABLE
+
+def new_digest(algorithm):
+	"""Returns a new hash object for algorithm."""
+	constructor = _CONSTRUCTORS.get(algorithm)
+	return new_hash(algorithm) if constructor is None else constructor()
+
+def check_algorithms(algorithms):
+	"""Returns algorithms as a list without duplicates, keeping their order.
+	None stands for DEFAULT_ALGORITHMS. A ValueError is raised for an unknown
+	algorithm."""
+	if algorithms is None:
+		return list(DEFAULT_ALGORITHMS)
+	if isinstance(algorithms, str):
+		algorithms = [algorithms]
+	result = []
+	for algorithm in algorithms:
+		if algorithm not in _AVAILABLE:
+			raise ValueError('Unknown checksum algorithm: %s' % algorithm)
+		if algorithm not in result:
+			result.append(algorithm)
+	return result
+
+def required_by(*consumers):
+	"""Returns the algorithms needed by all consumers (eg: a
+	jsnoop.plugins.victims.LocalDatabase), each declaring them in its
+	required_checksums attribute."""
+	return check_algorithms([algorithm for consumer in consumers
+							for algorithm in consumer.required_checksums])
+
+class MultiDigest():
+	"""Streaming digest engine. Bytes pushed into update() are fed to all the
+	requested algorithms. Handlers and archive extraction can push data as it
+	becomes available instead of re-reading the source once per algorithm."""
+	def __init__(self, algorithms):
+		self.algorithms = list(algorithms)
+		self.__digests = [new_digest(algorithm) for algorithm
+						in self.algorithms]
+		self.__updaters = [digest.update for digest in self.__digests]
+		self.size = 0
+
+	def update(self, data):
+		"""Feeds data (any bytes-like-object) to all digests."""
+		for update in self.__updaters:
+			update(data)
+		self.size += len(data)
+
+	def digests(self):
+		"""Returns a dict mapping each algorithm to its raw digest."""
+		return {algorithm: digest.digest() for algorithm, digest
+				in zip(self.algorithms, self.__digests)}
+
+	def hexdigests(self):
+		"""Returns a dict mapping each algorithm to its hex digest."""
+		return {algorithm: digest.hexdigest() for algorithm, digest
+				in zip(self.algorithms, self.__digests)}
+
+def update_from_fileobj(multidigest, fileobj, bufsize=BUFFER_SIZE):
+	"""Feeds the complete contents of fileobj to multidigest. In-memory buffers
+	(and memory mappings) are digested without copying, everything else is read
+	in chunks into a single reusable buffer. The file position is reset to 0 on
+	return."""
+	fileobj.seek(0)
+	getbuffer = getattr(fileobj, 'getbuffer', None)
+	if getbuffer is not None:
+		with getbuffer() as view:
+			# Chunks are fed to all digests in turn, so each is read from
+			# memory (or for a mapping, from disk) once
+			for offset in range(0, view.nbytes, bufsize):
+				with view[offset:offset + bufsize] as chunk:
+					multidigest.update(chunk)
+	else:
+		buf = bytearray(bufsize)
+		view = memoryview(buf)
+		readinto = getattr(fileobj, 'readinto', None)
+		while True:
+			if readinto is not None:
+				count = readinto(buf)
+				chunk = view[:count]
+			else:
+				chunk = fileobj.read(bufsize)
+				count = len(chunk)
+			if not count:
+				break
+			multidigest.update(chunk)
+		view.release()
+	fileobj.seek(0)
+	return multidigest
+
+def digest(fileinput, algorithms, bufsize=BUFFER_SIZE):
+	"""Computes all algorithms over fileinput in a single pass and returns the
+	MultiDigest. The input can either be a path to a file or a
+	file-like-object."""
+	multidigest = MultiDigest(algorithms)
+	if isinstance(fileinput, str):
+		with open(fileinput, 'rb', buffering=0) as f:
+			update_from_fileobj(multidigest, f, bufsize)
+	else:
+		update_from_fileobj(multidigest, fileinput, bufsize)
+	return multidigest
+
+def hexdigests(fileinput, algorithms, bufsize=BUFFER_SIZE):
+	"""Same as digest() but returns a dict mapping each algorithm to its hex
+	digest."""
+	return digest(fileinput, algorithms, bufsize).hexdigests()
@@ -0,0 +1,356 @@
+import hashlib
+import json
+import sqlite3
+from os import getpid
+from threading import Lock
+from time import time
+
+RESULT_CACHE = 'jsnoop.cache'
+# Default upper bound for the sum of all cached entries, in bytes
+RESULT_CACHE_SIZE = 1024 * 1024 * 1024
+# Number of access times buffered before they are written
+ACCESS_BATCH = 256
+
+# Key of the JSON object standing for a tuple, records hold some (eg: versions)
+_TUPLE = '__tuple__'
+
+def _tag_tuples(value):
+	"""Returns value with its tuples replaced by tagged JSON objects."""
+	if isinstance(value, tuple):
+		return {_TUPLE: [_tag_tuples(item) for item in value]}
+	if isinstance(value, list):
+		return [_tag_tuples(item) for item in value]
+	if isinstance(value, dict):
+		return {key: _tag_tuples(item) for key, item in value.items()}
+	return value
+
+def _untag_tuple(value):
+	if len(value) == 1 and _TUPLE in value:
+		return tuple(value[_TUPLE])
+	return value
+
+class ResultCache():
+	"""
+	Persistent, content addressed cache of processing results. Entries are
+	keyed by the sha512 of an archive and hold the info records of everything
+	contained in it, stored as JSON. When the total size of the stored entries
+	exceeds max_size the least recently used entries are evicted.
+
+	The total size is kept up to date on every change, rather than summed up.
+	Access times are buffered and written along with the next put(), or once
+	ACCESS_BATCH of them are pending, so that reads do not write.
+
+	The cache can be shared by threads and handed to worker processes; each
+	process opens its own connection to the underlying SQLite database, which
+	is in WAL mode so that readers and the writer do not block each other.
+	"""
+	def __init__(self, path=RESULT_CACHE, max_size=RESULT_CACHE_SIZE):
+		self.path = path
+		self.max_size = max_size
+		self.__lock = Lock()
+		self.__connection = None
+		self.__pid = None
+		self.__accessed = {}
+
+	def __getstate__(self):
+		return {'path': self.path, 'max_size': self.max_size}
+
+	def __setstate__(self, state):
+		self.__init__(state['path'], state['max_size'])
+
+	@property
+	def connection(self):
+		if self.__connection is None or self.__pid != getpid():
+			connection = sqlite3.connect(self.path, timeout=60,
+										check_same_thread=False)
+			connection.execute('PRAGMA journal_mode=WAL')
+			with connection:
+				connection.execute('CREATE TABLE IF NOT EXISTS results ('
+						'sha512 TEXT PRIMARY KEY, records TEXT NOT NULL, '
+						'size INTEGER NOT NULL, accessed REAL NOT NULL)')
+				connection.execute('CREATE INDEX IF NOT EXISTS results_lru '
+						'ON results (accessed)')
+				# A single row holding the sum of all sizes
+				connection.execute('CREATE TABLE IF NOT EXISTS usage ('
+						'total INTEGER NOT NULL)')
+				connection.execute('INSERT INTO usage (total) '
+						'SELECT COALESCE(SUM(size), 0) FROM results '
+						'WHERE NOT EXISTS (SELECT 1 FROM usage)')
+			self.__connection = connection
+			self.__pid = getpid()
+			self.__accessed = {}
+		return self.__connection
+
+	def __contains__(self, sha512):
+		with self.__lock:
+			row = self.connection.execute(
+					'SELECT 1 FROM results WHERE sha512 = ?',
+					(sha512,)).fetchone()
+		return row is not None
+
+	def get(self, sha512):
+		"""Returns the cached records for sha512 or None if there are none."""
+		with self.__lock:
+			connection = self.connection
+			row = connection.execute(
+					'SELECT records FROM results WHERE sha512 = ?',
+					(sha512,)).fetchone()
+			if row is None:
+				return None
+			self.__accessed[sha512] = time()
+			if len(self.__accessed) >= ACCESS_BATCH:
+				with connection:
+					self.__flush(connection)
+		try:
+			return json.loads(row[0], object_hook=_untag_tuple)
+		except ValueError:
+			# Not written by this version, it is replaced on the next put()
+			return None
+
+	def put(self, sha512, records):
+		"""Stores records under sha512 and evicts old entries if required."""
+		data = json.dumps(_tag_tuples(records), separators=(',', ':'))
+		size = len(data.encode('utf-8'))
+		if size > self.max_size:
+			return
+		with self.__lock, self.connection as connection:
+			self.__flush(connection)
+			row = connection.execute('SELECT size FROM results '
+					'WHERE sha512 = ?', (sha512,)).fetchone()
+			connection.execute('INSERT OR REPLACE INTO results '
+					'(sha512, records, size, accessed) VALUES (?, ?, ?, ?)',
+					(sha512, data, size, time()))
+			connection.execute('UPDATE usage SET total = total + ?',
+					(size - (row[0] if row is not None else 0),))
+			self.__evict(connection)
+
+	def __flush(self, connection):
+		"""Writes the buffered access times."""
+		if self.__accessed:
+			connection.executemany('UPDATE results SET accessed = ? '
+					'WHERE sha512 = ?', [(accessed, sha512) for sha512, accessed
+					in self.__accessed.items()])
+			self.__accessed = {}
+
+	def __evict(self, connection):
+		total = connection.execute('SELECT total FROM usage').fetchone()[0]
+		if total <= self.max_size:
+			return
+		rows = connection.execute(
+				'SELECT sha512, size FROM results ORDER BY accessed')
+		evicted = []
+		excess = total - self.max_size
+		for sha512, size in rows:
+			if excess <= 0:
+				break
+			evicted.append((sha512,))
+			excess -= size
+		connection.executemany('DELETE FROM results WHERE sha512 = ?', evicted)
+		connection.execute('UPDATE usage SET total = ?',
+				(self.max_size + excess,))
+
+	def clear(self):
+		with self.__lock, self.connection as connection:
+			connection.execute('DELETE FROM results')
+			connection.execute('UPDATE usage SET total = 0')
+			self.__accessed = {}
+
+	def close(self):
+		with self.__lock:
+			if self.__connection is not None and self.__pid == getpid():
+				with self.__connection as connection:
+					self.__flush(connection)
+				self.__connection.close()
+			self.__connection = None
+
+DOCUMENT_CACHE = 'jsnoop.documents'
+# Default upper bound for the sum of all cached documents, in bytes
+DOCUMENT_CACHE_SIZE = 256 * 1024 * 1024
+# Seconds after which volatile documents (eg: snapshots) are fetched again
+VOLATILE_TTL = 24 * 60 * 60
+# Seconds after which a document that was not found is looked up again
+MISSING_TTL = 60 * 60
+
+class DocumentCache():
+	"""
+	Persistent, content addressed cache of fetched documents (eg: POM files,
+	repository metadata and checksums). Documents are stored once per sha1 of
+	their content and referenced by any number of keys (eg: their URL and the
+	artifact they describe). A key can also be recorded as missing, so that
+	documents which do not exist are not looked up again either.
+
+	Documents are kept until evicted, least recently used first, once the total
+	size exceeds max_size. Keys stored as volatile expire after volatile_ttl
+	seconds, missing keys after missing_ttl seconds.
+
+	Like the ResultCache, this can be shared by threads and worker processes,
+	keeps a running total of the size and buffers access times.
+	"""
+	def __init__(self, path=DOCUMENT_CACHE, max_size=DOCUMENT_CACHE_SIZE,
+				volatile_ttl=VOLATILE_TTL, missing_ttl=MISSING_TTL):
+		self.path = path
+		self.max_size = max_size
+		self.volatile_ttl = volatile_ttl
+		self.missing_ttl = missing_ttl
+		self.__lock = Lock()
+		self.__connection = None
+		self.__pid = None
+		self.__accessed = {}
+
+	def __getstate__(self):
+		return {'path': self.path, 'max_size': self.max_size,
+				'volatile_ttl': self.volatile_ttl,
+				'missing_ttl': self.missing_ttl}
+
+	def __setstate__(self, state):
+		self.__init__(**state)
+
+	@property
+	def connection(self):
+		if self.__connection is None or self.__pid != getpid():
+			connection = sqlite3.connect(self.path, timeout=60,
+										check_same_thread=False)
+			connection.execute('PRAGMA journal_mode=WAL')
+			with connection:
+				connection.execute('CREATE TABLE IF NOT EXISTS documents ('
+						'sha1 TEXT PRIMARY KEY, data BLOB NOT NULL, '
+						'size INTEGER NOT NULL)')
+				# A NULL sha1 records a missing document
+				connection.execute('CREATE TABLE IF NOT EXISTS keys ('
+						'key TEXT PRIMARY KEY, sha1 TEXT, '
+						'volatile INTEGER NOT NULL, fetched REAL NOT NULL, '
+						'accessed REAL NOT NULL)')
+				connection.execute('CREATE INDEX IF NOT EXISTS keys_lru '
+						'ON keys (accessed)')
+				connection.execute('CREATE INDEX IF NOT EXISTS keys_sha1 '
+						'ON keys (sha1)')
+				# A single row holding the sum of all document sizes
+				connection.execute('CREATE TABLE IF NOT EXISTS usage ('
+						'total INTEGER NOT NULL)')
+				connection.execute('INSERT INTO usage (total) '
+						'SELECT COALESCE(SUM(size), 0) FROM documents '
+						'WHERE NOT EXISTS (SELECT 1 FROM usage)')
+			self.__connection = connection
+			self.__pid = getpid()
+			self.__accessed = {}
+		return self.__connection
+
+	def __lookup(self, connection, key):
+		"""Returns the (sha1,) row of a key that has not expired, or None."""
+		row = connection.execute('SELECT sha1, volatile, fetched FROM keys '
+				'WHERE key = ?', (key,)).fetchone()
+		if row is None:
+			return None
+		sha1, volatile, fetched = row
+		if sha1 is None:
+			ttl = self.missing_ttl
+		elif volatile:
+			ttl = self.volatile_ttl
+		else:
+			ttl = None
+		if ttl is not None and fetched + ttl < time():
+			return None
+		return (sha1,)
+
+	def __contains__(self, key):
+		"""Returns True if key is cached, either as a document or missing."""
+		with self.__lock:
+			return self.__lookup(self.connection, key) is not None
+
+	def is_missing(self, key):
+		"""Returns True if key is cached as missing."""
+		with self.__lock:
+			row = self.__lookup(self.connection, key)
+		return row is not None and row[0] is None
+
+	def get(self, key):
+		"""Returns the cached document of key as bytes, None if there is
+		none."""
+		with self.__lock:
+			connection = self.connection
+			row = self.__lookup(connection, key)
+			if row is None or row[0] is None:
+				return None
+			data = connection.execute('SELECT data FROM documents '
+					'WHERE sha1 = ?', row).fetchone()
+			if data is None:
+				return None
+			self.__accessed[key] = time()
+			if len(self.__accessed) >= ACCESS_BATCH:
+				with connection:
+					self.__flush(connection)
+		return data[0]
+
+	def put(self, key, data, volatile=False):
+		"""Stores data (bytes or str) under key and evicts old documents if
+		required."""
+		if isinstance(data, str):
+			data = data.encode('utf-8')
+		if len(data) > self.max_size:
+			return
+		sha1 = hashlib.sha1(data).hexdigest()
+		now = time()
+		with self.__lock, self.connection as connection:
+			self.__flush(connection)
+			if connection.execute('INSERT OR IGNORE INTO documents '
+					'(sha1, data, size) VALUES (?, ?, ?)',
+					(sha1, data, len(data))).rowcount:
+				connection.execute('UPDATE usage SET total = total + ?',
+						(len(data),))
+			connection.execute('INSERT OR REPLACE INTO keys (key, sha1, '
+					'volatile, fetched, accessed) VALUES (?, ?, ?, ?, ?)',
+					(key, sha1, int(volatile), now, now))
+			self.__evict(connection)
+
+	def put_missing(self, key):
+		"""Records that there is no document for key."""
+		now = time()
+		with self.__lock, self.connection as connection:
+			connection.execute('INSERT OR REPLACE INTO keys (key, sha1, '
+					'volatile, fetched, accessed) VALUES (?, NULL, 0, ?, ?)',
+					(key, now, now))
+
+	def __flush(self, connection):
+		"""Writes the buffered access times."""
+		if self.__accessed:
+			connection.executemany('UPDATE keys SET accessed = ? '
+					'WHERE key = ?', [(accessed, key) for key, accessed
+					in self.__accessed.items()])
+			self.__accessed = {}
+
+	def __evict(self, connection):
+		total = connection.execute('SELECT total FROM usage').fetchone()[0]
+		if total <= self.max_size:
+			return
+		# Documents in the order their most recently used key was accessed,
+		# those no longer referenced by any key first
+		rows = connection.execute('SELECT documents.sha1, size '
+				'FROM documents LEFT JOIN keys ON keys.sha1 = documents.sha1 '
+				'GROUP BY documents.sha1 '
+				'ORDER BY COALESCE(MAX(keys.accessed), 0)')
+		evicted = []
+		excess = total - self.max_size
+		for sha1, size in rows.fetchall():
+			if excess <= 0:
+				break
+			evicted.append((sha1,))
+			excess -= size
+		connection.executemany('DELETE FROM keys WHERE sha1 = ?', evicted)
+		connection.executemany('DELETE FROM documents WHERE sha1 = ?', evicted)
+		connection.execute('UPDATE usage SET total = ?',
+				(self.max_size + excess,))
+
+	def clear(self):
+		with self.__lock, self.connection as connection:
+			connection.execute('DELETE FROM keys')
+			connection.execute('DELETE FROM documents')
+			connection.execute('UPDATE usage SET total = 0')
+			self.__accessed = {}
+
+	def close(self):
+		with self.__lock:
+			if self.__connection is not None and self.__pid == getpid():
+				with self.__connection as connection:
+					self.__flush(connection)
+				self.__connection.close()
+			self.__connection = None
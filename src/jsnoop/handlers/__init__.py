@@ -1,10 +1,12 @@
-from os import makedirs
-from os.path import sep, exists, isfile, splitext, basename, join, dirname
-from pyrus.checksum import hexdigest
+from os.path import sep, exists, isfile, splitext, basename, dirname
+from jsnoop import instrumentation, scratch
+from jsnoop.checksum import digest, DEFAULT_ALGORITHMS
+from jsnoop.record import FileRecord
 from abc import abstractproperty, ABCMeta
-from tempfile import mkdtemp
+from time import perf_counter
 
-required_checksums = ['md5', 'sha1', 'sha256', 'sha512']
+# Checksums computed by handlers unless they are given others
+required_checksums = DEFAULT_ALGORITHMS
 
 def import_module(fqn):
 	"""Helper method for dynamic import of modules based on full qualified name.
@@ -36,6 +38,7 @@ __MODULES = {
 	'.mf'	: 'manifest',
 	'.rsa'	: 'signature',
 	'.dsa'	: 'signature',
+	'.ec'	: 'signature',
 	'.class': 'javaclass',
 	'.zip'	: 'archivefile',
 	'.gz'	: 'archivefile',
@@ -44,9 +47,18 @@ __MODULES = {
 	'.jar'	: 'archivefile',
 	'.war'	: 'archivefile',
 	'.sar'	: 'archivefile',
-	'.war'	: 'archivefile'
+	'.ear'	: 'archivefile',
+	'.aar'	: 'archivefile',
+	'.apk'	: 'archivefile',
+	'.hpi'	: 'archivefile',
+	'.jpi'	: 'archivefile',
+	'.kar'	: 'archivefile',
+	'.nar'	: 'archivefile'
 }
 
+# Handler modules processed when not all files of an archive are
+__SELECTED_MODULES = ['archivefile', 'manifest', 'signature']
+
 def get_known_extensions():
 	"""Returns a list of extensions that the package knows about."""
 	return list(__MODULES.keys())
@@ -79,6 +91,24 @@ def is_ignored_extension(ext):
 	"""Returns true if the given extension is being ignored."""
 	return ext.lower() in __IGNORED_EXTENSIONS
 
+def is_known_extension(ext):
+	"""Returns true if the given extension is mapped to a handler."""
+	return ext.lower() in __MODULES
+
+def is_selected(filename, classes=False, fileobj=None):
+	"""Returns true if filename is to be handled when only selected files are
+	processed, ie: nested archives, manifests, signatures and, if classes is
+	True, class files. The decision is made on the extension, so no data has to
+	be read, unless the extension is unknown and fileobj is given. The magic
+	bytes of fileobj decide then, eg: for archives named .par or .har."""
+	extension = splitext(filename)[-1].lower()
+	if is_ignored_extension(extension):
+		return False
+	module = __MODULES.get(extension)
+	if module is None and fileobj is not None:
+		module = sniff_module(read_header(filename, fileobj))
+	return module in __SELECTED_MODULES or (classes and module == 'javaclass')
+
 # Dictionary to cache loaded clases, saves work for repeated loads
 __LOADED = {}
 
@@ -107,22 +137,87 @@ def get_handler(filename):
 		module = __DEFAULT_MODULE
 	return __handler_class(module)
 
-def get_handler_obj(filepath, fileobj=None, parent_path='', parent_sha512=None):
+# Magic bytes identifying handler modules by content, as (offset, magic, module)
+__MAGIC = [
+	(0, b'PK\x03\x04', 'archivefile'),			# zip, jar, war, ear ...
+	(0, b'PK\x05\x06', 'archivefile'),			# empty zip
+	(0, b'\x1f\x8b', 'archivefile'),			# gzip
+	(0, b'BZh', 'archivefile'),					# bzip2
+	(257, b'ustar', 'archivefile'),				# tar
+	(0, b'\xca\xfe\xba\xbe', 'javaclass'),		# java class
+]
+
+# Range of plausible class file major versions. Mach-O universal binaries
+# (eg: .jnilib and .dylib files bundled in jars) share the class file magic, in
+# their place they hold a small count of architectures.
+__CLASS_VERSIONS = range(45, 100)
+
+# Number of leading bytes needed to check all magic bytes
+__HEADER_SIZE = max(offset + len(magic) for offset, magic, _ in __MAGIC)
+
+def read_header(filepath, fileobj=None, size=__HEADER_SIZE):
+	"""Returns the first size bytes of the file. The position of fileobj is left
+	at 0."""
+	if fileobj is None:
+		with open(filepath, 'rb') as f:
+			return f.read(size)
+	fileobj.seek(0)
+	header = fileobj.read(size)
+	fileobj.seek(0)
+	return header
+
+def sniff_module(header):
+	"""Returns the handler module matching the magic bytes in header, or None if
+	the content is not recognised. DER encoded sequences (signature blocks and
+	certificates) are recognised by their long form length."""
+	for offset, magic, module in __MAGIC:
+		if header[offset:offset + len(magic)] == magic:
+			if module == 'javaclass' and \
+					int.from_bytes(header[6:8], 'big') not in __CLASS_VERSIONS:
+				continue
+			return module
+	if len(header) > 1 and header[0] == 0x30 and 0x81 <= header[1] <= 0x84:
+		return 'signature'
+	return None
+
+def get_handler_obj(filepath, fileobj=None, parent_path='', parent_sha512=None,
+				checksums=None):
 	"""Method to create an instance of the correct handler class based on
-	filepath. We first would try to unpack it using brute force, if not possible
-	find the next best handler by extracting the file extension."""
+	filepath. The handler is picked by the magic bytes in the file header, and
+	only if the content is not recognised by the file extension. Content that
+	looks like an archive but cannot be opened as one is handled by extension
+	as well. checksums is the list of digest algorithms to compute, see
+	AbstractFile."""
+	module = sniff_module(read_header(filepath, fileobj))
+	if module == 'archivefile':
+		try:
+			# we want to go as deep as possible, ignored extensions included
+			return __handler_class(module)(filepath, fileobj, parent_path,
+										parent_sha512, checksums)
+		except ValueError:
+			module = None
+	extension = splitext(filepath)[-1].lower()
+	if module is None or is_ignored_extension(extension):
+		handler = get_handler(filepath)
+	else:
+		handler = __handler_class(module)
 	try:
-		# force try handling as an archive (we want to go as deep as possible)
-		handler = __handler_class('archivefile')(filepath, fileobj,
-							parent_path, parent_sha512)
+		return handler(filepath, fileobj, parent_path, parent_sha512,
+					checksums)
 	except ValueError:
-		handler = get_handler(filepath)
-		handler = handler(filepath, fileobj, parent_path, parent_sha512)
-	return handler
+		# Named like an archive, but it is not one
+		return __handler_class(__DEFAULT_MODULE)(filepath, fileobj,
+										parent_path, parent_sha512, checksums)
 
 class AbstractFile(metaclass=ABCMeta):
+	"""Base class of the handlers. Only the digests listed in checksums
+	(required_checksums if None) are computed, see jsnoop.checksum for the
+	algorithms available. Archives always compute sha512 in addition."""
 	def __init__(self, filepath, fileobj=None, parent_path='',
-				parent_sha512=None):
+				parent_sha512=None, checksums=None):
+		start = perf_counter() if instrumentation.sink is not None else None
+		self.algorithms = required_checksums if checksums is None \
+				else checksums
 		self.filepath = filepath
 		self.fileobj = fileobj
 		self.path = dirname(filepath.replace(parent_path, '').lstrip(sep))
@@ -132,11 +227,18 @@ class AbstractFile(metaclass=ABCMeta):
 		self.persist()
 		# Use filebytes given, as this maybe in memory processing
 		self.prepare_checksums()
+		if start is not None:
+			self.measure('init-seconds', perf_counter() - start)
 
 	@abstractproperty
 	def inmemory(self):
 		return True
 
+	def measure(self, metric, value):
+		"""Reports a measurement for this file to the instrumentation sink."""
+		instrumentation.record(self.__class__.__name__, self.type, metric,
+							value)
+
 	@property
 	def filepath(self):
 		if self.__ondisk is None:
@@ -149,26 +251,32 @@ class AbstractFile(metaclass=ABCMeta):
 		self.__filepath = value
 
 	def persist(self):
+		"""Makes sure handlers that are not in-memory have a file on disk. A
+		fileobj that is already backed by a file is used as is, anything else
+		is written to the current scratch space (see jsnoop.scratch)."""
 		# We use a separate internal property to handle deletion when the
 		# filepath is actually valid
 		self.__ondisk = None
+		self.__scratch = None
 		if self.fileobj is not None and not self.inmemory:
-			temp_dir = mkdtemp(prefix='jsnoop.file.persist.')
-			temp_file = join(temp_dir, self.filepath)
-			makedirs(dirname(temp_file))
-			self.fileobj.seek(0)
-			with open(temp_file, 'wb') as f:
-				f.write(self.fileobj.read())
-				self.fileobj.seek(0)
-			self.__ondisk = temp_file
-
-	def __del__(self):
-		try:
-			if self.__ondisk:
-				from shutil import rmtree
-				rmtree(self.__ondisk.replace(self.__filepath, ''))
-		except:
-			pass
+			name = getattr(self.fileobj, 'name', None)
+			if isinstance(name, str) and isfile(name):
+				self.__ondisk = name
+				return
+			start = perf_counter()
+			self.__scratch = scratch.current()
+			self.__ondisk = self.__scratch.persist(self.__filepath,
+												self.fileobj)
+			if instrumentation.sink is not None:
+				self.measure('persist-seconds', perf_counter() - start)
+				self.measure('temp-files', 1)
+
+	def close(self):
+		"""Releases the scratch file created by persist(), if any."""
+		if self.__scratch is not None:
+			self.__scratch.release(self.__ondisk)
+			self.__scratch = None
+			self.__ondisk = None
 
 	def prepare_checksums(self):
 		if not self.fileobj:
@@ -177,9 +285,28 @@ class AbstractFile(metaclass=ABCMeta):
 			fileinput = self.filepath
 		else:
 			fileinput = self.fileobj
-		self.checksums = {}
-		for algorithm in required_checksums:
-			self.checksums[algorithm] = hexdigest(fileinput, algorithm)
+		if not self.algorithms:
+			self.digests = {}
+			return
+		start = perf_counter()
+		# All digests are computed in a single pass over the input
+		multidigest = digest(fileinput, self.algorithms)
+		# Kept raw, hex digests are only produced for info()
+		self.digests = multidigest.digests()
+		if instrumentation.sink is not None:
+			self.measure('checksum-seconds', perf_counter() - start)
+			self.measure('bytes-hashed', multidigest.size)
+
+	@property
+	def checksums(self):
+		"""Returns a dict mapping each algorithm to its hex digest."""
+		return {key: value.hex() for key, value in self.digests.items()}
+
+	def details(self):
+		"""Returns a dict of the handler specific information, if any. Handlers
+		extend this rather than info(), so it is shared by info() and
+		record()."""
+		return None
 
 	def info(self):
 		fileinfo = {}
@@ -188,6 +315,14 @@ class AbstractFile(metaclass=ABCMeta):
 		fileinfo['type'] = self.type
 		fileinfo['parent'] = self.parent
 		fileinfo['handler'] = self.__class__.__name__
-		for key in self.checksums:
-			fileinfo[key] = self.checksums[key]
+		for key, value in self.digests.items():
+			fileinfo[key] = value.hex()
+		fileinfo.update(self.details() or {})
 		return fileinfo
+
+	def record(self, table):
+		"""Returns the compact FileRecord of this file, its parent being added
+		to table, a jsnoop.record.RecordTable."""
+		return FileRecord(self.path, self.name, self.type,
+						table.parent_id(self.parent), self.__class__.__name__,
+						self.digests, self.digests.values(), self.details())
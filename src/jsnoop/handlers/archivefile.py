@@ -1,16 +1,37 @@
-from jsnoop.handlers import AbstractFile
+from io import SEEK_END
+from struct import Struct
+from threading import Lock
+from time import perf_counter
+from zipfile import ZipInfo, ZIP_STORED
+from jsnoop import instrumentation
+from jsnoop.buffer import BufferReader
+from jsnoop.handlers import AbstractFile, required_checksums
 from pyrus.archives import is_archive, make_archive_obj
 
+# Zip local file header, see APPNOTE.TXT section 4.3.7
+_LOCAL_HEADER = Struct('<4s2B4HL2L2H')
+_LOCAL_HEADER_SIGNATURE = b'PK\003\004'
+_LOCAL_HEADER_FILENAME_LENGTH = 10
+_LOCAL_HEADER_EXTRA_LENGTH = 11
+
 class ArchiveFile(AbstractFile):
 	def __init__(self, filepath, fileobj=None, parent_path='',
-				parent_sha512=None):
+				parent_sha512=None, checksums=None):
 		arg = fileobj if fileobj else filepath
 		if not is_archive(arg):
 			# Oops, this was not really an archive
 			raise ValueError
+		# Children and cached records refer to archives by their sha512
+		checksums = list(required_checksums if checksums is None
+						else checksums)
+		if 'sha512' not in checksums:
+			checksums.append('sha512')
 		AbstractFile.__init__(self, filepath, fileobj, parent_path,
-							parent_sha512)
+							parent_sha512, checksums)
 		self.archive = make_archive_obj(filepath, fileobj, True)
+		# Archive objects are stateful (eg: the position of a tar stream),
+		# children extracted by several threads take turns
+		self.__lock = Lock()
 
 	@property
 	def inmemory(self):
@@ -24,23 +45,104 @@ class ArchiveFile(AbstractFile):
 	def get_file_obj(self, member):
 		"""Extracts a file from the archive and returns the corresponding
 		file-like-object. If the member is a directory/link the archives module
-		returns an empty BytesIO object.
+		returns an empty BytesIO object. Stored (uncompressed) zip members of an
+		in-memory archive are served as a view without copying. This can be
+		called by several threads.
+		"""
+		fileobj = self.get_stored_member(member)
+		if fileobj is None:
+			with self.__lock:
+				fileobj = self.archive.extract(member, True)
+		return fileobj
+
+	def get_stored_member(self, member):
+		"""Returns a zero copy BufferReader over the data of a stored zip
+		member if this archive is held in memory. None is returned if this is
+		not possible and the member has to be extracted normally.
 		"""
-		return self.archive.extract(member, True)
+		if not isinstance(member, ZipInfo) or member.compress_type != ZIP_STORED \
+				or member.flag_bits & 0x1 or member.is_dir():
+			return None
+		getbuffer = getattr(self.fileobj, 'getbuffer', None)
+		if getbuffer is None:
+			return None
+		with getbuffer() as buf:
+			offset = member.header_offset
+			if offset + _LOCAL_HEADER.size > buf.nbytes:
+				return None
+			header = _LOCAL_HEADER.unpack_from(buf, offset)
+			if header[0] != _LOCAL_HEADER_SIGNATURE:
+				return None
+			start = offset + _LOCAL_HEADER.size \
+					+ header[_LOCAL_HEADER_FILENAME_LENGTH] \
+					+ header[_LOCAL_HEADER_EXTRA_LENGTH]
+			end = start + member.compress_size
+			if end > buf.nbytes:
+				return None
+			return BufferReader(buf[start:end])
 
 	def get_child_objects(self):
-		children = []
-		for child in self.get_contents():
-			fileobj = self.get_file_obj(child)
-			filename = self.archive.filename_from_info(child)
-			path = self.filepath
-			sha512 = self.checksums['sha512']
-			children.append(ArchiveChild(filename, fileobj, path, sha512))
+		"""Returns a list of lazy ArchiveChild descriptors, one per member. No
+		data is extracted until a child's fileobj is accessed."""
+		start = perf_counter()
+		path = self.filepath
+		sha512 = self.digests['sha512'].hex()
+		children = [ArchiveChild(self, child,
+						self.archive.filename_from_info(child), path, sha512)
+					for child in self.get_contents()]
+		if instrumentation.sink is not None:
+			self.measure('children-seconds', perf_counter() - start)
+			self.measure('members', len(children))
 		return children
 
 class ArchiveChild():
-	def __init__(self, filename, fileobj, parent_path, parent_sha512):
+	"""Describes a member of an archive. The member is extracted on first access
+	of fileobj and the extracted data is dropped again by release()."""
+	def __init__(self, archive, member, filename, parent_path, parent_sha512):
+		self.archive = archive
+		self.member = member
 		self.filename = filename
-		self.fileobj = fileobj
 		self.parent_path = parent_path
 		self.parent_sha512 = parent_sha512
+		self.__fileobj = None
+
+	@property
+	def fileobj(self):
+		if self.__fileobj is None:
+			start = perf_counter()
+			self.__fileobj = self.archive.get_file_obj(self.member)
+			if instrumentation.sink is not None:
+				self.archive.measure('extract-seconds', perf_counter() - start)
+				size = self.__fileobj.seek(0, SEEK_END)
+				self.__fileobj.seek(0)
+				self.archive.measure('bytes-extracted', size)
+		return self.__fileobj
+
+	@fileobj.setter
+	def fileobj(self, value):
+		self.__fileobj = value
+
+	def peek(self):
+		"""Returns a file-like-object of the member's data if that does not
+		require extracting it (eg: stored members of in-memory archives), None
+		otherwise."""
+		if self.__fileobj is not None:
+			return self.__fileobj
+		if self.archive is None:
+			return None
+		return self.archive.get_stored_member(self.member)
+
+	def detach(self):
+		"""Returns a copy of this child that carries the extracted data instead
+		of a reference to the archive. Used when the child has to be shipped to
+		another process."""
+		child = ArchiveChild(None, None, self.filename, self.parent_path,
+							self.parent_sha512)
+		child.fileobj = self.fileobj
+		return child
+
+	def release(self):
+		"""Closes and drops the extracted file-like-object, if any."""
+		if self.__fileobj is not None:
+			self.__fileobj.close()
+		self.__fileobj = None
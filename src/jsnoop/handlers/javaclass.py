@@ -1,10 +1,12 @@
 import struct
+from io import BytesIO
 from os.path import join
+from jsnoop.buffer import BufferReader
 from jsnoop.handlers import AbstractFile
 
 class ClassFile(AbstractFile):
 	def __init__(self, filepath, fileobj=None, parent_path='',
-				parent_sha512=None):
+				parent_sha512=None, checksums=None):
 		if not fileobj:
 			path = join(parent_path, filepath)
 			fileobj = open(path, 'rb')
@@ -13,20 +15,71 @@ class ClassFile(AbstractFile):
 		self.magic = read_magic(fileobj)
 		self.version = read_version(fileobj)
 		AbstractFile.__init__(self, filepath, fileobj, parent_path,
-							parent_sha512)
+							parent_sha512, checksums)
+		self.__structure = None
 
 	@property
 	def inmemory(self):
 		return True
 
-	def info(self):
-		"""Returns the information related to this file, this includes those
-		provided by pyrus.file.AbstractFile.info() and info extracted
-		from the binary class file."""
-		fileinfo = AbstractFile.info(self)
+	@property
+	def structure(self):
+		"""The parsed ClassStructure of this file. Parsing happens on first
+		access only, so this has to be used while the file object is still
+		available."""
+		if self.__structure is None:
+			if isinstance(self.fileobj, BufferReader):
+				data = self.fileobj.getbuffer()
+			elif isinstance(self.fileobj, BytesIO):
+				# Does not copy, unlike a view it does not pin the BytesIO
+				data = self.fileobj.getvalue()
+			else:
+				self.fileobj.seek(0)
+				data = self.fileobj.read()
+				self.fileobj.seek(0)
+			self.__structure = ClassStructure(data)
+		return self.__structure
+
+	@property
+	def this_class(self):
+		return self.structure.this_class
+
+	@property
+	def super_class(self):
+		return self.structure.super_class
+
+	@property
+	def interfaces(self):
+		return self.structure.interfaces
+
+	@property
+	def fields(self):
+		return self.structure.fields
+
+	@property
+	def methods(self):
+		return self.structure.methods
+
+	@property
+	def class_references(self):
+		return self.structure.constant_pool.class_names()
+
+	def details(self):
+		"""Returns the information extracted from the binary class file, it is
+		added to that provided by AbstractFile.info(). The names of the class,
+		its super class and interfaces are left out if the class file cannot
+		be parsed."""
+		fileinfo = {}
 		fileinfo['magic'] = self.magic
 		fileinfo['version-string'] = major_version(self.version[0])
 		fileinfo['version'] = self.version
+		try:
+			structure = self.structure
+		except ValueError:
+			return fileinfo
+		fileinfo['class-name'] = structure.this_class
+		fileinfo['super-class'] = structure.super_class
+		fileinfo['interfaces'] = structure.interfaces
 		return fileinfo
 
 """
@@ -58,3 +111,159 @@ def read_version(f):
 	buf = f.read(struct.calcsize(fmt))
 	minor, major = struct.unpack(fmt, buf)
 	return (major, minor)
+
+"""
+Class file parser, see chapter 4 of the Java Virtual Machine Specification.
+Everything is read with struct.unpack_from straight out of a single buffer.
+"""
+_U2 = struct.Struct('>H')
+_MEMBER = struct.Struct('>HHHH')
+_ATTRIBUTE = struct.Struct('>HI')
+_CLASS_HEADER = struct.Struct('>HHHH')
+
+CONSTANT_UTF8 = 1
+CONSTANT_CLASS = 7
+CONSTANT_NAME_AND_TYPE = 12
+
+_CONSTANT_NAMES = {
+	CONSTANT_UTF8	: 'Utf8',
+	CONSTANT_CLASS	: 'Class'
+}
+
+# Size of each constant pool entry, excluding the tag byte (Utf8 is variable)
+_CONSTANT_SIZES = {
+	3	: 4,	# Integer
+	4	: 4,	# Float
+	5	: 8,	# Long
+	6	: 8,	# Double
+	7	: 2,	# Class
+	8	: 2,	# String
+	9	: 4,	# Fieldref
+	10	: 4,	# Methodref
+	11	: 4,	# InterfaceMethodref
+	12	: 4,	# NameAndType
+	15	: 3,	# MethodHandle
+	16	: 2,	# MethodType
+	17	: 4,	# Dynamic
+	18	: 4,	# InvokeDynamic
+	19	: 2,	# Module
+	20	: 2,	# Package
+}
+
+def decode_modified_utf8(data):
+	"""Decodes the modified UTF-8 used by class files. Only NUL and
+	supplementary characters differ from standard UTF-8."""
+	data = bytes(data)
+	try:
+		return data.decode('utf-8')
+	except UnicodeDecodeError:
+		data = data.replace(b'\xc0\x80', b'\x00')
+		return data.decode('utf-8', 'surrogatepass').encode('utf-16', \
+					'surrogatepass').decode('utf-16', 'replace')
+
+class ConstantPool():
+	"""Constant pool of a class file. Construction only records where each
+	entry starts, entries are decoded when first asked for."""
+	def __init__(self, data, offset):
+		self.data = data
+		count = _U2.unpack_from(data, offset)[0]
+		self.__offsets = [None] * count
+		self.__strings = {}
+		position = offset + 2
+		index = 1
+		while index < count:
+			tag = data[position]
+			self.__offsets[index] = position
+			if tag == CONSTANT_UTF8:
+				position += 3 + _U2.unpack_from(data, position + 1)[0]
+			elif tag in _CONSTANT_SIZES:
+				position += 1 + _CONSTANT_SIZES[tag]
+			else:
+				raise ValueError('Unknown constant pool tag %d at %d' %
+								(tag, position))
+			# Long and Double take up two slots
+			index += 2 if tag in (5, 6) else 1
+		self.end = position
+
+	def __len__(self):
+		return len(self.__offsets)
+
+	def tag(self, index):
+		offset = self.__offsets[index] if 0 < index < len(self.__offsets) \
+				else None
+		return None if offset is None else self.data[offset]
+
+	def __offset(self, index, tag):
+		"""Returns the offset of the entry at index. Raises ValueError unless
+		there is one and it has the given tag."""
+		if self.tag(index) != tag:
+			raise ValueError('Constant %d is not a %s entry' %
+							(index, _CONSTANT_NAMES[tag]))
+		return self.__offsets[index]
+
+	def utf8(self, index):
+		if index not in self.__strings:
+			offset = self.__offset(index, CONSTANT_UTF8)
+			length = _U2.unpack_from(self.data, offset + 1)[0]
+			self.__strings[index] = decode_modified_utf8(
+					self.data[offset + 3:offset + 3 + length])
+		return self.__strings[index]
+
+	def class_name(self, index):
+		"""Returns the internal name of the Class entry at index, or None for
+		index 0 (eg: the super class of java/lang/Object)."""
+		if index == 0:
+			return None
+		offset = self.__offset(index, CONSTANT_CLASS)
+		return self.utf8(_U2.unpack_from(self.data, offset + 1)[0])
+
+	def class_names(self):
+		"""Returns the names of all classes referenced from this pool."""
+		return [self.class_name(index) for index, offset
+				in enumerate(self.__offsets)
+				if offset is not None and self.data[offset] == CONSTANT_CLASS]
+
+class ClassStructure():
+	"""Decoded structure of a class file: constant pool, this and super class,
+	interfaces, fields and methods. Fields and methods are lists of
+	(access_flags, name, descriptor) tuples. Raises ValueError if data is not
+	a class file, or a truncated or corrupt one."""
+	def __init__(self, data):
+		data = memoryview(data).cast('B') if not isinstance(data, bytes) \
+				else data
+		if bytes(data[:4]) != b'\xca\xfe\xba\xbe':
+			raise ValueError('Not a class file')
+		try:
+			self.__parse(data)
+		except (IndexError, struct.error) as e:
+			raise ValueError('Truncated or corrupt class file: %s' % e)
+
+	def __parse(self, data):
+		self.constant_pool = pool = ConstantPool(data, 8)
+		self.access_flags, this_class, super_class, count = \
+				_CLASS_HEADER.unpack_from(data, pool.end)
+		self.this_class = pool.class_name(this_class)
+		self.super_class = pool.class_name(super_class)
+		position = pool.end + _CLASS_HEADER.size
+		self.interfaces = [pool.class_name(index) for index in
+				struct.unpack_from('>%dH' % count, data, position)]
+		position += 2 * count
+		self.fields, position = self.__read_members(data, position)
+		self.methods, position = self.__read_members(data, position)
+		# The attributes of the class follow, they are skipped
+		_U2.unpack_from(data, position)
+
+	def __read_members(self, data, position):
+		pool = self.constant_pool
+		count = _U2.unpack_from(data, position)[0]
+		position += 2
+		members = []
+		for _ in range(count):
+			access, name, descriptor, attributes = \
+					_MEMBER.unpack_from(data, position)
+			position += _MEMBER.size
+			for _ in range(attributes):
+				position += _ATTRIBUTE.size + \
+						_ATTRIBUTE.unpack_from(data, position)[1]
+			members.append((access, pool.utf8(name), pool.utf8(descriptor)))
+		return members, position
@@ -2,9 +2,9 @@ from jsnoop.handlers import AbstractFile
 
 class ManifestFile(AbstractFile):
 	def __init__(self, filepath, fileobj=None, parent_path='',
-				parent_sha512=None):
+				parent_sha512=None, checksums=None):
 		AbstractFile.__init__(self, filepath, fileobj, parent_path,
-							parent_sha512)
+							parent_sha512, checksums)
 		self.manifestinfo = {}
 		self.parse()
 
@@ -48,9 +48,7 @@ class ManifestFile(AbstractFile):
 					header = line[:first_colon].strip()
 					value = line[first_colon + 1:].strip()
 
-	def info(self):
-		"""Returns the information related to this file, this includes those
-		provided by pyrus.file.AbstractFile.info() and the manifest headers."""
-		fileinfo = AbstractFile.info(self)
-		fileinfo['manifest-info'] = self.manifestinfo
-		return fileinfo
+	def details(self):
+		"""Returns the manifest headers, they are added to the information
+		provided by AbstractFile.info()."""
+		return {'manifest-info': self.manifestinfo}
@@ -1,35 +1,273 @@
-from subprocess import getstatusoutput
+"""
+Minimal DER decoder, just enough of ASN.1 to walk PKCS#7 SignedData (RFC 2315)
+and X.509 certificates (RFC 5280) held in memory. The BER indefinite length
+form is understood as well, some signing tools use it for the outer
+structures of a signature block.
+"""
+from base64 import b64decode
+from binascii import Error as BinasciiError
 from jsnoop.handlers import AbstractFile
 
-handled_signers = ['.rsa', '.dsa']
-
-def decode_signer(filepath):
-	"""Decodes the signer from the file at filepath"""
-	# TODO: Figure out a pythonic way of doing this efficiently and to handle
-	# inmemory stuff
-	commands = [
-			'openssl pkcs7 -inform DER -in %s -noout -print_certs -text',
-			'openssl x509 -in %s -noout -text'
-			]
-	for cmd in commands:
-		(status, output) = getstatusoutput(cmd % (filepath))
-		if status == 0:
-			break
-	return output
+handled_signers = ['.rsa', '.dsa', '.ec']
+
+# Universal tags we care about
+_INTEGER = 0x02
+_BIT_STRING = 0x03
+_OCTET_STRING = 0x04
+_OID = 0x06
+_SEQUENCE = 0x30
+_SET = 0x31
+_UTC_TIME = 0x17
+_GENERALIZED_TIME = 0x18
+_CONTEXT_0 = 0xa0
+_CONTEXT_1 = 0xa1
+
+_STRING_ENCODINGS = {
+	0x0c : 'utf-8',		# UTF8String
+	0x12 : 'ascii',		# NumericString
+	0x13 : 'ascii',		# PrintableString
+	0x14 : 'latin-1',	# T61String
+	0x16 : 'ascii',		# IA5String
+	0x1a : 'ascii',		# VisibleString
+	0x1c : 'utf-32-be',	# UniversalString
+	0x1e : 'utf-16-be',	# BMPString
+}
+
+_OID_NAMES = {
+	'1.2.840.113549.1.7.1'	: 'data',
+	'1.2.840.113549.1.7.2'	: 'signedData',
+	'1.2.840.113549.1.1.1'	: 'rsaEncryption',
+	'1.2.840.113549.1.1.4'	: 'md5WithRSAEncryption',
+	'1.2.840.113549.1.1.5'	: 'sha1WithRSAEncryption',
+	'1.2.840.113549.1.1.11'	: 'sha256WithRSAEncryption',
+	'1.2.840.113549.1.1.12'	: 'sha384WithRSAEncryption',
+	'1.2.840.113549.1.1.13'	: 'sha512WithRSAEncryption',
+	'1.2.840.10040.4.1'		: 'dsaEncryption',
+	'1.2.840.10040.4.3'		: 'dsaWithSHA1',
+	'2.16.840.1.101.3.4.3.2': 'dsa_with_SHA256',
+	'1.2.840.10045.2.1'		: 'id-ecPublicKey',
+	'1.2.840.10045.4.3.2'	: 'ecdsa-with-SHA256',
+	'1.2.840.10045.4.3.3'	: 'ecdsa-with-SHA384',
+	'1.2.840.10045.4.3.4'	: 'ecdsa-with-SHA512',
+	'1.2.840.113549.2.5'	: 'md5',
+	'1.3.14.3.2.26'			: 'sha1',
+	'2.16.840.1.101.3.4.2.1': 'sha256',
+	'2.16.840.1.101.3.4.2.2': 'sha384',
+	'2.16.840.1.101.3.4.2.3': 'sha512',
+	'2.5.4.3'				: 'CN',
+	'2.5.4.5'				: 'serialNumber',
+	'2.5.4.6'				: 'C',
+	'2.5.4.7'				: 'L',
+	'2.5.4.8'				: 'ST',
+	'2.5.4.9'				: 'street',
+	'2.5.4.10'				: 'O',
+	'2.5.4.11'				: 'OU',
+	'2.5.4.12'				: 'title',
+	'0.9.2342.19200300.100.1.25': 'DC',
+	'1.2.840.113549.1.9.1'	: 'emailAddress',
+}
+
+def der_read(data, offset=0):
+	"""Reads the DER element starting at offset. Returns a tuple of (tag,
+	content start, content end). Raises ValueError on malformed input."""
+	return der_element(data, offset)[:3]
+
+def der_element(data, offset=0):
+	"""Same as der_read(), with the offset following the element appended.
+	It differs from the content end for indefinite lengths, whose content is
+	followed by the end-of-contents octets."""
+	if offset + 2 > len(data):
+		raise ValueError('Truncated DER element at %d' % offset)
+	tag = data[offset]
+	if tag & 0x1f == 0x1f:
+		raise ValueError('High tag numbers are not supported')
+	length = data[offset + 1]
+	start = offset + 2
+	if length == 0x80:
+		if not tag & 0x20:
+			raise ValueError('Indefinite length of a primitive at %d' % offset)
+		end = start
+		while bytes(data[end:end + 2]) != b'\x00\x00':
+			end = der_element(data, end)[3]
+		return tag, start, end, end + 2
+	if length & 0x80:
+		count = length & 0x7f
+		if count > 4 or start + count > len(data):
+			raise ValueError('Unsupported DER length at %d' % offset)
+		length = int.from_bytes(data[start:start + count], 'big')
+		start += count
+	end = start + length
+	if end > len(data):
+		raise ValueError('Truncated DER element at %d' % offset)
+	return tag, start, end, end
+
+def der_children(data, start, end):
+	"""Returns a list of (tag, start, end) for all elements in the given range of
+	a constructed element."""
+	children = []
+	while start < end:
+		child = der_element(data, start)
+		children.append(child[:3])
+		start = child[3]
+	return children
+
+def der_expect(element, tag):
+	if element[0] != tag:
+		raise ValueError('Expected tag 0x%02x, found 0x%02x' % (tag, element[0]))
+	return element
+
+def der_oid(data, element):
+	_, start, end = der_expect(element, _OID)
+	if start == end:
+		raise ValueError('Empty OID')
+	first = data[start]
+	arcs = [min(first // 40, 2), first - 40 * min(first // 40, 2)]
+	value = 0
+	for byte in data[start + 1:end]:
+		value = (value << 7) | (byte & 0x7f)
+		if not byte & 0x80:
+			arcs.append(value)
+			value = 0
+	oid = '.'.join(str(arc) for arc in arcs)
+	return _OID_NAMES.get(oid, oid)
+
+def der_integer(data, element):
+	_, start, end = der_expect(element, _INTEGER)
+	return int.from_bytes(data[start:end], 'big', signed=True)
+
+def der_string(data, element):
+	tag, start, end = element
+	encoding = _STRING_ENCODINGS.get(tag)
+	if encoding is None:
+		return bytes(data[start:end]).hex()
+	return bytes(data[start:end]).decode(encoding, 'replace')
+
+def der_time(data, element):
+	"""Decodes UTCTime and GeneralizedTime into an ISO 8601 string."""
+	tag, start, end = element
+	value = bytes(data[start:end]).decode('ascii').rstrip('Z')
+	if tag == _UTC_TIME:
+		year = int(value[:2])
+		value = '%d%s' % (2000 + year if year < 50 else 1900 + year, value[2:])
+	elif tag != _GENERALIZED_TIME:
+		raise ValueError('Expected a time, found tag 0x%02x' % tag)
+	value = value.split('.')[0].ljust(14, '0')
+	return '%s-%s-%sT%s:%s:%sZ' % (value[0:4], value[4:6], value[6:8],
+								value[8:10], value[10:12], value[12:14])
+
+def der_algorithm(data, element):
+	_, start, end = der_expect(element, _SEQUENCE)
+	return der_oid(data, der_read(data, start))
+
+def der_name(data, element):
+	"""Decodes an X.501 Name into a 'CN=..., O=...' style string."""
+	_, start, end = der_expect(element, _SEQUENCE)
+	parts = []
+	for rdn in der_children(data, start, end):
+		for attribute in der_children(data, rdn[1], rdn[2]):
+			oid, value = der_children(data, attribute[1], attribute[2])[:2]
+			parts.append('%s=%s' % (der_oid(data, oid), der_string(data, value)))
+	return ', '.join(parts)
+
+def parse_certificate(data, element):
+	"""Returns a dict describing the X.509 certificate element."""
+	_, start, end = der_expect(element, _SEQUENCE)
+	tbs, algorithm = der_children(data, start, end)[:2]
+	fields = der_children(data, tbs[1], tbs[2])
+	version = 1
+	if fields[0][0] == _CONTEXT_0:
+		version = der_integer(data, der_read(data, fields[0][1])) + 1
+		fields = fields[1:]
+	serial, _, issuer, validity, subject, key_info = fields[:6]
+	not_before, not_after = der_children(data, validity[1], validity[2])[:2]
+	key_algorithm = der_children(data, key_info[1], key_info[2])[0]
+	return {
+		'version'				: version,
+		'serial'				: '%x' % der_integer(data, serial),
+		'subject'				: der_name(data, subject),
+		'issuer'				: der_name(data, issuer),
+		'not-before'			: der_time(data, not_before),
+		'not-after'				: der_time(data, not_after),
+		'public-key-algorithm'	: der_algorithm(data, key_algorithm),
+		'signature-algorithm'	: der_algorithm(data, algorithm),
+	}
+
+def parse_signer_info(data, element):
+	"""Returns a dict describing a PKCS#7 SignerInfo element."""
+	_, start, end = der_expect(element, _SEQUENCE)
+	fields = der_children(data, start, end)
+	signer = {}
+	sid = fields[1]
+	if sid[0] == _SEQUENCE:
+		issuer, serial = der_children(data, sid[1], sid[2])[:2]
+		signer['issuer'] = der_name(data, issuer)
+		signer['serial'] = '%x' % der_integer(data, serial)
+	else:
+		signer['subject-key-identifier'] = bytes(data[sid[1]:sid[2]]).hex()
+	signer['digest-algorithm'] = der_algorithm(data, fields[2])
+	# Authenticated attributes are optional and precede the algorithm
+	index = 4 if fields[3][0] == _CONTEXT_0 else 3
+	signer['signature-algorithm'] = der_algorithm(data, fields[index])
+	return signer
+
+def parse_pkcs7(data, element):
+	"""Returns a dict with the certificates and signers of a PKCS#7 SignedData
+	ContentInfo element."""
+	_, start, end = der_expect(element, _SEQUENCE)
+	content_type, content = der_children(data, start, end)[:2]
+	if der_oid(data, content_type) != 'signedData':
+		raise ValueError('Not a PKCS#7 SignedData structure')
+	signed_data = der_expect(der_read(data, content[1]), _SEQUENCE)
+	certificates, signers = [], []
+	for field in der_children(data, signed_data[1], signed_data[2])[3:]:
+		if field[0] == _CONTEXT_0:
+			certificates = [parse_certificate(data, cert) for cert
+							in der_children(data, field[1], field[2])]
+		elif field[0] == _SET:
+			signers = [parse_signer_info(data, signer) for signer
+					in der_children(data, field[1], field[2])]
+	return {'certificates': certificates, 'signers': signers}
+
+def decode_signer(data):
+	"""Decodes the signer from the in-memory bytes of a signature block. Both
+	PKCS#7 SignedData (as found in signed jars) and bare X.509 certificates in
+	DER or PEM encoding are understood. Returns a dict with the keys
+	'certificates' and 'signers' or None if the data could not be decoded."""
+	try:
+		if bytes(data[:11]) == b'-----BEGIN ':
+			lines = bytes(data).decode('ascii').splitlines()
+			data = b64decode(''.join(line for line in lines
+									if not line.startswith('-----')))
+		element = der_read(data)
+		first = der_read(data, element[1])
+		if first[0] == _OID:
+			return parse_pkcs7(data, element)
+		return {'certificates': [parse_certificate(data, element)],
+				'signers': []}
+	except (ValueError, IndexError, UnicodeDecodeError, BinasciiError,
+			RecursionError):
+		return None
 
 class SignatureFile(AbstractFile):
 	def __init__(self, filepath, fileobj=None, parent_path='',
-				parent_sha512=None):
+				parent_sha512=None, checksums=None):
 		AbstractFile.__init__(self, filepath, fileobj, parent_path,
-							parent_sha512)
-		assert self.type in handled_signers
-		self.signature = decode_signer(self.filepath)
+							parent_sha512, checksums)
+		# Content sniffing also routes DER data with other extensions here
+		self.signature = decode_signer(self.read_bytes())
 
 	@property
 	def inmemory(self):
-		return False
+		return True
+
+	def read_bytes(self):
+		if self.fileobj:
+			self.fileobj.seek(0)
+			data = self.fileobj.read()
+			self.fileobj.seek(0)
+			return data
+		with open(self.filepath, 'rb') as f:
+			return f.read()
 
-	def info(self):
-		fileinfo = AbstractFile.info(self)
-		fileinfo['signature'] = self.signature
-		return fileinfo
+	def details(self):
+		return {'signature': self.signature}
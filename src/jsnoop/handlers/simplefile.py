@@ -2,9 +2,9 @@ from jsnoop.handlers import AbstractFile
 
 class SimpleFile(AbstractFile):
 	def __init__(self, filepath, fileobj=None, parent_path='',
-				parent_sha512=None):
+				parent_sha512=None, checksums=None):
 		AbstractFile.__init__(self, filepath, fileobj, parent_path,
-							parent_sha512)
+							parent_sha512, checksums)
 
 	@property
 	def inmemory(self):
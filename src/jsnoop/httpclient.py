@@ -0,0 +1,197 @@
+"""
+HTTP client reusing keep-alive connections. Requests to the same host share a
+bounded pool of persistent connections, so fetching many small documents (eg:
+POM files and checksums from a Maven repository) does not pay for a new TCP
+(and TLS) handshake every time. Requests can be issued concurrently; they are
+run on a thread pool no larger than the connection limit.
+"""
+from collections import deque
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+from multiprocessing.pool import ThreadPool
+from os import getpid
+from threading import Lock, BoundedSemaphore
+from urllib.parse import urljoin, urlsplit
+
+TIMEOUT = 30
+# Upper bound of connections (and of concurrent requests) per host
+MAX_CONNECTIONS = 8
+USER_AGENT = 'jsnoop'
+# Upper bound of redirects followed per request
+MAX_REDIRECTS = 5
+# Statuses of the redirects that are followed
+REDIRECTS = (301, 302, 303, 307, 308)
+
+class HttpError(Exception):
+	"""Raised when a request fails or returns anything but 200 OK. status is
+	None if no response was received."""
+	def __init__(self, url, status=None, reason=None):
+		Exception.__init__(self, '%s: %s' % (url, reason or status))
+		self.url = url
+		self.status = status
+
+class _Host():
+	"""The idle connections to a host and the semaphore bounding their use."""
+	def __init__(self, max_connections):
+		self.idle = deque()
+		self.slots = BoundedSemaphore(max_connections)
+
+class HttpClient():
+	"""
+	Pooled HTTP/1.1 client. At most max_connections connections are opened
+	per host, idle connections are kept open for reuse. A request that fails
+	on a reused connection (eg: because the server closed it in the meantime)
+	is retried once on a fresh one. Redirects are followed, up to
+	MAX_REDIRECTS of them.
+
+	The client can be shared by threads. The connections are process local,
+	a client handed to another process starts out with an empty pool.
+	"""
+	def __init__(self, max_connections=MAX_CONNECTIONS, timeout=TIMEOUT):
+		self.max_connections = max_connections
+		self.timeout = timeout
+		self.__lock = Lock()
+		self.__hosts = {}
+		self.__pool = None
+		self.__pid = getpid()
+		# Number of connections opened, useful to check reuse
+		self.connections = 0
+
+	def __getstate__(self):
+		return {'max_connections': self.max_connections,
+				'timeout': self.timeout}
+
+	def __setstate__(self, state):
+		self.__init__(state['max_connections'], state['timeout'])
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def __check_pid(self):
+		# Never share sockets or threads with the parent process
+		if self.__pid != getpid():
+			self.__hosts, self.__pool = {}, None
+			self.__pid = getpid()
+
+	def __host(self, key):
+		with self.__lock:
+			self.__check_pid()
+			host = self.__hosts.get(key)
+			if host is None:
+				host = self.__hosts[key] = _Host(self.max_connections)
+			return host
+
+	def __connect(self, scheme, netloc):
+		with self.__lock:
+			self.connections += 1
+		if scheme == 'https':
+			return HTTPSConnection(netloc, timeout=self.timeout)
+		return HTTPConnection(netloc, timeout=self.timeout)
+
+	def request(self, url, method='GET', headers=None):
+		"""Performs a request and returns a tuple of (status, headers, body),
+		those of the final response if redirected. Raises HttpError if no
+		response could be obtained or there are too many redirects."""
+		for _ in range(MAX_REDIRECTS + 1):
+			status, response_headers, body = self.__request(url, method,
+															headers)
+			location = response_headers.get('Location')
+			if status not in REDIRECTS or location is None:
+				return status, response_headers, body
+			url = urljoin(url, location)
+			if status == 303 and method != 'HEAD':
+				method = 'GET'
+		raise HttpError(url, status, 'Too many redirects')
+
+	def __request(self, url, method, headers):
+		parts = urlsplit(url)
+		if parts.scheme not in ('http', 'https'):
+			raise HttpError(url, reason='Unsupported scheme')
+		path = parts.path or '/'
+		if parts.query:
+			path = '%s?%s' % (path, parts.query)
+		headers = dict(headers or {})
+		headers.setdefault('User-Agent', USER_AGENT)
+		host = self.__host((parts.scheme, parts.netloc))
+		with host.slots:
+			try:
+				connection, reused = host.idle.popleft(), True
+			except IndexError:
+				connection, reused = None, False
+			while True:
+				if connection is None:
+					connection = self.__connect(parts.scheme, parts.netloc)
+				try:
+					connection.request(method, path, headers=headers)
+					response = connection.getresponse()
+					body = response.read()
+					break
+				except (HTTPException, OSError) as e:
+					connection.close()
+					connection = None
+					if not reused:
+						raise HttpError(url, reason=str(e))
+					reused = False
+			if response.will_close:
+				connection.close()
+			else:
+				host.idle.append(connection)
+		return response.status, response.headers, body
+
+	def get(self, url):
+		"""Returns the body of url as bytes. Raises HttpError unless the
+		response is 200 OK."""
+		status, _, body = self.request(url)
+		if status != 200:
+			raise HttpError(url, status)
+		return body
+
+	def get_string(self, url, encoding='utf-8'):
+		return self.get(url).decode(encoding)
+
+	@property
+	def pool(self):
+		with self.__lock:
+			self.__check_pid()
+			if self.__pool is None:
+				self.__pool = ThreadPool(self.max_connections)
+			return self.__pool
+
+	def get_async(self, url, method=None):
+		"""Schedules the download of url and returns an AsyncResult. method
+		defaults to get(), its result is what AsyncResult.get() returns."""
+		return self.pool.apply_async(method or self.get, (url,))
+
+	def get_many(self, urls, method=None):
+		"""Downloads all urls concurrently. Returns a list with, for each url
+		in order, the result of method (get() by default) or None if it raised
+		an HttpError."""
+		results = [self.get_async(url, method) for url in urls]
+		return [_result(result) for result in results]
+
+	def close(self):
+		"""Closes all idle connections and stops the worker threads."""
+		with self.__lock:
+			hosts, self.__hosts = self.__hosts, {}
+			pool, self.__pool = self.__pool, None
+		if pool is not None:
+			pool.terminate()
+		for host in hosts.values():
+			while host.idle:
+				host.idle.popleft().close()
+
+def _result(result):
+	try:
+		return result.get()
+	except HttpError:
+		return None
+
+__SHARED = []
+
+def shared_client():
+	"""Returns a process wide HttpClient, created on first use."""
+	if not __SHARED or __SHARED[0][0] != getpid():
+		__SHARED[:] = [(getpid(), HttpClient())]
+	return __SHARED[0][1]
@@ -0,0 +1,130 @@
+"""
+Optional instrumentation of the processing hot paths. Hooks in the handlers and
+in Package report measurements to the active sink. When no sink is enabled
+(the default) a hook costs a single attribute lookup.
+
+Reported metrics, each tagged with the handler class and the file extension:
+	init-seconds		wall time spent in AbstractFile.__init__
+	checksum-seconds	wall time spent computing checksums
+	bytes-hashed		bytes fed to the checksum engine
+	persist-seconds		wall time spent writing files to disk
+	temp-files			temporary files created
+	children-seconds	wall time spent listing archive members
+	members				archive members listed
+	extract-seconds		wall time spent extracting archive members
+	bytes-extracted		bytes extracted from archives
+	depth				nesting depth of the file within the scanned package
+
+Sinks are process local. When using a process pool, enable a sink in each
+worker (eg: a JsonLinesSink appending to a shared file).
+"""
+import json
+from threading import Lock
+from time import time
+
+# Active sink, None when instrumentation is disabled
+sink = None
+
+def enable(new_sink):
+	"""Starts reporting measurements to new_sink and returns it."""
+	global sink
+	sink = new_sink
+	return sink
+
+def disable():
+	"""Stops reporting measurements. Returns the sink that was active."""
+	global sink
+	old_sink, sink = sink, None
+	return old_sink
+
+def record(handler, extension, metric, value):
+	"""Reports a measurement to the active sink, if any."""
+	if sink is not None:
+		sink.record(handler, extension, metric, value)
+
+class MemorySink():
+	"""Aggregates measurements in memory. stats maps (handler, extension,
+	metric) to a dict with the keys 'count', 'sum' and 'max'."""
+	def __init__(self):
+		self.stats = {}
+		self.__lock = Lock()
+
+	def record(self, handler, extension, metric, value):
+		key = (handler, extension, metric)
+		with self.__lock:
+			stat = self.stats.get(key)
+			if stat is None:
+				self.stats[key] = {'count': 1, 'sum': value, 'max': value}
+			else:
+				stat['count'] += 1
+				stat['sum'] += value
+				if value > stat['max']:
+					stat['max'] = value
+
+	def totals(self, metric, by='handler'):
+		"""Returns a dict mapping each handler (or extension, if by is
+		'extension') to the sum of metric."""
+		position = 0 if by == 'handler' else 1
+		totals = {}
+		with self.__lock:
+			for key, stat in self.stats.items():
+				if key[2] == metric:
+					totals[key[position]] = totals.get(key[position], 0) + \
+							stat['sum']
+		return totals
+
+	def reset(self):
+		with self.__lock:
+			self.stats = {}
+
+class JsonLinesSink():
+	"""Writes every measurement as a JSON object on its own line to output,
+	either a path (opened for appending) or a text file-like-object."""
+	def __init__(self, output):
+		self.__owned = isinstance(output, str)
+		self.output = open(output, 'a', buffering=1) if self.__owned \
+				else output
+		self.__lock = Lock()
+
+	def record(self, handler, extension, metric, value):
+		line = json.dumps({'time': time(), 'handler': handler,
+				'extension': extension, 'metric': metric, 'value': value})
+		with self.__lock:
+			self.output.write(line + '\n')
+
+	def close(self):
+		if self.__owned:
+			self.output.close()
+
+class PrometheusSink(MemorySink):
+	"""Aggregates measurements in memory and exports them in the Prometheus
+	text exposition format."""
+	def __init__(self, prefix='jsnoop'):
+		MemorySink.__init__(self)
+		self.prefix = prefix
+
+	def export(self):
+		"""Returns the aggregated measurements as Prometheus text."""
+		lines = []
+		metrics = {}
+		for (handler, extension, metric), stat in sorted(self.stats.items(),
+				key=lambda item: tuple(str(part) for part in item[0])):
+			metrics.setdefault(metric, []).append((handler, extension, stat))
+		for metric, samples in sorted(metrics.items()):
+			name = '%s_%s' % (self.prefix, metric.replace('-', '_'))
+			lines.append('# TYPE %s summary' % name)
+			for handler, extension, stat in samples:
+				labels = 'handler="%s",extension="%s"' % (handler,
+						_escape_label(extension))
+				lines.append('%s_sum{%s} %s' % (name, labels, stat['sum']))
+				lines.append('%s_count{%s} %d' % (name, labels, stat['count']))
+			lines.append('# TYPE %s_max gauge' % name)
+			for handler, extension, stat in samples:
+				labels = 'handler="%s",extension="%s"' % (handler,
+						_escape_label(extension))
+				lines.append('%s_max{%s} %s' % (name, labels, stat['max']))
+		return '\n'.join(lines) + '\n'
+
+def _escape_label(value):
+	return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+			'\n', '\\n')
@@ -0,0 +1,291 @@
+"""
+Serialization of scan results. Records (the info dicts) are written one at a
+time by a streaming writer in one of two formats:
+	jsonl	JSON Lines, one JSON object per line
+	binary	compact length prefixed frames, see below
+
+The binary format starts with MAGIC. It is followed by frames, each being a
+varint length, a frame type byte and the payload. A field frame defines the
+name of the next field id (counting from 0). A record frame holds a varint
+field count and, per field, the varint field id, a type byte and the value.
+Strings, digests, bytes and JSON encoded values carry a varint length, so
+readers can skip fields they were not asked for without decoding them.
+Lowercase hex strings of 32 characters or more (ie: digests) are stored as raw
+bytes, half their size, and read back as hex strings. A string equal to the
+value of the same field in the previous record (eg: the path and the parent
+of siblings) is stored as a repeat marker only.
+"""
+import json
+from struct import Struct
+
+MAGIC = b'JSNOOP\x00\x01'
+
+FORMATS = ['jsonl', 'binary']
+
+# Frame types
+_FIELD = 0
+_RECORD = 1
+
+# Value types
+_NONE = 0
+_FALSE = 1
+_TRUE = 2
+_INT = 3
+_FLOAT = 4
+_STR = 5
+_HEX = 6
+_BYTES = 7
+_JSON = 8
+_REPEAT = 9
+
+_DOUBLE = Struct('<d')
+_HEX_DIGITS = frozenset('0123456789abcdef')
+# Shortest string stored as a digest
+_MIN_HEX = 32
+
+def _varint(value, out):
+	"""Appends the unsigned varint encoding of value to the bytearray out."""
+	while value > 0x7f:
+		out.append((value & 0x7f) | 0x80)
+		value >>= 7
+	out.append(value)
+
+def _read_varint(data, offset):
+	"""Returns a tuple of (value, offset after the varint)."""
+	value = shift = 0
+	while True:
+		byte = data[offset]
+		offset += 1
+		value |= (byte & 0x7f) << shift
+		if not byte & 0x80:
+			return value, offset
+		shift += 7
+
+def _is_hex(value):
+	return len(value) >= _MIN_HEX and not len(value) % 2 and \
+			_HEX_DIGITS.issuperset(value)
+
+class _Output():
+	"""Base class of the writers. output is either a path, which is created,
+	or a file-like-object, which is left open."""
+	mode = 'wb'
+
+	def __init__(self, output):
+		self.__owned = isinstance(output, str)
+		self.output = open(output, self.mode) if self.__owned else output
+		self.count = 0
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def write_all(self, records):
+		for record in records:
+			self.write(record)
+
+	def close(self):
+		if self.__owned:
+			self.output.close()
+		else:
+			self.output.flush()
+
+class JsonLinesWriter(_Output):
+	mode = 'w'
+
+	def __init__(self, output):
+		_Output.__init__(self, output)
+		self.__encoder = json.JSONEncoder(separators=(',', ':'),
+										default=_json_default)
+
+	def write(self, record):
+		self.output.write(self.__encoder.encode(record))
+		self.output.write('\n')
+		self.count += 1
+
+class BinaryWriter(_Output):
+	def __init__(self, output):
+		_Output.__init__(self, output)
+		self.__fields = {}
+		# Last string value written per field id
+		self.__last = {}
+		self.__encoder = json.JSONEncoder(separators=(',', ':'),
+										default=_json_default)
+		self.output.write(MAGIC)
+
+	def __field(self, name):
+		field = self.__fields.get(name)
+		if field is None:
+			field = self.__fields[name] = len(self.__fields)
+			payload = name.encode('utf-8')
+			frame = bytearray()
+			_varint(len(payload) + 1, frame)
+			frame.append(_FIELD)
+			self.output.write(frame + payload)
+		return field
+
+	def write(self, record):
+		payload = bytearray()
+		_varint(len(record), payload)
+		for name, value in record.items():
+			field = self.__field(name)
+			_varint(field, payload)
+			if value is None:
+				payload.append(_NONE)
+			elif value is True or value is False:
+				payload.append(_TRUE if value else _FALSE)
+			elif isinstance(value, int):
+				payload.append(_INT)
+				# zigzag, so small negative numbers stay small
+				_varint(value << 1 if value >= 0 else (-value << 1) - 1,
+						payload)
+			elif isinstance(value, float):
+				payload.append(_FLOAT)
+				payload += _DOUBLE.pack(value)
+			elif isinstance(value, str) and self.__last.get(field) == value:
+				payload.append(_REPEAT)
+			else:
+				if isinstance(value, str):
+					self.__last[field] = value
+					if _is_hex(value):
+						kind, data = _HEX, bytes.fromhex(value)
+					else:
+						kind, data = _STR, value.encode('utf-8')
+				elif isinstance(value, (bytes, bytearray, memoryview)):
+					kind, data = _BYTES, value
+				else:
+					kind = _JSON
+					data = self.__encoder.encode(value).encode('utf-8')
+				payload.append(kind)
+				_varint(len(data), payload)
+				payload += data
+		frame = bytearray()
+		_varint(len(payload) + 1, frame)
+		frame.append(_RECORD)
+		self.output.write(frame)
+		self.output.write(payload)
+		self.count += 1
+
+def _json_default(value):
+	if isinstance(value, (bytes, bytearray, memoryview)):
+		return bytes(value).hex()
+	if isinstance(value, (set, frozenset)):
+		return sorted(value)
+	raise TypeError('%r is not JSON serializable' % (value,))
+
+def open_writer(output, format='jsonl'):
+	"""Returns a writer for format ('jsonl' or 'binary') writing to output,
+	a path or a file-like-object (binary unless the format is jsonl)."""
+	if format == 'jsonl':
+		return JsonLinesWriter(output)
+	if format == 'binary':
+		return BinaryWriter(output)
+	raise ValueError('Unknown output format: %s' % format)
+
+def read_json_lines(fileobj, fields=None):
+	"""Generator yielding the records of a JSON Lines text file-like-object.
+	If fields is given, records only hold those of their fields."""
+	fields = None if fields is None else set(fields)
+	for line in fileobj:
+		if not line.strip():
+			continue
+		record = json.loads(line)
+		if fields is not None:
+			record = {name: value for name, value in record.items()
+					if name in fields}
+		yield record
+
+def read_binary(fileobj, fields=None):
+	"""Generator yielding the records of a binary file-like-object. If fields
+	is given, records only hold those of their fields and the others are
+	skipped without being decoded."""
+	if fileobj.read(len(MAGIC)) != MAGIC:
+		raise ValueError('Not a binary jsnoop result file')
+	wanted = None if fields is None else set(fields)
+	names = []
+	# For each field id, whether it is wanted
+	selected = []
+	# Last string value read per field id, for repeats
+	last = {}
+	buf = b''
+	offset = 0
+	while True:
+		# Frames are decoded from a buffer refilled in large chunks
+		if len(buf) - offset < 10:
+			buf = buf[offset:] + fileobj.read(1024 * 1024)
+			offset = 0
+			if not buf:
+				return
+		size, start = _read_varint(buf, offset)
+		end = start + size
+		if end > len(buf):
+			buf = buf[offset:] + fileobj.read(max(end - len(buf),
+												1024 * 1024))
+			offset = 0
+			size, start = _read_varint(buf, offset)
+			end = start + size
+			if end > len(buf):
+				raise ValueError('Truncated binary jsnoop result file')
+		kind = buf[start]
+		if kind == _FIELD:
+			name = buf[start + 1:end].decode('utf-8')
+			names.append(name)
+			selected.append(wanted is None or name in wanted)
+		elif kind == _RECORD:
+			yield _decode_record(buf, start + 1, names, selected, last)
+		offset = end
+
+def _decode_record(buf, offset, names, selected, last):
+	record = {}
+	count, offset = _read_varint(buf, offset)
+	for _ in range(count):
+		field, offset = _read_varint(buf, offset)
+		kind = buf[offset]
+		offset += 1
+		if kind <= _TRUE:
+			value = (None, False, True)[kind]
+		elif kind == _INT:
+			value, offset = _read_varint(buf, offset)
+			value = value >> 1 if not value & 1 else -((value + 1) >> 1)
+		elif kind == _FLOAT:
+			value = _DOUBLE.unpack_from(buf, offset)[0]
+			offset += _DOUBLE.size
+		elif kind == _REPEAT:
+			value = last.get(field)
+		else:
+			length, offset = _read_varint(buf, offset)
+			end = offset + length
+			if selected[field]:
+				data = buf[offset:end]
+				if kind == _STR:
+					value = last[field] = data.decode('utf-8')
+				elif kind == _HEX:
+					value = last[field] = data.hex()
+				elif kind == _BYTES:
+					value = data
+				else:
+					value = json.loads(data.decode('utf-8'))
+			offset = end
+		if selected[field]:
+			record[names[field]] = value
+	return record
+
+def read_records(input, fields=None):
+	"""Generator yielding the records stored in input, a path or a binary
+	file-like-object, in either format. If fields is given, records only hold
+	those of their fields."""
+	if isinstance(input, str):
+		with open(input, 'rb') as fileobj:
+			yield from read_records(fileobj, fields)
+		return
+	header = input.peek(len(MAGIC))[:len(MAGIC)] if hasattr(input, 'peek') \
+			else None
+	if header is None:
+		header = input.read(len(MAGIC))
+		input.seek(-len(header), 1)
+	if header == MAGIC:
+		yield from read_binary(input, fields)
+	else:
+		lines = (line.decode('utf-8') for line in input)
+		yield from read_json_lines(lines, fields)
@@ -1,19 +1,478 @@
+from collections import deque
+from io import SEEK_END
+from itertools import islice
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+from os.path import sep, basename, dirname, splitext
+from threading import Lock
+from jsnoop import instrumentation
+from jsnoop.buffer import map_file
+from jsnoop.checksum import DEFAULT_ALGORITHMS, check_algorithms
 from jsnoop.handlers.archivefile import ArchiveFile
-from jsnoop.handlers import get_handler_obj
+from jsnoop.handlers import get_handler_obj, is_selected, is_known_extension
+from jsnoop.record import FileRecord, RecordTable
+from jsnoop.scratch import ScratchSpace
+
+# Pool implementations available for parallel traversal
+POOL_TYPES = {
+	'process'	: Pool,
+	'thread'	: ThreadPool
+}
+
+def _process_child(child, process_all_files, process_classes, cache, depth,
+				scratch, limits, checksums, table=None):
+	"""Worker entry point. Processes a single archive child (and everything
+	nested in it) and returns the collected records. Without a table (ie: in
+	another process) the records are returned as info dicts."""
+	pkg = Package(child.filename, child.fileobj, child.parent_path,
+				child.parent_sha512, process_all_files, stream=True,
+				cache=cache, depth=depth, scratch=scratch, limits=limits,
+				process_classes=process_classes, checksums=checksums,
+				table=table)
+	if table is None:
+		return list(pkg.iter_info())
+	return list(pkg.iter_records())
+
+def placeholder_record(handler, filepath, parent_path, parent_sha512, table,
+					**details):
+	"""Returns the record emitted in place of a file that was not handled,
+	with handler as the handler name and any details given."""
+	return FileRecord(dirname(filepath.replace(parent_path, '').lstrip(sep)),
+					basename(filepath), splitext(filepath)[-1].lower(),
+					table.parent_id(parent_sha512), handler, details=details)
+
+def truncation_record(reason, limit, filepath, parent_path, parent_sha512,
+					table):
+	"""Returns the record emitted in place of content that was not processed
+	because a traversal limit was reached."""
+	return placeholder_record('Truncated', filepath, parent_path,
+							parent_sha512, table, reason=reason, limit=limit)
+
+def member_size(member):
+	"""Returns the uncompressed size an archive member declares, or None."""
+	return getattr(member, 'file_size', getattr(member, 'size', None))
+
+class Limits():
+	"""
+	Limits protecting a traversal against hostile or pathological input, eg:
+	zip bombs. A limit set to None is disabled.
+		max_depth	nested archives deeper than this are not descended into
+		max_bytes	total number of bytes extracted from archives
+		max_members	total number of archive members processed
+		max_ratio	highest accepted compression ratio of a member
+
+	Members are checked against their declared sizes before extraction and
+	against their real size after it. The counters are shared by everything
+	processed with the same instance, including thread pool workers. Process
+	pool workers get a copy each, so there max_bytes and max_members apply per
+	child of the top level archive.
+	"""
+	def __init__(self, max_depth=None, max_bytes=None, max_members=None,
+				max_ratio=None):
+		self.max_depth = max_depth
+		self.max_bytes = max_bytes
+		self.max_members = max_members
+		self.max_ratio = max_ratio
+		self.__lock = Lock()
+		self.reset()
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		del state['_Limits__lock']
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.__lock = Lock()
+
+	def reset(self):
+		self.members = 0
+		self.bytes = 0
+
+	def exceeds_ratio(self, size, compressed):
+		return self.max_ratio is not None and size and compressed and \
+				size > self.max_ratio * compressed
+
+	def check_member(self, member):
+		"""Accounts for an archive member about to be extracted. Returns a
+		tuple of (reason, limit) if it must not be, None otherwise."""
+		size = member_size(member)
+		if self.exceeds_ratio(size, getattr(member, 'compress_size', None)):
+			return ('max-ratio', self.max_ratio)
+		with self.__lock:
+			if self.max_members is not None and \
+					self.members >= self.max_members:
+				return ('max-members', self.max_members)
+			if self.max_bytes is not None and size is not None and \
+					self.bytes + size > self.max_bytes:
+				return ('max-bytes', self.max_bytes)
+			self.members += 1
+		return None
+
+	def check_extracted(self, member, size):
+		"""Accounts for the real size of an extracted member. Returns a tuple
+		of (reason, limit) if a limit is exceeded, None otherwise."""
+		if self.exceeds_ratio(size, getattr(member, 'compress_size', None)):
+			return ('max-ratio', self.max_ratio)
+		with self.__lock:
+			self.bytes += size
+			if self.max_bytes is not None and self.bytes > self.max_bytes:
+				return ('max-bytes', self.max_bytes)
+		return None
+
+class _Frame():
+	"""An archive on the traversal stack along with the children that are left
+	to process."""
+	def __init__(self, package, children, records, child=None):
+		self.package = package
+		self.children = children
+		# FileRecords collected for the result cache, None when not caching
+		self.records = records
+		# The ArchiveChild the package was created from
+		self.child = child
+		self.truncated = False
 
-# TODO: This needs to be parallelized as it is mostly a CPU bound task
 class Package():
+	"""Processes a file and, if it is an archive, all the files contained in it
+	recursively. The collected information is available in the records list
+	(jsnoop.record.FileRecord) in depth first order, info returns it as a list
+	of info dicts. Nested archives are walked using an explicit stack, so the
+	nesting depth is not bound by the interpreter's recursion limit.
+
+	Records refer to their parent archive through the RecordTable table, one
+	is created per scan unless given. Info dicts are only built when the
+	records are handed out, by iter_info() or info.
+
+	If stream is True, nothing is collected up front. Instead, iter_records()
+	and iter_info() yield each file's record as soon as its handler is done and
+	the extracted child data is released right after. This keeps memory bounded
+	for large archives. The generator can only be consumed once.
+
+	If workers is greater than 1, the immediate children of the archive (and
+	any archives nested within them) are processed in parallel using a pool of
+	the given pool_type ('process' or 'thread'). Results are reassembled in the
+	same order as a serial run. Only a small window of children is in flight
+	at any time, so extracted data does not pile up in memory. Note that a
+	process pool cannot be used from within a daemonic process (eg: a
+	multiprocessing.Pool worker), use a thread pool there instead.
+
+	If a cache (jsnoop.database.cache.ResultCache) is given, the records found
+	within an archive are stored under the archive's sha512 (tagged with the
+	selection mode unless all files are processed). Archives that are
+	already cached are not descended into, their records are replayed from the
+	cache instead. Truncated results are never cached.
+
+	Unless process_all_files is True, only the members of an archive that are
+	of interest are handled: nested archives, manifests, signatures and, if
+	process_classes is True, class files. Members are selected by their name,
+	before they are extracted. A record with the handler 'Skipped' and the
+	declared 'size' of the member is emitted for all others, no checksums are
+	computed for them.
+
+	If limits (a Limits instance) are given, content exceeding them is skipped
+	and a record with the handler 'Truncated' is emitted in its place. Its
+	'reason' is one of 'max-depth', 'max-bytes', 'max-members' or 'max-ratio'
+	and 'limit' holds the value that was reached.
+
+	checksums lists the digest algorithms computed for each file (the md5,
+	sha1, sha256 and sha512 of jsnoop.checksum.DEFAULT_ALGORITHMS if None).
+	Computing fewer of them saves CPU time, eg: use
+	jsnoop.checksum.required_by() to compute only those the consumers of the
+	results need. Archives always get a sha512 as well. Cached records are
+	kept apart per set of algorithms.
+
+	If mmap is True and a filepath is given without a fileobj, the file is
+	memory-mapped (see jsnoop.buffer.MappedFile). Hashing, content sniffing,
+	archive parsing and stored zip members are all served from the one
+	mapping, so the file is read only once. Files that cannot be mapped, eg:
+	empty ones, are opened as usual. The mapping is closed along with the
+	package.
+
+	Handlers that need files on disk get them from a single ScratchSpace per
+	scan, which is removed as soon as the scan is complete. When streaming, use
+	the package as a context manager (or call close()) to make sure this also
+	happens if the generator is not consumed to the end."""
 	def __init__(self, filepath, fileobj=None, parent_path='',
-				parent_sha512=None, process_all_files=False):
-		self.handler = get_handler_obj(filepath, fileobj, parent_path,
-									parent_sha512)
-		self.info = [self.handler.info()]
-		self.process_all_files = process_all_files
-		self.process()
+				parent_sha512=None, process_all_files=False, workers=1,
+				pool_type='process', stream=False, cache=None, depth=0,
+				scratch=None, limits=None, process_classes=False, table=None,
+				checksums=None, mmap=False):
+		if pool_type not in POOL_TYPES:
+			raise ValueError('Unknown pool type: %s' % pool_type)
+		self.checksums = check_algorithms(checksums)
+		self.handler = None
+		self.mapping = None
+		self.owns_scratch = scratch is None
+		self.scratch = ScratchSpace() if scratch is None else scratch
+		try:
+			if mmap and fileobj is None:
+				fileobj = self.mapping = map_file(filepath)
+			with self.scratch.activate():
+				self.handler = get_handler_obj(filepath, fileobj, parent_path,
+											parent_sha512, self.checksums)
+			self.parent_path = parent_path
+			self.depth = depth
+			if instrumentation.sink is not None:
+				self.handler.measure('depth', depth)
+			self.process_all_files = process_all_files
+			self.process_classes = process_classes
+			self.workers = workers
+			self.pool_type = pool_type
+			self.stream = stream
+			self.cache = cache
+			self.limits = limits
+			if limits is not None and depth == 0:
+				limits.reset()
+			self.table = RecordTable() if table is None else table
+			self.records = None
+			if not stream:
+				self.process()
+		except:
+			self.close()
+			raise
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def close(self):
+		"""Releases the handler's scratch files, the memory mapping if any and,
+		if this package created it, the scratch space."""
+		if self.handler is not None:
+			self.handler.close()
+		if self.mapping is not None:
+			self.mapping.close()
+		if self.owns_scratch:
+			self.scratch.close()
 
 	def process(self):
-		if isinstance(self.handler, ArchiveFile):
-			for child in self.handler.get_child_objects():
-				pkg = Package(child.filename, child.fileobj, child.parent_path,
-							child.parent_sha512)
-				self.info += pkg.info
+		self.records = list(self.iter_records())
+
+	@property
+	def info(self):
+		"""Returns the collected records as a new list of info dicts, None if
+		nothing was collected."""
+		if self.records is None:
+			return None
+		table = self.table
+		return [record.to_dict(table) for record in self.records]
+
+	def iter_info(self):
+		"""Generator yielding the info of this file followed by that of all
+		files contained in it, in depth first order."""
+		table = self.table
+		for record in self.iter_records():
+			yield record.to_dict(table)
+
+	def iter_records(self):
+		"""Same as iter_info() but yields FileRecords."""
+		stack = []
+		try:
+			yield self.handler.record(self.table)
+			frame = self.open_frame()
+			if frame is None:
+				return
+			if frame.children is None:
+				yield from self.iter_known_records(frame)
+				return
+			if self.workers and self.workers > 1:
+				children = list(frame.children)
+				if len(children) > 1:
+					for record in self.iter_parallel(children):
+						self.collect([frame], record)
+						yield record
+					self.close_frame(frame)
+					return
+				frame.children = iter(children)
+			stack.append(frame)
+			while stack:
+				frame = stack[-1]
+				child = next(frame.children, None)
+				if child is None:
+					stack.pop()
+					self.close_frame(frame)
+					continue
+				record = frame.package.check_child(child)
+				if record is not None:
+					child.release()
+					self.collect(stack, record)
+					yield record
+					if record.get('reason') == 'max-members':
+						# Nothing else will be processed in this archive
+						frame.children = iter(())
+					continue
+				pkg = frame.package.child_package(child)
+				record = pkg.handler.record(self.table)
+				self.collect(stack, record)
+				yield record
+				child_frame = pkg.open_frame()
+				if child_frame is not None and child_frame.children is not None:
+					child_frame.child = child
+					stack.append(child_frame)
+					continue
+				if child_frame is not None:
+					for record in pkg.iter_known_records(child_frame):
+						self.collect(stack, record)
+						yield record
+				pkg.close()
+				child.release()
+		finally:
+			while stack:
+				frame = stack.pop()
+				if frame.package is not self:
+					frame.package.close()
+					frame.child.release()
+			self.close()
+
+	def child_package(self, child):
+		"""Returns a streaming Package for an archive child, sharing our
+		options."""
+		return Package(child.filename, child.fileobj, child.parent_path,
+					child.parent_sha512, self.process_all_files, stream=True,
+					cache=self.cache, depth=self.depth + 1,
+					scratch=self.scratch, limits=self.limits,
+					process_classes=self.process_classes, table=self.table,
+					checksums=self.checksums)
+
+	def cache_key(self):
+		"""Returns the key of this archive's records in the result cache."""
+		key = [self.handler.digests['sha512'].hex()]
+		if not self.process_all_files:
+			key.append('classes' if self.process_classes else 'selected')
+		if self.checksums != DEFAULT_ALGORITHMS:
+			key.append(','.join(self.checksums))
+		return ':'.join(key)
+
+	def open_frame(self):
+		"""Returns a _Frame if the handler is an archive, None otherwise. The
+		children of the frame are None if its records are known without
+		descending into it, ie: they are cached or the depth limit is
+		reached."""
+		if not isinstance(self.handler, ArchiveFile):
+			return None
+		limits = self.limits
+		if limits is not None and limits.max_depth is not None and \
+				self.depth >= limits.max_depth:
+			return _Frame(self, None, None)
+		records = None
+		if self.cache is not None:
+			records = self.cache.get(self.cache_key())
+			if records is not None:
+				table = self.table
+				return _Frame(self, None, [FileRecord.from_dict(info, table)
+										for info in records])
+			records = []
+		return _Frame(self, iter(self.handler.get_child_objects()), records)
+
+	def iter_known_records(self, frame):
+		if frame.records is not None:
+			yield from frame.records
+		else:
+			yield truncation_record('max-depth', self.limits.max_depth,
+								self.handler.filepath, self.parent_path,
+								self.handler.digests['sha512'], self.table)
+
+	def close_frame(self, frame):
+		"""Caches the records of a completed archive and releases it."""
+		if frame.records is not None and not frame.truncated:
+			table = self.table
+			self.cache.put(frame.package.cache_key(),
+						[record.to_dict(table) for record in frame.records])
+		if frame.package is not self:
+			frame.package.close()
+			frame.child.release()
+
+	def collect(self, stack, record):
+		"""Adds record to the records of all archives on the stack. A
+		truncation record keeps all of them from being cached."""
+		truncated = record.handler == 'Truncated'
+		for frame in stack:
+			if frame.records is not None:
+				frame.records.append(record)
+			frame.truncated = frame.truncated or truncated
+
+	def check_child(self, child):
+		"""Checks whether child is to be processed, extracting it if it has
+		to be checked against the limits. Returns the record to emit in its
+		place if it is not, None otherwise."""
+		if not self.process_all_files and not self.is_selected(child):
+			return placeholder_record('Skipped', child.filename,
+									child.parent_path, child.parent_sha512,
+									self.table, size=member_size(child.member))
+		if self.limits is None:
+			return None
+		tripped = self.limits.check_member(child.member)
+		if tripped is None:
+			size = child.fileobj.seek(0, SEEK_END)
+			child.fileobj.seek(0)
+			tripped = self.limits.check_extracted(child.member, size)
+		if tripped is None:
+			return None
+		return truncation_record(tripped[0], tripped[1], child.filename,
+								child.parent_path, child.parent_sha512,
+								self.table)
+
+	def is_selected(self, child):
+		"""Returns true if child is to be processed when only selected files
+		are. Children with an unknown extension are selected by their content
+		if it can be read without extracting them, see ArchiveChild.peek().
+		Children without any extension are extracted to be sniffed, resources
+		(eg: .xml or .png files) are not."""
+		if is_selected(child.filename, self.process_classes):
+			return True
+		extension = splitext(child.filename)[-1]
+		if is_known_extension(extension):
+			return False
+		fileobj = child.peek()
+		if fileobj is None:
+			if extension:
+				return False
+			fileobj = child.fileobj
+		return is_selected(child.filename, self.process_classes, fileobj)
+
+	def iter_parallel(self, children):
+		pending = iter(children)
+		window = deque()
+		with POOL_TYPES[self.pool_type](self.workers) as pool:
+			def submit(count):
+				nonlocal pending
+				for child in islice(pending, count):
+					record = self.check_child(child)
+					if record is not None:
+						child.release()
+						window.append((child, None, record))
+						if record.get('reason') == 'max-members':
+							# Nothing else will be processed in this archive
+							pending = iter(())
+							break
+						continue
+					# Threads extract lazily on their own and share our scratch
+					# space and record table, processes need the data shipped
+					# to them, use a scratch space of their own and send info
+					# dicts back
+					if self.pool_type == 'thread':
+						task, scratch, table = child, self.scratch, self.table
+					else:
+						task, scratch, table = child.detach(), None, None
+					result = pool.apply_async(_process_child,
+							(task, self.process_all_files,
+							self.process_classes, self.cache, self.depth + 1,
+							scratch, self.limits, self.checksums, table))
+					window.append((child, result, None))
+			submit(self.workers * 2)
+			# Results are consumed in submission order, this keeps the output
+			# identical to a serial run
+			while window:
+				child, result, record = window.popleft()
+				if result is None:
+					yield record
+				elif self.pool_type == 'thread':
+					yield from result.get()
+				else:
+					table = self.table
+					for info in result.get():
+						yield FileRecord.from_dict(info, table)
+				child.release()
+				submit(1)
@@ -30,23 +30,44 @@ import stat
 import sys
 import re
 
+from functools import lru_cache
+from io import StringIO
 from string import Template
 from xml.etree import ElementTree
 from pyrus.mplogging import Logger
 from pyrus import AbstractMPBorg
 from multiprocessing.managers import BaseManager
+from multiprocessing.pool import ThreadPool
+from threading import Lock
 from abc import ABCMeta, abstractmethod
 from os.path import join
-from pyrus.web.download import download, download_string, DownloadException
-from pyrus.web import open_url, get_header_value
+from jsnoop.database.cache import DocumentCache, DOCUMENT_CACHE_SIZE, \
+		VOLATILE_TTL
+from jsnoop.httpclient import HttpError, shared_client
 from time import strptime, mktime
 
 logger = Logger('jsnoop.plugins.maven')
 
 DEFAULT_REMOTE_URI = 'http://repo1.maven.org/maven2/'
 DEFAULT_LOCAL_URI = os.path.expanduser('~/.m2/repository')
+MAVEN_CACHE = 'maven.cache'
+# Default upper bound for the sum of all cached jars, in bytes
+JAR_CACHE_SIZE = 1024 * 1024 * 1024
+# HTTP status codes meaning a document does not exist
+NOT_FOUND = (404, 410)
+
+class PomNotFound(Exception):
+	"""Raised when a POM required to interpret another one (a parent or an
+	imported BOM) cannot be found."""
+	def __init__(self, artifact):
+		Exception.__init__(self, 'Cannot find pom %s' % artifact)
+		self.artifact = artifact
 
 class MavenRepos(metaclass=ABCMeta):
+	# Digests of scanned files comparable with fetch_checksum(), see
+	# jsnoop.checksum
+	required_checksums = ['sha1']
+
 	def __init__(self, name, uri):
 		self.name = name
 		self.uri = uri
@@ -57,6 +78,9 @@ class MavenRepos(metaclass=ABCMeta):
 		else:
 			return False
 
+	def __hash__(self):
+		return hash(self.uri)
+
 	@abstractmethod
 	def get_artifact_uri(self, artifact, ext):
 		pass
@@ -137,25 +161,52 @@ class MavenFileSystemRepos(MavenRepos):
 			return checksum
 
 class MavenHttpRemoteRepos(MavenRepos):
+	"""Remote repository accessed through the process wide pooled HttpClient,
+	so requests to the same repository reuse keep-alive connections. Fetched
+	documents (and documents found missing) are recorded in the persistent
+	cache of the cache_manager, shared by all repositories and processes. Jars
+	are kept in a store of their own, so they do not evict POMs."""
 	def __init__(self, name, uri):
 		MavenRepos.__init__(self, name, uri)
-		self.pom_cache = {}
-		self.pom_not_found_cache = []
+
+	@property
+	def client(self):
+		return shared_client()
+
+	def fetch(self, url, volatile=False, documents=None):
+		"""Returns the document at url as bytes, or None if it does not exist.
+		Documents are served from the cache (documents, the cache_manager's
+		documents if None) if possible. volatile documents (eg: of snapshots)
+		expire from the cache."""
+		if documents is None:
+			documents = cache_manager.documents
+		data = documents.get(url)
+		if data is not None or documents.is_missing(url):
+			return data
+		try:
+			data = self.client.get(url)
+		except HttpError as e:
+			if e.status in NOT_FOUND:
+				documents.put_missing(url)
+			return None
+		documents.put(url, data, volatile)
+		return data
 
 	def download_jar(self, artifact, local_path):
 		maven_path = self.get_artifact_uri(artifact, 'jar')
 		logger.info('[Downloading] jar from %s' % maven_path)
 		local_jip_path = join(local_path, artifact.maven_name())
-		download(maven_path, local_jip_path, False)
+		data = self.fetch(maven_path, artifact.is_snapshot(),
+						cache_manager.jars)
+		if data is None:
+			logger.error('[Error] File not found %s' % maven_path)
+			raise IOError('File not found:' + maven_path)
+		os.makedirs(os.path.dirname(local_jip_path), exist_ok=True)
+		with open(local_jip_path, 'wb') as jar_file:
+			jar_file.write(data)
 		logger.debug('[Finished] %s downloaded ' % maven_path)
 
 	def download_pom(self, artifact):
-		if artifact in self.pom_not_found_cache:
-			return None
-
-		if artifact in self.pom_cache:
-			return self.pom_cache[artifact]
-
 		if artifact.is_snapshot():
 			snapshot_info = self.get_snapshot_info(artifact)
 			if snapshot_info is not None:
@@ -164,18 +215,12 @@ class MavenHttpRemoteRepos(MavenRepos):
 				artifact.build_number = bn
 
 		maven_path = self.get_artifact_uri(artifact, 'pom')
-		try:
-			logger.info('[Checking] pom file %s' % maven_path)
-			data = download_string(maven_path)
-
-			# # cache
-			self.pom_cache[artifact] = data
-
-			return data
-		except DownloadException:
-			self.pom_not_found_cache.append(artifact)
+		logger.info('[Checking] pom file %s' % maven_path)
+		data = self.fetch(maven_path, artifact.is_snapshot())
+		if data is None:
 			logger.info('[Skipped] Pom file not found at %s' % maven_path)
 			return None
+		return data.decode('utf-8')
 
 	def get_artifact_uri(self, artifact, ext):
 		if not artifact.is_snapshot():
@@ -190,14 +235,13 @@ class MavenHttpRemoteRepos(MavenRepos):
 
 	def get_snapshot_info(self, artifact):
 		metadata_path = self.get_metadata_path(artifact)
-		try:
-			data = download_string(metadata_path)
-			eletree = ElementTree.fromstring(data)
-			timestamp = eletree.findtext('versioning/snapshot/timestamp')
-			build_number = eletree.findtext('versioning/snapshot/buildNumber')
-			return (timestamp, build_number)
-		except DownloadException:
+		data = self.fetch(metadata_path, True)
+		if data is None:
 			return None
+		eletree = ElementTree.fromstring(data)
+		timestamp = eletree.findtext('versioning/snapshot/timestamp')
+		build_number = eletree.findtext('versioning/snapshot/buildNumber')
+		return (timestamp, build_number)
 
 	def get_metadata_path(self, artifact):
 		group = artifact.group.replace('.', '/')
@@ -208,15 +252,16 @@ class MavenHttpRemoteRepos(MavenRepos):
 	def last_modified(self, artifact):
 		metadata_path = self.get_metadata_path(artifact)
 		try:
-			response = open_url(metadata_path)
-			ts = get_header_value(response, 'last-modified')
+			status, headers, _ = self.client.request(metadata_path, 'HEAD')
+			if status != 200:
+				return None
+			ts = headers.get('last-modified')
 			if ts:
 				locale.setlocale(locale.LC_TIME, 'en_US')
 				last_modified = strptime(ts, '%a, %d %b %Y %H:%M:%S %Z')
 				return mktime(last_modified)
 			else:
 				return 0
-			response.close()
 		except:
 			return None
 
@@ -226,11 +271,14 @@ class MavenHttpRemoteRepos(MavenRepos):
 		assert checksum_type in ['sha1', 'md5']
 		checksum_url = '%s/%s.%s' % (self.uri.strip('/'), artifact.maven_name(),
 									checksum_type)
-		try:
-			data = download_string(checksum_url)
-			return data
-		except DownloadException:
-			return None
+		data = self.fetch(checksum_url, artifact.is_snapshot())
+		return data.decode('utf-8') if data is not None else None
+
+	def download_poms(self, artifacts):
+		"""Downloads the POMs of all artifacts concurrently. Returns a list of
+		POM strings, or None where a POM was not found."""
+		return [result.get() for result in [self.client.pool.apply_async(
+				self.download_pom, (artifact,)) for artifact in artifacts]]
 
 class Artifact(object):
 	def __init__(self, group, artifact, version=None):
@@ -283,19 +331,133 @@ class Artifact(object):
 		artifact = Artifact(group, artifact, version)
 		return artifact
 
+def get_repos_manager():
+	"""Returns the repository manager used by the module level helpers."""
+	if not __REPOS_MANAGER:
+		__REPOS_MANAGER.append(_RepositoryManager())
+	return __REPOS_MANAGER[0]
+
+def get_repositories():
+	"""Returns the configured repositories in lookup order."""
+	return list(get_repos_manager().repos)
+
+def find_pom(artifact, repositories=None):
+	"""Returns the POM string of artifact from the first repository that has
+	it, or None."""
+	if repositories is None:
+		repositories = get_repositories()
+	for repos in repositories:
+		pom = repos.download_pom(artifact)
+		if pom is not None:
+			return pom
+	return None
+
+def find_poms(artifacts, repositories=None):
+	"""Same as find_pom() for each of the artifacts, but all of them are
+	looked up concurrently. Returns a list of POM strings (or None) in the order
+	of artifacts."""
+	if repositories is None:
+		repositories = get_repositories()
+	pool = shared_client().pool
+	results = [pool.apply_async(find_pom, (artifact, repositories))
+			for artifact in artifacts]
+	return [result.get() for result in results]
+
+def load_pom(artifact, repositories=None):
+	"""Returns the Pom of artifact, None if it cannot be found. Poms are
+	shared, so parents and imports common to many POMs (eg: corporate parents
+	and BOMs) are fetched, parsed and resolved only once per process. The POM
+	is looked up in repositories (the configured ones if None), as are its
+	parents and imports. Snapshots are read again every time, so that they
+	expire. POMs that cannot be found are looked up again as well, the
+	cache_manager remembers those that do not exist."""
+	if repositories is not None:
+		repositories = tuple(repositories)
+	try:
+		if artifact.is_snapshot():
+			return _read_pom(artifact, repositories)
+		return _load_pom(artifact, repositories)
+	except PomNotFound as e:
+		if e.artifact is not artifact:
+			raise
+		return None
+
+def _read_pom(artifact, repositories):
+	"""Returns the Pom of artifact. Raises PomNotFound if there is none,
+	so that the failure is not memoized."""
+	if cache_manager.is_artifact_in_cache(artifact, jar=False):
+		pom = cache_manager.get_artifact_pom(artifact)
+	else:
+		pom = find_pom(artifact, repositories)
+		if pom is not None:
+			cache_manager.put_artifact_pom(artifact, pom)
+	if pom is None:
+		raise PomNotFound(artifact)
+	return Pom(pom, repositories)
+
+_load_pom = lru_cache(maxsize=4096)(_read_pom)
+load_pom.cache_clear = _load_pom.cache_clear
+
+def load_poms(artifacts, repositories=None):
+	"""Same as load_pom() for each of the artifacts, but all of them are
+	loaded concurrently."""
+	pool = shared_client().pool
+	results = [pool.apply_async(load_pom, (artifact, repositories))
+			for artifact in artifacts]
+	return [result.get() for result in results]
+
+def parse_pom(pom_string):
+	"""Parses a POM and returns the root element. Namespaces are dropped from
+	the tags while parsing, so elements can be found by their plain names."""
+	events = ElementTree.iterparse(StringIO(pom_string), ('start',))
+	for _, element in events:
+		if element.tag[0] == '{':
+			element.tag = element.tag.rpartition('}')[2]
+	return events.root
+
+# Matches ${name} property references
+_PLACEHOLDER = re.compile(r'\$\{([^}]*)\}')
+# Upper bound of substitution passes, stops circular references
+_MAX_PASSES = 16
+
+def resolve_properties(properties):
+	"""Returns a copy of properties with the references to other properties
+	in their values substituted, nested references included. References that
+	cannot be resolved (unknown or circular) are left as they are."""
+	resolved = dict(properties)
+	def substitute(match):
+		value = resolved.get(match.group(1))
+		return match.group(0) if value is None else value
+	pending = [name for name, value in resolved.items()
+			if value is not None and '${' in value]
+	for _ in range(_MAX_PASSES):
+		changed = []
+		for name in pending:
+			value = _PLACEHOLDER.sub(substitute, resolved[name])
+			if value != resolved[name]:
+				resolved[name] = value
+				changed.append(name)
+		if not changed:
+			break
+		pending = [name for name in changed if '${' in resolved[name]]
+	return resolved
+
 class Pom(object):
-	def __init__(self, pom_string):
+	"""A parsed POM. Parents and imported BOMs are looked up in repositories
+	(the configured ones if None), PomNotFound is raised if one of them cannot
+	be found."""
+	def __init__(self, pom_string, repositories=None):
 		self.pom_string = pom_string
+		self.repositories = repositories
 		self.eletree = None
 		self.properties = None
+		self.raw_properties = None
 		self.dep_mgmt = None
 		self.parent = None
 
 	def get_element_tree(self):
 		if self.eletree is None:
-			# # we use this dirty method to remove namesapce attribute so that elementtree will use default empty namespace
-			pom_string = re.sub(r"<project(.|\s)*?>", '<project>', self.pom_string, 1)
-			self.eletree = ElementTree.fromstring(pom_string)
+			self.eletree = parse_pom(self.pom_string)
 		return self.eletree
 
 	def get_parent_pom(self):
@@ -310,21 +472,13 @@ class Pom(object):
 			parent_version_id = parent.findtext("version")
 
 			artifact = Artifact(parent_group_id, parent_artifact_id, parent_version_id)
-			if cache_manager.is_artifact_in_cache(artifact, jar=False):
-				parent_pom = cache_manager.get_artifact_pom(artifact)
-			else:
-				for repos in repos_manager.repos:
-					parent_pom = repos.download_pom(artifact)
-					if parent_pom is not None:
-						cache_manager.put_artifact_pom(artifact, parent_pom)
-						break
-
+			parent_pom = load_pom(artifact, self.repositories)
 			if parent_pom is not None:
-				self.parent = Pom(parent_pom)
+				self.parent = parent_pom
 				return self.parent
 			else:
-				logger.error("cannot find parent pom %s" % parent_pom)
-				sys.exit(1)
+				logger.error("cannot find parent pom %s" % artifact)
+				raise PomNotFound(artifact)
 		else:
 			return None
 
@@ -341,6 +495,8 @@ class Pom(object):
 		properties = self.get_properties()
 		eletree = self.get_element_tree()
 		dependency_management_dependencies = eletree.findall("dependencyManagement/dependencies/dependency")
+		managed = []
+		imports = []
 		for dependency in dependency_management_dependencies:
 			group_id = self.__resolve_placeholder(dependency.findtext("groupId"), properties)
 			artifact_id = self.__resolve_placeholder(dependency.findtext("artifactId"), properties)
@@ -349,20 +505,24 @@ class Pom(object):
 			scope = dependency.findtext("scope")
 			if scope is not None and scope == 'import':
 				artifact = Artifact(group_id, artifact_id, version)
-				global repos_manager
-				for repos in repos_manager.repos:
-					import_pom = repos.download_pom(artifact)
-					if import_pom is not None:
-						break
+				managed.append(artifact)
+				imports.append(artifact)
+			else:
+				# # will also remember scope for scope inheritance
+				managed.append(((group_id, artifact_id), (version, scope)))
+
+		# # imported poms are fetched concurrently, but applied in order
+		import_poms = dict(zip(imports, load_poms(imports, self.repositories)))
+		for entry in managed:
+			if isinstance(entry, Artifact):
+				import_pom = import_poms[entry]
 				if import_pom is not None:
-					import_pom = Pom(import_pom)
 					dependency_management_version_dict.update(import_pom.get_dependency_management())
 				else:
-					logger.error("[Error] can not find dependency management import: %s" % artifact)
-					sys.exit(1)
+					logger.error("[Error] can not find dependency management import: %s" % entry)
+					raise PomNotFound(entry)
 			else:
-				# # will also remember scope for scope inheritance
-				dependency_management_version_dict[(group_id, artifact_id)] = (version, scope)
+				dependency_management_version_dict[entry[0]] = entry[1]
 
 		self.dep_mgmt = dependency_management_version_dict
 		return dependency_management_version_dict
@@ -412,16 +572,30 @@ class Pom(object):
 		return runtime_dependencies
 
 	def get_properties(self):
-		if self.properties is not None:
-			return self.properties
+		if self.properties is None:
+			# # resolved once, so that placeholders need a single lookup each
+			self.properties = resolve_properties(self.get_raw_properties())
+		return self.properties
+
+	def get_raw_properties(self):
+		"""Returns the properties, including the inherited ones, before
+		references are resolved. References are resolved on the merged
+		properties, so overriding a property affects inherited values that
+		refer to it."""
+		if self.raw_properties is not None:
+			return self.raw_properties
 
 		eletree = self.get_element_tree()
-		# parsing in-pom properties
+		# # inherited properties are overridden by our own
 		properties = {}
+		parent = self.get_parent_pom()
+		if parent is not None:
+			properties.update(parent.get_raw_properties())
+
+		# parsing in-pom properties
 		properties_ele = eletree.find("properties")
 		if properties_ele is not None:
-			prop_eles = properties_ele.getchildren()
-			for prop_ele in prop_eles:
+			for prop_ele in properties_ele:
 				if prop_ele.tag == 'property':
 					name = prop_ele.get("name")
 					value = prop_ele.get("value")
@@ -430,10 +604,6 @@ class Pom(object):
 					value = prop_ele.text
 				properties[name] = value
 
-		parent = self.get_parent_pom()
-		if parent is not None:
-			properties.update(parent.get_properties())
-
 		# # pom specific elements
 		groupId = eletree.findtext('groupId')
 		artifactId = eletree.findtext('artifactId')
@@ -450,17 +620,16 @@ class Pom(object):
 		properties["pom.groupId"] = groupId
 		properties["pom.artifactId"] = artifactId
 		properties["pom.version"] = version
-		self.properties = properties
+		self.raw_properties = properties
 		return properties
 
 	def __resolve_placeholder(self, text, properties):
-		def subfunc(matchobj):
-			key = matchobj.group(1)
-			if key in properties:
-				return properties[key]
-			else:
-				return matchobj.group(0)
-		return re.sub(r'\$\{(.*?)\}', subfunc, text)
+		if text is None or '${' not in text:
+			return text
+		def substitute(matchobj):
+			value = properties.get(matchobj.group(1))
+			return matchobj.group(0) if value is None else value
+		return _PLACEHOLDER.sub(substitute, text)
 
 	def get_repositories(self):
 		eletree = self.get_element_tree()
@@ -473,6 +642,150 @@ class Pom(object):
 			repos.append((name, uri, "remote"))
 		return repos
 
+class Resolution(object):
+	"""
+	Result of a transitive dependency resolution. artifacts maps each (group,
+	artifact) to the selected Artifact, in the order they were found, and
+	depths maps them to their distance from the roots. dependencies maps each
+	selected Artifact to the selected Artifacts it depends on. The artifacts
+	whose POM, or whose parent or imported BOM, could not be found are listed in
+	missing. The dependencies of those are not resolved.
+	"""
+	def __init__(self):
+		self.artifacts = {}
+		self.depths = {}
+		self.dependencies = {}
+		self.missing = []
+
+	def __iter__(self):
+		return iter(self.artifacts.values())
+
+	def __len__(self):
+		return len(self.artifacts)
+
+	def __contains__(self, artifact):
+		return self.artifacts.get((artifact.group, artifact.artifact)) \
+				== artifact
+
+	def match_victims(self, database):
+		"""Returns a dict mapping each resolved Artifact with known
+		vulnerabilities in database (a victims LocalDatabase) to their cves."""
+		matches = {}
+		for artifact in self:
+			cves = database.match_artifact(artifact.artifact, artifact.version)
+			if cves:
+				matches[artifact] = cves
+		return matches
+
+class DependencyResolver(object):
+	"""
+	Resolves the runtime dependencies of artifacts transitively. The graph is
+	walked breadth first and the POMs of each level are fetched and parsed
+	concurrently by a pool of workers.
+
+	Conflicts are mediated like Maven does: of all versions of a (group,
+	artifact) the one nearest to the roots wins, the first one declared if
+	they are equally near. The dependency management of a root applies to the
+	versions of all its transitive dependencies. Exclusions apply to the whole
+	subtree below the dependency that declares them.
+
+	The POM of each Artifact is only looked at once, so a resolver can be
+	reused to resolve many roots cheaply.
+	"""
+	def __init__(self, workers=8, repositories=None):
+		self.workers = workers
+		self.repositories = repositories
+		self.__lock = Lock()
+		self.__loaded = {}
+
+	def get_dependencies(self, artifact):
+		"""Returns the direct runtime dependencies of artifact, None if its
+		POM (or its parent or an imported BOM) could not be found."""
+		return self.load(artifact)[0]
+
+	def load(self, artifact):
+		"""Returns a tuple of the direct runtime dependencies of artifact
+		(None if they are not known), its dependency management and a list of
+		the artifacts whose POM could not be found or used."""
+		with self.__lock:
+			if artifact in self.__loaded:
+				return self.__loaded[artifact]
+		try:
+			pom = load_pom(artifact, self.repositories)
+			if pom is None:
+				loaded = (None, {}, [artifact])
+			else:
+				loaded = (pom.get_dependencies(),
+						pom.get_dependency_management(), [])
+		except PomNotFound as e:
+			loaded = (None, {}, [e.artifact])
+		except (KeyError, ElementTree.ParseError):
+			# A malformed POM, or a dependency without a version that is not
+			# managed either
+			loaded = (None, {}, [artifact])
+		with self.__lock:
+			self.__loaded[artifact] = loaded
+		return loaded
+
+	def resolve(self, roots):
+		"""Resolves the dependencies of all roots and returns a
+		Resolution."""
+		resolution = Resolution()
+		frontier = []
+		for root in roots:
+			key = (root.group, root.artifact)
+			if key not in resolution.artifacts:
+				resolution.artifacts[key] = root
+				resolution.depths[key] = 0
+				# The management of a root is known once its POM is loaded
+				frontier.append((root, tuple(root.exclusions), None))
+		depth = 0
+		with ThreadPool(self.workers) as pool:
+			while frontier:
+				depth += 1
+				results = pool.map(self.load,
+								[artifact for artifact, _, _ in frontier])
+				next_frontier = []
+				for (artifact, exclusions, management), (dependencies,
+						managed, missing) in zip(frontier, results):
+					for coordinate in missing:
+						if coordinate not in resolution.missing:
+							resolution.missing.append(coordinate)
+					selected = resolution.dependencies[artifact] = []
+					if dependencies is None:
+						continue
+					# Versions declared by a root itself are not managed
+					direct = management is None
+					if direct:
+						management = managed
+					for dependency in dependencies:
+						if any(exclusion.is_same_artifact(dependency)
+								for exclusion in exclusions):
+							continue
+						if not direct:
+							dependency = _manage(dependency, management)
+						key = (dependency.group, dependency.artifact)
+						if key not in resolution.artifacts:
+							resolution.artifacts[key] = dependency
+							resolution.depths[key] = depth
+							next_frontier.append((dependency, exclusions
+									+ tuple(dependency.exclusions),
+									management))
+						selected.append(resolution.artifacts[key])
+				frontier = next_frontier
+		return resolution
+
+def _manage(dependency, management):
+	"""Returns dependency with the version set by management, a dependency
+	management dict (see Pom.get_dependency_management())."""
+	version = management.get((dependency.group, dependency.artifact),
+							(None, None))[0]
+	if version is None or version == dependency.version:
+		return dependency
+	managed = Artifact(dependency.group, dependency.artifact, version)
+	managed.exclusions = dependency.exclusions
+	return managed
+
 class _RepositoryManager(AbstractMPBorg):
 	def __init__(self):
 		AbstractMPBorg.__init__(self)
@@ -525,9 +838,65 @@ class _RepositoryManager(AbstractMPBorg):
 					reps.append(content)
 		return ''.join(reps)
 
+class MavenCacheManager():
+	"""
+	Persistent cache of Maven documents. POMs are kept per artifact (see
+	*_artifact_pom) and every document fetched from a remote repository is kept
+	per URL (see MavenHttpRemoteRepos.fetch). Content is stored once however
+	many keys refer to it. Documents of snapshots expire after snapshot_ttl
+	seconds, everything else is kept until evicted to stay within max_size.
+
+	Jars are kept apart, in jars (stored at jars_path, path + '.jars' if None),
+	within a budget of jars_max_size. A few large jars would otherwise evict
+	the POMs dependency resolution relies on.
+	"""
+	def __init__(self, path=MAVEN_CACHE, max_size=DOCUMENT_CACHE_SIZE,
+				snapshot_ttl=VOLATILE_TTL, jars_path=None,
+				jars_max_size=JAR_CACHE_SIZE):
+		self.documents = DocumentCache(path, max_size, snapshot_ttl)
+		self.jars = DocumentCache(path + '.jars' if jars_path is None
+								else jars_path, jars_max_size, snapshot_ttl)
+
+	def __key(self, artifact, ext):
+		return '%s:%s' % (ext, artifact)
+
+	def is_artifact_in_cache(self, artifact, jar=False):
+		"""Returns True if the POM (and the jar, if jar is True) of artifact is
+		cached."""
+		stores = [('pom', self.documents)]
+		if jar:
+			stores.append(('jar', self.jars))
+		return all(self.__key(artifact, ext) in store
+				and not store.is_missing(self.__key(artifact, ext))
+				for ext, store in stores)
+
+	def get_artifact_pom(self, artifact):
+		data = self.documents.get(self.__key(artifact, 'pom'))
+		return data.decode('utf-8') if data is not None else None
+
+	def put_artifact_pom(self, artifact, pom):
+		self.documents.put(self.__key(artifact, 'pom'), pom,
+						artifact.is_snapshot())
+
+	def get_artifact_jar(self, artifact):
+		return self.jars.get(self.__key(artifact, 'jar'))
+
+	def put_artifact_jar(self, artifact, data):
+		self.jars.put(self.__key(artifact, 'jar'), data, artifact.is_snapshot())
+
+	def close(self):
+		self.documents.close()
+		self.jars.close()
+
+# Cache used by the repositories and POMs of this module
+cache_manager = MavenCacheManager()
+
 class MavenManager(BaseManager): pass
 MavenManager.register('RepositoryManager', _RepositoryManager)
 
 # Maven Plugin's manager instance
 __maven_manager = MavenManager()
 __maven_manager.start()
+
+# Repository manager used by the module level helpers, created on first use
+__REPOS_MANAGER = []
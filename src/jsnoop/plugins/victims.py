@@ -1,12 +1,17 @@
 import json
-import pickle
+import sqlite3
+from collections.abc import Mapping
 from urllib.request import urlopen
 from datetime import datetime, MINYEAR
-from os.path import isfile
+from os import getpid
+from threading import Lock
+from urllib.request import pathname2url
 
 VICTIMS_URI = 'http://victi.ms'
 TIMEOUT = 1
-VICTIMS_CACHE = 'victims.cache'
+# Size of the memory mapping used for read-only databases
+MMAP_SIZE = 1024 * 1024 * 1024
+VICTIMS_CACHE = 'victims.db'
 DATE_FRMT = '%Y-%m-%dT%H:%M:%S'
 
 def fetch_json(timestamp, server=VICTIMS_URI, is_removals=False):
@@ -28,19 +33,94 @@ def fetch_json(timestamp, server=VICTIMS_URI, is_removals=False):
 		data = []
 	return data
 
+_SCHEMA = [
+	'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)',
+	'CREATE TABLE IF NOT EXISTS entries (hash TEXT PRIMARY KEY, cves TEXT, '
+			'name TEXT, vendor TEXT, version TEXT, class_count INTEGER)',
+	# Inverted index used for class based subset matching
+	'CREATE TABLE IF NOT EXISTS classes (sha512 TEXT, entry TEXT, '
+			'PRIMARY KEY (sha512, entry)) WITHOUT ROWID',
+	'CREATE INDEX IF NOT EXISTS classes_entry ON classes (entry)',
+	# Used to match resolved dependencies by their coordinates
+	'CREATE INDEX IF NOT EXISTS entries_name ON entries (name, version)',
+]
+
+class _Entries(Mapping):
+	"""Read-only mapping view over the entries table. Lookups are answered by
+	the database, nothing is loaded up front."""
+	def __init__(self, connection, lock):
+		self.__connection = connection
+		self.__lock = lock
+
+	def __getitem__(self, key):
+		with self.__lock:
+			row = self.__connection.execute('SELECT hash, cves, name, vendor, '
+					'version FROM entries WHERE hash = ?', (key,)).fetchone()
+			if row is None:
+				raise KeyError(key)
+			classes = self.__connection.execute('SELECT sha512 FROM classes '
+					'WHERE entry = ?', (key,)).fetchall()
+		entry = dict(zip(['hash', 'cves', 'name', 'vendor', 'version'], row))
+		entry['cves'] = json.loads(entry['cves'])
+		entry['classes'] = [sha512 for (sha512,) in classes]
+		return entry
+
+	def __contains__(self, key):
+		with self.__lock:
+			return self.__connection.execute('SELECT 1 FROM entries WHERE '
+					'hash = ?', (key,)).fetchone() is not None
+
+	def __iter__(self):
+		with self.__lock:
+			rows = self.__connection.execute(
+					'SELECT hash FROM entries').fetchall()
+		for (key,) in rows:
+			yield key
+
+	def __len__(self):
+		with self.__lock:
+			return self.__connection.execute(
+					'SELECT COUNT(*) FROM entries').fetchone()[0]
+
 class LocalDatabase():
 	"""
 	Class for handling a local instance of the victims database. We store only
 	those information we need.
+
+	The database lives in an SQLite file (cache), opening it does not load
+	anything and lookups only touch the rows they need. Updates from the
+	server are applied as deltas. If no_cache is set, an in-memory database is
+	used instead.
+
+	If readonly is set, an existing cache is attached without updating it. The
+	file is memory-mapped, so any number of processes attaching the same cache
+	share a single copy of it through the page cache. See shared_database().
+
+	The database can be shared by threads.
 	"""
-	def __init__(self, server=VICTIMS_URI, cache=VICTIMS_CACHE, no_cache=False):
-		timebuffer = '000' if MINYEAR == 1 else ''
-		timestamp = datetime(MINYEAR, 1, 1).strftime(timebuffer + DATE_FRMT)
-		self.__db = {'updated': timestamp, 'entries': []}
+	# Digests of scanned files used for matching, see jsnoop.checksum
+	required_checksums = ['sha512']
+
+	def __init__(self, server=VICTIMS_URI, cache=VICTIMS_CACHE, no_cache=False,
+				readonly=False):
 		self.cache = None if no_cache else cache
 		self.server = server
-		self.__load()
-		self.update()
+		self.readonly = readonly
+		self.__lock = Lock()
+		if readonly:
+			if self.cache is None:
+				raise ValueError('A read-only database requires a cache')
+			uri = 'file:%s?mode=ro&immutable=1' % pathname2url(self.cache)
+			self.__connection = sqlite3.connect(uri, uri=True,
+												check_same_thread=False)
+			self.__connection.execute('PRAGMA mmap_size = %d' % MMAP_SIZE)
+		else:
+			self.__connection = sqlite3.connect(self.cache or ':memory:',
+												check_same_thread=False)
+			with self.__connection as connection:
+				for statement in _SCHEMA:
+					connection.execute(statement)
+			self.update()
 
 	@property
 	def entries(self):
@@ -50,30 +130,28 @@ class LocalDatabase():
 		is a dict containtain the keys 'hash', 'cves', 'name', 'vendor',
 		'version' and 'classes' (a list of sha512 sums).
 		"""
-		return self.__db['entries']
+		return _Entries(self.__connection, self.__lock)
 
 	@property
 	def last_updated(self):
 		"""
 		Indicates when this database content was last updated.
 		"""
-		return self.__db['updated']
-
-	def __load(self):
-		if self.cache and isfile(self.cache):
-			with open(self.cache, "rb") as f:
-				self.__db = pickle.load(f)
-
-	def __store(self):
-		if self.cache:
-			with open(self.cache, "wb") as f:
-				pickle.dump(self.__db, f, pickle.HIGHEST_PROTOCOL)
+		with self.__lock:
+			row = self.__connection.execute(
+					"SELECT value FROM meta WHERE key = 'updated'").fetchone()
+		if row is not None:
+			return row[0]
+		timebuffer = '000' if MINYEAR == 1 else ''
+		return datetime(MINYEAR, 1, 1).strftime(timebuffer + DATE_FRMT)
 
 	def update(self):
 		"""
 		Updates the database with changes from the server after the last_updated
 		timestamp.
 		"""
+		if self.readonly:
+			raise ValueError('Cannot update a read-only database')
 		timestamp = self.last_updated
 		update_time = datetime.now().strftime(DATE_FRMT)
 		updates = self.__parse_entries(fetch_json(timestamp, self.server))
@@ -81,16 +159,19 @@ class LocalDatabase():
 												True))
 		if len(updates) > 0 or len(removals) > 0:
 			# We need to process only if there are some changes
-			self.__merge(updates, removals)
-			self.__db['updated'] = update_time
-			self.__store()
+			with self.__lock, self.__connection as connection:
+				self.__merge(connection, updates, removals)
+				connection.execute('INSERT OR REPLACE INTO meta (key, value) '
+						"VALUES ('updated', ?)", (update_time,))
 
 	def __parse_entry(self, entry):
 		attrs = ['hash', 'cves', 'name', 'vendor', 'version']
 		fields = entry['fields']
 		parsed = { k:fields[k] for k in attrs }
-		# For class based subset matching
-		parsed['classes'] = list(fields['hashes']['sha512']['files'].values())
+		# For class based subset matching, duplicates are dropped so that the
+		# length of the list is the number of distinct classes
+		files = fields['hashes']['sha512']['files']
+		parsed['classes'] = list(dict.fromkeys(files.values()))
 		return parsed
 
 	def __parse_entries(self, entries):
@@ -100,31 +181,90 @@ class LocalDatabase():
 			parsed[entry['hash']] = entry
 		return parsed
 
-	def __merge(self, updates={}, removals={}):
-		new_entries = {}
-		entries = self.__db['entries']
-		# Process the updates first
-		for key in updates:
-			new_entries[key] = updates[key]
-		# Add old entries that were not updated nor removed
-		for key in entries:
-			if key not in new_entries and key not in removals:
-				new_entries[key] = entries[key]
-		self.__db['entries'] = new_entries
+	def __merge(self, connection, updates={}, removals={}):
+		"""Applies updates and removals as deltas, only the affected rows of
+		the entries table and the class index are touched."""
+		stale = [(key,) for key in list(removals) + list(updates)]
+		connection.executemany('DELETE FROM entries WHERE hash = ?', stale)
+		connection.executemany('DELETE FROM classes WHERE entry = ?', stale)
+		# Updates win over removals of the same entry
+		connection.executemany('INSERT INTO entries (hash, cves, name, vendor, '
+				'version, class_count) VALUES (?, ?, ?, ?, ?, ?)',
+				[(e['hash'], json.dumps(e['cves']), e['name'], e['vendor'],
+				e['version'], len(e['classes'])) for e in updates.values()])
+		connection.executemany('INSERT INTO classes (sha512, entry) '
+				'VALUES (?, ?)', [(sha512, e['hash']) for e in updates.values()
+				for sha512 in e['classes']])
 
 	def match_archive(self, sha512):
 		"""
 		Gets a list of cves if the given hash matches any entry in the database.
 		"""
+		with self.__lock:
+			row = self.__connection.execute('SELECT cves FROM entries WHERE '
+					'hash = ?', (sha512,)).fetchone()
+		return [] if row is None else json.loads(row[0])
+
+	def match_artifact(self, name, version):
+		"""
+		Gets a list of cves if an entry with the given name (eg: the maven
+		artifactId) and version is in the database.
+		"""
+		with self.__lock:
+			rows = self.__connection.execute('SELECT cves FROM entries WHERE '
+					'name = ? AND version = ? ORDER BY hash',
+					(name, version)).fetchall()
 		result = []
-		if sha512 in self.entries:
-			result = self.entries[sha512]['cves']
+		for (cves,) in rows:
+			for cve in json.loads(cves):
+				if cve not in result:
+					result.append(cve)
 		return result
 
 	def match_file_set(self, hashes):
 		"""
 		Gets a list of cves if the given list of hashes matches any
 		complet set of classes for any entry in the database.
+
+		The class index maps each class sha512 to the entries containing it,
+		so only the entries sharing at least one class with the given set are
+		ever looked at.
 		"""
-		# TODO: Implement when v2 is out
-		return []
+		connection = self.__connection
+		with self.__lock, connection:
+			connection.execute('CREATE TEMP TABLE IF NOT EXISTS probe '
+					'(sha512 TEXT PRIMARY KEY) WITHOUT ROWID')
+			connection.execute('DELETE FROM probe')
+			connection.executemany('INSERT OR IGNORE INTO probe (sha512) '
+					'VALUES (?)', [(sha512,) for sha512 in hashes])
+			rows = connection.execute('SELECT entries.cves FROM (SELECT '
+					'classes.entry AS entry, COUNT(*) AS hits FROM probe JOIN '
+					'classes ON classes.sha512 = probe.sha512 GROUP BY '
+					'classes.entry) AS matched JOIN entries ON entries.hash = '
+					'matched.entry WHERE matched.hits = entries.class_count '
+					'ORDER BY entries.hash').fetchall()
+			connection.execute('DELETE FROM probe')
+		result = []
+		for (cves,) in rows:
+			for cve in json.loads(cves):
+				if cve not in result:
+					result.append(cve)
+		return result
+
+	def close(self):
+		with self.__lock:
+			self.__connection.close()
+
+# Read-only databases attached by this process, keyed by cache path
+__SHARED = {}
+
+def shared_database(cache=VICTIMS_CACHE):
+	"""Returns a read-only LocalDatabase attached to cache. The database is
+	opened once per process and reused by every later call, which makes this
+	suitable for pool workers: the parent creates (and updates) the cache once
+	and workers only attach to it. Threads share the database of their
+	process."""
+	key = (getpid(), cache)
+	if key not in __SHARED:
+		__SHARED[key] = LocalDatabase(cache=cache, readonly=True)
+	return __SHARED[key]
@@ -0,0 +1,125 @@
+"""
+Compact in-memory representation of the information collected per file. A
+FileRecord keeps its digests as raw bytes, shares interned strings for the
+values repeated across a scan (paths, extensions, handler names) and refers to
+its parent archive by an integer id into the RecordTable of the scan instead of
+repeating the parent's sha512. Records are converted to the info dicts handed
+out by handlers' info() only at the output boundary, see to_dict().
+"""
+from sys import intern
+from threading import Lock
+from jsnoop.checksum import available_algorithms
+
+# Fields of an info dict that hold hex digests
+DIGESTS = available_algorithms()
+
+# Fields of an info dict held by the slots of a FileRecord
+_BASE_FIELDS = ('path', 'name', 'type', 'parent', 'handler')
+
+# Shared algorithm tuples, so records do not each hold their own
+_ALGORITHMS = {}
+
+def algorithms_tuple(algorithms):
+	"""Returns the shared tuple of the given digest algorithm names."""
+	algorithms = tuple(algorithms)
+	return _ALGORITHMS.setdefault(algorithms, algorithms)
+
+class RecordTable():
+	"""Per-scan table of the parent archives referred to by records. Each
+	parent sha512 is stored once, as raw bytes, and records refer to it by
+	its index. The table can be shared by threads."""
+	def __init__(self):
+		self.__ids = {}
+		self.parents = []
+		self.__lock = Lock()
+
+	def parent_id(self, sha512):
+		"""Returns the id of the parent with the given sha512 (hex or raw),
+		adding it if required. None is returned for None."""
+		if sha512 is None:
+			return None
+		if isinstance(sha512, str):
+			sha512 = bytes.fromhex(sha512)
+		parent = self.__ids.get(sha512)
+		if parent is None:
+			with self.__lock:
+				parent = self.__ids.get(sha512)
+				if parent is None:
+					parent = self.__ids[sha512] = len(self.parents)
+					self.parents.append(sha512)
+		return parent
+
+	def parent_sha512(self, parent):
+		"""Returns the hex sha512 of the parent with the given id."""
+		return None if parent is None else self.parents[parent].hex()
+
+	def __len__(self):
+		return len(self.parents)
+
+class FileRecord():
+	"""The information collected for a single file. digests holds the raw
+	digest of each of the algorithms, in the same order. details holds the
+	handler specific information, if any, or None."""
+	__slots__ = ('path', 'name', 'type', 'parent', 'handler', 'algorithms',
+				'digests', 'details')
+
+	def __init__(self, path, name, type, parent, handler, algorithms=(),
+				digests=(), details=None):
+		self.path = intern(path)
+		self.name = name
+		self.type = intern(type)
+		self.parent = parent
+		self.handler = intern(handler)
+		self.algorithms = algorithms_tuple(algorithms)
+		self.digests = tuple(digests)
+		self.details = details or None
+
+	def __eq__(self, other):
+		if not isinstance(other, FileRecord):
+			return NotImplemented
+		return all(getattr(self, slot) == getattr(other, slot)
+				for slot in self.__slots__)
+
+	def __repr__(self):
+		return 'FileRecord(%r, %r, %r)' % (self.path, self.name, self.handler)
+
+	def digest(self, algorithm):
+		"""Returns the raw digest of algorithm, None if it was not
+		computed."""
+		try:
+			return self.digests[self.algorithms.index(algorithm)]
+		except ValueError:
+			return None
+
+	def get(self, key, default=None):
+		"""Returns the value of a handler specific detail."""
+		if self.details is None:
+			return default
+		return self.details.get(key, default)
+
+	def to_dict(self, table):
+		"""Returns the info dict of this record, table being the RecordTable
+		of the scan it belongs to."""
+		info = {
+			'path'		: self.path,
+			'name'		: self.name,
+			'type'		: self.type,
+			'parent'	: table.parent_sha512(self.parent),
+			'handler'	: self.handler
+		}
+		for algorithm, digest in zip(self.algorithms, self.digests):
+			info[algorithm] = digest.hex()
+		if self.details is not None:
+			info.update(self.details)
+		return info
+
+	@classmethod
+	def from_dict(cls, info, table):
+		"""Returns the record of an info dict, adding its parent to the
+		RecordTable table."""
+		algorithms = [key for key in info if key in DIGESTS]
+		details = {key: value for key, value in info.items()
+				if key not in DIGESTS and key not in _BASE_FIELDS}
+		return cls(info['path'], info['name'], info['type'],
+				table.parent_id(info['parent']), info['handler'], algorithms,
+				[bytes.fromhex(info[key]) for key in algorithms], details)
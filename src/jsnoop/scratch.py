@@ -0,0 +1,137 @@
+"""
+Scratch space for handlers that need their input as a file on disk. A scan
+uses a single temporary root directory. Slots within it are reused once
+released, and the whole root is removed deterministically when the scratch
+space is closed (or the with block using it is left).
+
+Handlers do not get a scratch space passed to them. Instead, the owner (eg: a
+Package) activates it around handler construction, and handlers use current().
+Outside of any active scratch space, a process wide default is used. That
+default is removed at interpreter exit.
+"""
+import atexit
+import os
+from os.path import basename, dirname, join, normpath
+from shutil import rmtree, copyfileobj
+from tempfile import mkdtemp
+from threading import Lock, local
+
+# Root under which scratch directories are created, None for the system default.
+# Point this at a tmpfs mount (eg: /dev/shm) to keep scratch files in memory.
+SCRATCH_ROOT = None
+
+class ScratchSpace():
+	"""A per-scan temporary root, created under root when the first file is
+	persisted. If use_memfd is set and the platform supports it, files are
+	backed by anonymous memory (memfd_create) and exposed through
+	/proc/<pid>/fd instead of being written to the file system."""
+	def __init__(self, root=SCRATCH_ROOT, use_memfd=False):
+		# Created lazily, most scans never persist anything
+		self.root = None
+		self.__parent = root
+		self.pid = os.getpid()
+		self.use_memfd = use_memfd and hasattr(os, 'memfd_create')
+		self.__lock = Lock()
+		self.__slots = 0
+		self.__free = []
+		self.__allocated = {}
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def activate(self):
+		"""Returns a context manager making this the current() scratch space
+		of the calling thread for the duration of the with block."""
+		return _Activation(self)
+
+	def persist(self, filepath, fileobj):
+		"""Writes the contents of fileobj to scratch space and returns the path
+		of the copy. The basename of filepath is preserved, except for memfd
+		backed files."""
+		fileobj.seek(0)
+		if self.use_memfd:
+			fd = os.memfd_create(basename(filepath) or 'jsnoop')
+			with open(fd, 'wb', closefd=False) as f:
+				copyfileobj(fileobj, f)
+			path = '/proc/%d/fd/%d' % (os.getpid(), fd)
+			slot = fd
+		else:
+			with self.__lock:
+				if self.root is None:
+					self.root = mkdtemp(prefix='jsnoop.scratch.',
+										dir=self.__parent)
+				slot = self.__free.pop() if self.__free else self.__new_slot()
+			relative = normpath(filepath.lstrip(os.sep))
+			if relative.startswith(os.pardir):
+				# Never write outside of the slot
+				relative = basename(filepath)
+			path = join(self.root, str(slot), relative)
+			os.makedirs(dirname(path), exist_ok=True)
+			with open(path, 'wb') as f:
+				copyfileobj(fileobj, f)
+		fileobj.seek(0)
+		with self.__lock:
+			self.__allocated[path] = slot
+		return path
+
+	def __new_slot(self):
+		self.__slots += 1
+		return self.__slots
+
+	def release(self, path):
+		"""Removes a file created by persist() and frees its slot."""
+		with self.__lock:
+			slot = self.__allocated.pop(path, None)
+		if slot is None:
+			return
+		if self.use_memfd:
+			os.close(slot)
+			return
+		slot_dir = join(self.root, str(slot))
+		rmtree(slot_dir, ignore_errors=True)
+		os.makedirs(slot_dir, exist_ok=True)
+		with self.__lock:
+			self.__free.append(slot)
+
+	def close(self):
+		"""Releases all files and removes the scratch root. Forked children
+		leave the scratch space of their parent alone."""
+		if os.getpid() != self.pid:
+			return
+		with self.__lock:
+			allocated, self.__allocated = self.__allocated, {}
+		if self.use_memfd:
+			for fd in allocated.values():
+				os.close(fd)
+		if self.root is not None:
+			rmtree(self.root, ignore_errors=True)
+
+class _Activation():
+	def __init__(self, scratch):
+		self.scratch = scratch
+
+	def __enter__(self):
+		self.previous = getattr(_active, 'scratch', None)
+		_active.scratch = self.scratch
+		return self.scratch
+
+	def __exit__(self, *exc_info):
+		_active.scratch = self.previous
+
+_active = local()
+__default = []
+
+def current():
+	"""Returns the scratch space activated on this thread, falling back to a
+	process wide default."""
+	scratch = getattr(_active, 'scratch', None)
+	if scratch is not None:
+		return scratch
+	if not __default or __default[0][0] != os.getpid():
+		scratch = ScratchSpace()
+		__default[:] = [(os.getpid(), scratch)]
+		atexit.register(scratch.close)
+	return __default[0][1]
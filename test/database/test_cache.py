@@ -0,0 +1,142 @@
+from os import close, remove
+from os.path import exists
+from tempfile import mkstemp
+from unittest import TestCase, main
+from jsnoop.database.cache import ResultCache, DocumentCache
+
+class TestResultCache(TestCase):
+	def setUp(self):
+		fd, self.path = mkstemp(prefix='jsnoop.test.cache.')
+		close(fd)
+		self.cache = ResultCache(self.path, max_size=4096)
+		self.records = [{'name': 'A.class', 'sha512': 'aa', 'version': (51, 0)}]
+
+	def test_roundtrip(self):
+		self.assertIsNone(self.cache.get('abc'))
+		self.cache.put('abc', self.records)
+		self.assertIn('abc', self.cache)
+		self.assertEqual(self.cache.get('abc'), self.records)
+		# A fresh instance reads the same store
+		cache = ResultCache(self.path)
+		self.assertEqual(cache.get('abc'), self.records)
+		cache.close()
+
+	def test_lru_eviction(self):
+		payload = ['x' * 1500]
+		self.cache.put('first', payload)
+		self.cache.put('second', payload)
+		# Touch the first entry so that the second is the least recently used
+		self.cache.get('first')
+		self.cache.put('third', payload)
+		self.assertIn('first', self.cache)
+		self.assertNotIn('second', self.cache)
+		self.assertIn('third', self.cache)
+
+	def test_usage(self):
+		self.cache.put('first', ['x' * 1000])
+		self.cache.put('first', ['x' * 2000])
+		self.cache.put('second', ['x' * 3000])
+		connection = self.cache.connection
+		total = connection.execute('SELECT total FROM usage').fetchone()[0]
+		self.assertEqual(total, connection.execute(
+				'SELECT SUM(size) FROM results').fetchone()[0])
+		self.assertNotIn('first', self.cache)
+		self.assertEqual(connection.execute(
+				'PRAGMA journal_mode').fetchone()[0], 'wal')
+
+	def test_batched_access(self):
+		self.cache.put('abc', self.records)
+		accessed = 'SELECT accessed FROM results WHERE sha512 = ?'
+		before = self.cache.connection.execute(accessed, ('abc',)).fetchone()
+		self.cache.get('abc')
+		# Reads do not write, the access time is stored on close
+		self.assertEqual(self.cache.connection.execute(accessed,
+				('abc',)).fetchone(), before)
+		self.cache.close()
+		self.assertGreaterEqual(self.cache.connection.execute(accessed,
+				('abc',)).fetchone(), before)
+
+	def test_legacy_entry(self):
+		with self.cache.connection as connection:
+			connection.execute('INSERT INTO results VALUES (?, ?, ?, ?)',
+					('abc', b'\x80\x04\x95', 3, 0))
+		self.assertIsNone(self.cache.get('abc'))
+
+	def tearDown(self):
+		self.cache.close()
+		if exists(self.path):
+			remove(self.path)
+
+class TestDocumentCache(TestCase):
+	def setUp(self):
+		fd, self.path = mkstemp(prefix='jsnoop.test.documents.')
+		close(fd)
+		self.cache = DocumentCache(self.path, max_size=4096)
+
+	def test_roundtrip(self):
+		self.assertIsNone(self.cache.get('a'))
+		self.assertNotIn('a', self.cache)
+		self.cache.put('a', '<project/>')
+		self.cache.put('b', b'<project/>')
+		self.assertEqual(self.cache.get('a'), b'<project/>')
+		# Both keys share the same content
+		count = self.cache.connection.execute(
+				'SELECT COUNT(*) FROM documents').fetchone()[0]
+		self.assertEqual(count, 1)
+		cache = DocumentCache(self.path)
+		self.assertEqual(cache.get('b'), b'<project/>')
+		cache.close()
+
+	def test_missing(self):
+		self.cache.put_missing('a')
+		self.assertIn('a', self.cache)
+		self.assertTrue(self.cache.is_missing('a'))
+		self.assertIsNone(self.cache.get('a'))
+		expired = DocumentCache(self.path, missing_ttl=-1)
+		self.assertNotIn('a', expired)
+		expired.close()
+
+	def test_volatile(self):
+		self.cache.put('release', b'1')
+		self.cache.put('snapshot', b'2', volatile=True)
+		expired = DocumentCache(self.path, volatile_ttl=-1)
+		self.assertEqual(expired.get('release'), b'1')
+		self.assertIsNone(expired.get('snapshot'))
+		expired.close()
+
+	def test_eviction(self):
+		self.cache.put('first', b'1' * 1500)
+		self.cache.put('second', b'2' * 1500)
+		self.cache.get('first')
+		# Replaced content is no longer referenced and goes first
+		self.cache.put('first', b'3' * 1500)
+		self.cache.put('third', b'4' * 1500)
+		self.assertEqual(self.cache.get('first'), b'3' * 1500)
+		self.assertNotIn('second', self.cache)
+		self.assertIn('third', self.cache)
+		connection = self.cache.connection
+		self.assertEqual(connection.execute('SELECT total FROM usage')
+				.fetchone(), connection.execute('SELECT SUM(size) '
+				'FROM documents').fetchone())
+		self.assertEqual(connection.execute(
+				'PRAGMA journal_mode').fetchone()[0], 'wal')
+
+	def test_batched_access(self):
+		self.cache.put('a', b'1')
+		accessed = 'SELECT accessed FROM keys WHERE key = ?'
+		before = self.cache.connection.execute(accessed, ('a',)).fetchone()
+		self.cache.get('a')
+		# Reads do not write, the access time is stored on close
+		self.assertEqual(self.cache.connection.execute(accessed,
+				('a',)).fetchone(), before)
+		self.cache.close()
+		self.assertGreaterEqual(self.cache.connection.execute(accessed,
+				('a',)).fetchone(), before)
+
+	def tearDown(self):
+		self.cache.close()
+		if exists(self.path):
+			remove(self.path)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,43 @@
+import zipfile
+from io import BytesIO
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+from time import sleep
+from unittest import TestCase, main
+from jsnoop.handlers.archivefile import ArchiveFile
+
+class _Archive():
+	"""Stand-in for a stateful archive object (eg: a tar stream), it records
+	extractions that overlap."""
+	def __init__(self):
+		self.lock = Lock()
+		self.active = 0
+		self.overlaps = 0
+
+	def extract(self, member, inmem):
+		with self.lock:
+			self.active += 1
+			if self.active > 1:
+				self.overlaps += 1
+		sleep(0.01)
+		with self.lock:
+			self.active -= 1
+		return BytesIO(member)
+
+class TestArchiveFile(TestCase):
+	def setUp(self):
+		data = BytesIO()
+		with zipfile.ZipFile(data, 'w') as archive:
+			archive.writestr('a.txt', b'a')
+		self.handler = ArchiveFile('lib.jar', data)
+
+	def test_serialized_extraction(self):
+		self.handler.archive = _Archive()
+		members = [b'%d' % i for i in range(8)]
+		with ThreadPool(4) as pool:
+			fileobjs = pool.map(self.handler.get_file_obj, members)
+		self.assertEqual([fileobj.read() for fileobj in fileobjs], members)
+		self.assertEqual(self.handler.archive.overlaps, 0)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,41 @@
+from io import BytesIO
+from unittest import TestCase, main
+from jsnoop.handlers import get_handler_obj, sniff_module
+
+class TestDispatch(TestCase):
+	def test_sniff(self):
+		self.assertEqual(sniff_module(b'PK\x03\x04\x14\x00'), 'archivefile')
+		self.assertEqual(sniff_module(b'\x1f\x8b\x08\x00'), 'archivefile')
+		self.assertEqual(sniff_module(b'BZh91AY'), 'archivefile')
+		self.assertEqual(sniff_module(b'\x00' * 257 + b'ustar\x0000'),
+						'archivefile')
+		self.assertEqual(sniff_module(b'\xca\xfe\xba\xbe\x00\x00\x00\x32'),
+						'javaclass')
+		self.assertEqual(sniff_module(b'\x30\x82\x03\x99\x06\x09'), 'signature')
+		self.assertIsNone(sniff_module(b'Manifest-Version: 1.0\n'))
+		self.assertIsNone(sniff_module(b'0123'))
+		self.assertIsNone(sniff_module(b''))
+
+	def test_content_wins(self):
+		# A class file with a misleading name is still handled as a class
+		data = b'\xca\xfe\xba\xbe\x00\x00\x00\x32' + b'\x00' * 16
+		handler = get_handler_obj('lib/Foo.bin', BytesIO(data))
+		self.assertEqual(handler.__class__.__name__, 'ClassFile')
+
+	def test_universal_binary(self):
+		# Mach-O universal binaries share the magic, not the version
+		data = b'\xca\xfe\xba\xbe\x00\x00\x00\x02' + b'\x01' * 32
+		self.assertIsNone(sniff_module(data))
+		handler = get_handler_obj('native/libfoo.jnilib', BytesIO(data))
+		self.assertEqual(handler.__class__.__name__, 'SimpleFile')
+
+	def test_extension_fallback(self):
+		manifest = b'Manifest-Version: 1.0\nCreated-By: test\n\n'
+		handler = get_handler_obj('META-INF/MANIFEST.MF', BytesIO(manifest))
+		self.assertEqual(handler.__class__.__name__, 'ManifestFile')
+		self.assertEqual(handler.manifestinfo['Created-By'], 'test')
+		handler = get_handler_obj('README.txt', BytesIO(b'hello'))
+		self.assertEqual(handler.__class__.__name__, 'SimpleFile')
+
+if __name__ == '__main__':
+	main()
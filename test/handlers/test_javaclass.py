@@ -0,0 +1,95 @@
+import struct
+import zipfile
+from io import BytesIO
+from os import close, remove
+from tempfile import mkstemp
+from unittest import TestCase, main
+from jsnoop.handlers.javaclass import ClassFile, ClassStructure
+from jsnoop.package import Package
+
+def utf8(value):
+	data = value.encode('utf-8')
+	return struct.pack('>BH', 1, len(data)) + data
+
+def build_class():
+	"""Builds the class file of:
+	public class com.example.Foo implements java.io.Serializable {
+		int count;
+		public com.example.Foo();
+	}"""
+	pool = [
+		utf8('com/example/Foo'),			# 1
+		struct.pack('>BH', 7, 1),			# 2
+		utf8('java/lang/Object'),			# 3
+		struct.pack('>BH', 7, 3),			# 4
+		utf8('java/io/Serializable'),		# 5
+		struct.pack('>BH', 7, 5),			# 6
+		struct.pack('>BQ', 5, 1 << 40),		# 7 and 8 (Long)
+		utf8('count'),						# 9
+		utf8('I'),							# 10
+		utf8('<init>'),						# 11
+		utf8('()V'),						# 12
+		utf8('Code'),						# 13
+	]
+	data = b'\xca\xfe\xba\xbe' + struct.pack('>HHH', 0, 0x32, 14)
+	data += b''.join(pool)
+	data += struct.pack('>HHHH', 0x21, 2, 4, 1) + struct.pack('>H', 6)
+	# Field without attributes
+	data += struct.pack('>H', 1) + struct.pack('>HHHH', 0, 9, 10, 0)
+	# Method with a Code attribute that has to be skipped
+	data += struct.pack('>H', 1) + struct.pack('>HHHH', 1, 11, 12, 1)
+	data += struct.pack('>HI', 13, 5) + b'\x00' * 5
+	return data + struct.pack('>H', 0)
+
+class TestClassFile(TestCase):
+	def setUp(self):
+		self.data = build_class()
+
+	def test_structure(self):
+		structure = ClassStructure(self.data)
+		self.assertEqual(structure.this_class, 'com/example/Foo')
+		self.assertEqual(structure.super_class, 'java/lang/Object')
+		self.assertEqual(structure.interfaces, ['java/io/Serializable'])
+		self.assertEqual(structure.fields, [(0, 'count', 'I')])
+		self.assertEqual(structure.methods, [(1, '<init>', '()V')])
+		self.assertEqual(structure.constant_pool.class_names(),
+				['com/example/Foo', 'java/lang/Object', 'java/io/Serializable'])
+
+	def test_invalid(self):
+		self.assertRaises(ValueError, ClassStructure, b'\x00' * 16)
+
+	def test_truncated(self):
+		for size in (8, 20, len(self.data) // 2, len(self.data) - 3):
+			self.assertRaises(ValueError, ClassStructure, self.data[:size])
+		# The this_class index points past the constant pool
+		end = self.data.index(struct.pack('>HHHH', 0x21, 2, 4, 1))
+		corrupt = self.data[:end] + struct.pack('>HHHH', 0x21, 99, 4, 1) + \
+				self.data[end + 8:]
+		self.assertRaises(ValueError, ClassStructure, corrupt)
+		handler = ClassFile('com/example/Foo.class', BytesIO(corrupt))
+		self.assertNotIn('class-name', handler.info())
+
+	def test_handler(self):
+		handler = ClassFile('com/example/Foo.class', BytesIO(self.data))
+		info = handler.info()
+		self.assertEqual(info['version-string'], 'JSE6')
+		self.assertEqual(info['class-name'], 'com/example/Foo')
+		self.assertEqual(info['super-class'], 'java/lang/Object')
+		self.assertEqual(info['interfaces'], ['java/io/Serializable'])
+		self.assertEqual(handler.this_class, 'com/example/Foo')
+		self.assertEqual(handler.methods, [(1, '<init>', '()V')])
+
+	def test_package(self):
+		fd, path = mkstemp(suffix='.jar')
+		close(fd)
+		try:
+			with zipfile.ZipFile(path, 'w') as archive:
+				archive.writestr('com/example/Foo.class', self.data)
+			info = Package(path, process_classes=True).info
+		finally:
+			remove(path)
+		self.assertEqual(info[1]['class-name'], 'com/example/Foo')
+		self.assertEqual(info[1]['interfaces'], ['java/io/Serializable'])
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,76 @@
+from base64 import b64decode
+from io import BytesIO
+from unittest import TestCase, main
+from jsnoop.handlers.signature import decode_signer, der_read, der_children, \
+		SignatureFile
+
+# PKCS#7 SignedData block, as found in META-INF/*.RSA of a signed jar
+SIGNATURE_BLOCK = b64decode("""
+	MIIDmQYJKoZIhvcNAQcCoIIDijCCA4YCAQExDzANBglghkgBZQMEAgEFADALBgkqhkiG9w0BBwGg
+	ggJkMIICYDCCAcmgAwIBAgICEjQwDQYJKoZIhvcNAQELBQAwSzELMAkGA1UEBhMCQVUxDzANBgNV
+	BAoMBmpzbm9vcDEOMAwGA1UECwwFVGVzdHMxGzAZBgNVBAMMEmpzbm9vcCB0ZXN0IHNpZ25lcjAe
+	Fw0yNjEwMTcxOTEwNTNaFw0zNjEwMTQxOTEwNTNaMEsxCzAJBgNVBAYTAkFVMQ8wDQYDVQQKDAZq
+	c25vb3AxDjAMBgNVBAsMBVRlc3RzMRswGQYDVQQDDBJqc25vb3AgdGVzdCBzaWduZXIwgZ8wDQYJ
+	KoZIhvcNAQEBBQADgY0AMIGJAoGBAPZR5Hr7v971BVgUdQzq1PlcE1LFNrSKoNO3zNrGL1Z+wR9d
+	M4UX9pmo35ekANFfc/nbt0ZQZVM8UZrW5ic0vj5fyfLE84htU2VT/X70AhdplWbvXOGQ3OvGyyrc
+	RcK8ZqZJBECwEFiqf5DyuTkzMS8IufPGsqWrOs/gt/uDOH3FAgMBAAGjUzBRMB0GA1UdDgQWBBTB
+	Pi7WLgp1bFeh7xQ26pKNjJKVWTAfBgNVHSMEGDAWgBTBPi7WLgp1bFeh7xQ26pKNjJKVWTAPBgNV
+	HRMBAf8EBTADAQH/MA0GCSqGSIb3DQEBCwUAA4GBAGPjxbseiFpcocfciNsG2nE9SGNpWQtOo16M
+	l7HBHbL1Nbf30Qw83HiqbTZpDCRiLdg1gM27MUlcPr08v8PG6QVzU4NIwCJjilwYyn7BH/hMQx57
+	oqkpiWdbaxc9Q+Q3recKNrQD2vDdI8UomyscJKDSnDbh2YLd+pUdeTKXGbFpMYH6MIH3AgEBMFEw
+	SzELMAkGA1UEBhMCQVUxDzANBgNVBAoMBmpzbm9vcDEOMAwGA1UECwwFVGVzdHMxGzAZBgNVBAMM
+	Empzbm9vcCB0ZXN0IHNpZ25lcgICEjQwDQYJYIZIAWUDBAIBBQAwDQYJKoZIhvcNAQEBBQAEgYAq
+	BSjVdGXYkhgfePsoozOXBJ9rHujHx49t4oABHhys2HVDltgaxaan0vGg9M75KJRCzSV8k+kAkVP9
+	OoM1tMcNwxLnkDe4mRYhy6CnW7kXKcPI9eQfcB4IQ4bLUcZhIgnWvuplEDQr6lWm3NE/IhS6yaxX
+	CXdjZBhCaWlrbh/oWA==
+""")
+
+SIGNER_NAME = 'C=AU, O=jsnoop, OU=Tests, CN=jsnoop test signer'
+
+def indefinite(data):
+	"""Returns the signature block data with the outer SEQUENCE and the [0]
+	content wrapper in the BER indefinite length form."""
+	_, start, end = der_read(data)
+	content_type, content = der_children(data, start, end)
+	return b'\x30\x80' + data[start:content_type[2]] + b'\xa0\x80' + \
+			data[content[1]:content[2]] + b'\x00\x00\x00\x00'
+
+class TestSignature(TestCase):
+	def test_decode_pkcs7(self):
+		signature = decode_signer(SIGNATURE_BLOCK)
+		self.assertEqual(len(signature['certificates']), 1)
+		certificate = signature['certificates'][0]
+		self.assertEqual(certificate['subject'], SIGNER_NAME)
+		self.assertEqual(certificate['issuer'], SIGNER_NAME)
+		self.assertEqual(certificate['serial'], '1234')
+		self.assertEqual(certificate['version'], 3)
+		self.assertEqual(certificate['not-before'], '2026-10-17T19:10:53Z')
+		self.assertEqual(certificate['signature-algorithm'],
+						'sha256WithRSAEncryption')
+		self.assertEqual(signature['signers'], [{
+				'issuer'				: SIGNER_NAME,
+				'serial'				: '1234',
+				'digest-algorithm'		: 'sha256',
+				'signature-algorithm'	: 'rsaEncryption'
+			}])
+
+	def test_decode_indefinite(self):
+		data = indefinite(SIGNATURE_BLOCK)
+		self.assertEqual(der_read(data), (0x30, 2, len(data) - 2))
+		self.assertEqual(decode_signer(data), decode_signer(SIGNATURE_BLOCK))
+		# The end-of-contents octets are required
+		self.assertIsNone(decode_signer(data[:-2]))
+
+	def test_decode_invalid(self):
+		self.assertIsNone(decode_signer(b'not a signature'))
+		self.assertIsNone(decode_signer(SIGNATURE_BLOCK[:200]))
+
+	def test_handler_inmemory(self):
+		handler = SignatureFile('META-INF/SIGNER.RSA', BytesIO(SIGNATURE_BLOCK))
+		info = handler.info()
+		self.assertEqual(info['handler'], 'SignatureFile')
+		self.assertEqual(info['signature']['certificates'][0]['subject'],
+						SIGNER_NAME)
+
+if __name__ == '__main__':
+	main()
@@ -1,7 +1,26 @@
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from os import close, remove
+from os.path import exists
+from tempfile import mkstemp
+from socketserver import ThreadingMixIn
+from threading import Thread
 from unittest import TestCase, main
+from jsnoop.httpclient import HttpClient
 from jsnoop.plugins import maven
 from pyrus.mplogging import Logger, DEBUG, INFO
 
+def setUpModule():
+	global cache_path
+	fd, cache_path = mkstemp(prefix='jsnoop.test.maven.')
+	close(fd)
+	maven.cache_manager = maven.MavenCacheManager(cache_path)
+
+def tearDownModule():
+	maven.cache_manager.close()
+	remove(cache_path)
+	if exists(cache_path + '.jars'):
+		remove(cache_path + '.jars')
+
 class TestMavenPlugin(TestCase):
 	def setUp(self):
 		maven.logger.set_log_level(DEBUG)
@@ -35,5 +54,298 @@ class TestMavenPlugin(TestCase):
 		TestCase.tearDown(self)
 		maven.logger.set_log_level(INFO)
 
+POM = """<?xml version="1.0"?>
+<project xmlns="http://maven.apache.org/POM/4.0.0">
+	<groupId>%s</groupId>
+	<artifactId>%s</artifactId>
+	<version>%s</version>
+	<dependencyManagement><dependencies>%s</dependencies></dependencyManagement>
+</project>"""
+
+DEPENDENCY = """<dependency><groupId>%s</groupId><artifactId>%s</artifactId>
+<version>%s</version>%s</dependency>"""
+
+PROJECT = """<project><groupId>org.example</groupId><artifactId>%s</artifactId>
+<version>%s</version><dependencies>%s</dependencies></project>"""
+
+EXCLUSION = """<exclusions><exclusion><groupId>org.example</groupId>
+<artifactId>%s</artifactId></exclusion></exclusions>"""
+
+def project(artifact, version, *dependencies):
+	return PROJECT % (artifact, version, ''.join(DEPENDENCY % (('org.example',)
+			+ dependency) for dependency in dependencies))
+
+def path(artifact, version):
+	return '/repo/org/example/%s/%s/%s-%s.pom' % (artifact, version, artifact,
+			version)
+
+# Contents of the local stand-in for a remote repository
+FILES = {
+	path('root', '1.0'): project('root', '1.0', ('a', '1.0', ''),
+			('b', '1.0', EXCLUSION % 'x')),
+	path('a', '1.0'): project('a', '1.0', ('c', '2.0', '')),
+	path('b', '1.0'): project('b', '1.0', ('x', '1.0', ''), ('c', '1.0', ''),
+			('test-only', '1.0', '<scope>test</scope>')),
+	path('c', '2.0'): project('c', '2.0', ('d', '1.0', '')),
+	path('c', '1.0'): project('c', '1.0'),
+	path('x', '1.0'): project('x', '1.0'),
+	path('managed', '1.0'): project('managed', '1.0', ('a', '1.0', ''))
+			.replace('<dependencies>', '<dependencyManagement><dependencies>'
+			+ DEPENDENCY % ('org.example', 'c', '1.0', '')
+			+ '</dependencies></dependencyManagement><dependencies>', 1),
+	path('broken', '1.0'): project('broken', '1.0', ('orphan', '1.0', ''),
+			('importer', '1.0', ''), ('x', '1.0', '')),
+	path('orphan', '1.0'): project('orphan', '1.0', ('c', '1.0', ''))
+			.replace('<groupId>', '<parent><groupId>org.example</groupId>'
+			'<artifactId>gone</artifactId><version>1</version></parent>'
+			'<groupId>', 1),
+	path('importer', '1.0'): POM % ('org.example', 'importer', '1.0',
+			DEPENDENCY % ('org.example', 'gone-bom', '1', '<type>pom</type>'
+			'<scope>import</scope>')),
+	path('faulty', '1.0'): project('faulty', '1.0', ('malformed', '1.0', ''),
+			('unversioned', '1.0', ''), ('x', '1.0', '')),
+	path('malformed', '1.0'): project('malformed', '1.0')[:-5],
+	path('unversioned', '1.0'): project('unversioned', '1.0').replace(
+			'<dependencies>', '<dependencies><dependency><groupId>org.example'
+			'</groupId><artifactId>x</artifactId></dependency>', 1),
+	'/repo/com/example/app/1.0/app-1.0.pom': POM % ('com.example', 'app',
+			'1.0', DEPENDENCY % ('com.example', 'bom', '1.0',
+			'<type>pom</type><scope>import</scope>')),
+	'/repo/com/example/bom/1.0/bom-1.0.pom': POM % ('com.example', 'bom',
+			'1.0', DEPENDENCY % ('org.example', 'lib', '2.1', '')),
+	'/repo/com/example/app/1.0/app-1.0.jar.sha1':
+			'dcab88fc2a043c2479a6de676a2f8179e9ea2167',
+}
+
+class _Server(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+class _Handler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+	requests = []
+
+	def do_GET(self):
+		self.requests.append(self.path)
+		body = FILES.get(self.path)
+		status = 200 if body is not None else 404
+		body = (body or 'not found').encode()
+		self.send_response(status)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+class TestMavenHttpRemoteRepos(TestCase):
+	def setUp(self):
+		self.server = _Server(('127.0.0.1', 0), _Handler)
+		Thread(target=self.server.serve_forever, daemon=True).start()
+		self.uri = 'http://127.0.0.1:%d/repo/' % self.server.server_address[1]
+		self.repos = maven.MavenHttpRemoteRepos('stand-in', self.uri)
+		self.app = maven.Artifact('com.example', 'app', '1.0')
+		self.bom = maven.Artifact('com.example', 'bom', '1.0')
+
+	def tearDown(self):
+		self.server.shutdown()
+		self.server.server_close()
+
+	def test_download_pom(self):
+		self.assertIn('<artifactId>app</artifactId>',
+				self.repos.download_pom(self.app))
+		self.assertIsNone(self.repos.download_pom(
+				maven.Artifact('com.example', 'missing', '1.0')))
+
+	def test_download_poms(self):
+		missing = maven.Artifact('com.example', 'missing', '1.0')
+		poms = self.repos.download_poms([self.app, missing, self.bom])
+		self.assertIsNone(poms[1])
+		self.assertIn('<artifactId>bom</artifactId>', poms[2])
+
+	def test_fetch_checksum(self):
+		self.assertEqual(self.repos.fetch_checksum(self.app),
+				'dcab88fc2a043c2479a6de676a2f8179e9ea2167')
+
+	def test_cached(self):
+		missing = maven.Artifact('com.example', 'cached-missing', '1.0')
+		for _ in range(2):
+			self.repos.download_pom(self.app)
+			self.repos.download_pom(missing)
+		paths = [self.repos.get_artifact_uri(artifact, 'pom').split(
+				'%d' % self.server.server_address[1], 1)[1]
+				for artifact in (self.app, missing)]
+		for path in paths:
+			self.assertLessEqual(_Handler.requests.count(path), 1)
+		self.assertTrue(maven.cache_manager.documents.is_missing(
+				self.repos.get_artifact_uri(missing, 'pom')))
+
+	def test_artifact_pom(self):
+		self.assertFalse(maven.cache_manager.is_artifact_in_cache(self.bom))
+		maven.cache_manager.put_artifact_pom(self.bom, '<project/>')
+		self.assertTrue(maven.cache_manager.is_artifact_in_cache(self.bom))
+		self.assertFalse(maven.cache_manager.is_artifact_in_cache(self.bom,
+				jar=True))
+		self.assertEqual(maven.cache_manager.get_artifact_pom(self.bom),
+				'<project/>')
+		maven.cache_manager.documents.clear()
+
+	def test_artifact_jar(self):
+		maven.cache_manager.put_artifact_pom(self.bom, '<project/>')
+		maven.cache_manager.put_artifact_jar(self.bom, b'PK')
+		self.assertTrue(maven.cache_manager.is_artifact_in_cache(self.bom,
+				jar=True))
+		self.assertEqual(maven.cache_manager.get_artifact_jar(self.bom), b'PK')
+		# Jars have a store of their own, they do not evict POMs
+		self.assertIsNone(maven.cache_manager.documents.get(
+				'jar:%s' % self.bom))
+		self.assertEqual(maven.cache_manager.get_artifact_pom(self.bom),
+				'<project/>')
+		maven.cache_manager.documents.clear()
+		maven.cache_manager.jars.clear()
+
+	def test_connection_reuse(self):
+		client = HttpClient()
+		for _ in range(3):
+			client.get(self.repos.get_artifact_uri(self.app, 'pom'))
+		self.assertEqual(client.connections, 1)
+		client.close()
+
+	def test_import(self):
+		pom = maven.Pom(self.repos.download_pom(self.app), [self.repos])
+		poms = maven.find_poms([self.bom], [self.repos])
+		self.assertIn('<artifactId>bom</artifactId>', poms[0])
+		self.assertEqual(pom.get_dependency_management(),
+				{('org.example', 'lib'): ('2.1', None)})
+
+PARENT = """<?xml version="1.0" encoding="UTF-8"?>
+<project xmlns="http://maven.apache.org/POM/4.0.0"
+		xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+	<groupId>org.example</groupId><artifactId>parent</artifactId>
+	<version>3</version>
+	<properties><lib.version>${base.version}.1</lib.version>
+		<base.version>1.0</base.version><name>parent</name></properties>
+</project>"""
+
+CHILD = """<project xmlns="http://maven.apache.org/POM/4.0.0">
+	<parent><groupId>org.example</groupId><artifactId>parent</artifactId>
+		<version>3</version></parent>
+	<artifactId>child</artifactId>
+	<properties><base.version>2.0</base.version>
+		<loop>${loop}</loop></properties>
+	<dependencies>%s</dependencies>
+</project>""" % (DEPENDENCY % ('org.example', 'lib', '${lib.version}', '')
+		+ DEPENDENCY % ('${project.groupId}', 'other', '${name}', ''))
+
+class TestPom(TestCase):
+	def test_parse(self):
+		root = maven.parse_pom(PARENT)
+		self.assertEqual(root.tag, 'project')
+		self.assertEqual(root.findtext('properties/base.version'), '1.0')
+
+	def test_resolve_properties(self):
+		self.assertEqual(maven.resolve_properties({'a': '${b}-${c}',
+				'b': '${c}', 'c': 'x', 'd': '${d}', 'e': None, 'f': '${g}'}),
+				{'a': 'x-x', 'b': 'x', 'c': 'x', 'd': '${d}', 'e': None,
+				'f': '${g}'})
+
+	def test_inheritance(self):
+		parent = maven.Artifact('org.example', 'parent', '3')
+		maven.cache_manager.put_artifact_pom(parent, PARENT)
+		maven.load_pom.cache_clear()
+		child = maven.Pom(CHILD)
+		properties = child.get_properties()
+		# Our own properties override those of the parent, references are
+		# resolved after merging
+		self.assertEqual(properties['base.version'], '2.0')
+		self.assertEqual(properties['lib.version'], '2.0.1')
+		self.assertEqual(properties['loop'], '${loop}')
+		self.assertEqual([str(dependency) for dependency
+				in child.get_dependencies()],
+				['org.example:lib:2.0.1', 'org.example:other:parent'])
+		# The parent is shared by all children
+		self.assertIs(maven.Pom(CHILD).get_parent_pom(), child.get_parent_pom())
+		maven.load_pom.cache_clear()
+		maven.cache_manager.documents.clear()
+
+	def test_not_found(self):
+		parent = maven.Artifact('org.example', 'parent', '4')
+		# Eg: the repository could not be reached, the failure is not kept
+		self.assertIsNone(maven.load_pom(parent, []))
+		maven.cache_manager.put_artifact_pom(parent, PARENT)
+		self.assertIsNotNone(maven.load_pom(parent, []))
+		maven.load_pom.cache_clear()
+		maven.cache_manager.documents.clear()
+
+	def test_snapshot(self):
+		release = maven.Artifact('org.example', 'parent', '3')
+		snapshot = maven.Artifact('org.example', 'parent', '3-SNAPSHOT')
+		for artifact in (release, snapshot):
+			maven.cache_manager.put_artifact_pom(artifact, PARENT)
+		# Releases are shared, snapshots are read again so that they expire
+		self.assertIs(maven.load_pom(release), maven.load_pom(release))
+		self.assertIsNot(maven.load_pom(snapshot), maven.load_pom(snapshot))
+		maven.load_pom.cache_clear()
+		maven.cache_manager.documents.clear()
+
+class _Victims():
+	def match_artifact(self, name, version):
+		return ['CVE-2013-0001'] if (name, version) == ('c', '2.0') else []
+
+class TestDependencyResolver(TestCase):
+	def setUp(self):
+		self.server = _Server(('127.0.0.1', 0), _Handler)
+		Thread(target=self.server.serve_forever, daemon=True).start()
+		uri = 'http://127.0.0.1:%d/repo/' % self.server.server_address[1]
+		self.resolver = maven.DependencyResolver(4,
+				[maven.MavenHttpRemoteRepos('stand-in', uri)])
+
+	def tearDown(self):
+		self.server.shutdown()
+		self.server.server_close()
+
+	def test_resolve(self):
+		root = maven.Artifact('org.example', 'root', '1.0')
+		resolution = self.resolver.resolve([root])
+		self.assertEqual([str(artifact) for artifact in resolution], [
+				'org.example:root:1.0', 'org.example:a:1.0',
+				'org.example:b:1.0', 'org.example:c:2.0', 'org.example:d:1.0'])
+		self.assertEqual(resolution.depths[('org.example', 'd')], 3)
+		self.assertEqual([str(artifact) for artifact in resolution.missing],
+				['org.example:d:1.0'])
+		b = maven.Artifact('org.example', 'b', '1.0')
+		self.assertEqual(resolution.dependencies[b],
+				[maven.Artifact('org.example', 'c', '2.0')])
+		self.assertEqual(resolution.match_victims(_Victims()),
+				{maven.Artifact('org.example', 'c', '2.0'): ['CVE-2013-0001']})
+		# Resolving again is answered from the memoized dependencies
+		requests = len(_Handler.requests)
+		self.assertEqual(len(self.resolver.resolve([root])), 5)
+		self.assertEqual(len(_Handler.requests), requests)
+
+	def test_managed(self):
+		# The root's management applies to the transitive c, not to a
+		resolution = self.resolver.resolve([maven.Artifact('org.example',
+				'managed', '1.0')])
+		self.assertEqual([str(artifact) for artifact in resolution], [
+				'org.example:managed:1.0', 'org.example:a:1.0',
+				'org.example:c:1.0'])
+		self.assertEqual(resolution.missing, [])
+
+	def test_missing_parent(self):
+		resolution = self.resolver.resolve([maven.Artifact('org.example',
+				'broken', '1.0')])
+		self.assertEqual([str(artifact) for artifact in resolution.missing],
+				['org.example:gone:1', 'org.example:gone-bom:1'])
+		self.assertEqual([str(artifact) for artifact in resolution], [
+				'org.example:broken:1.0', 'org.example:orphan:1.0',
+				'org.example:importer:1.0', 'org.example:x:1.0'])
+
+	def test_unusable(self):
+		resolution = self.resolver.resolve([maven.Artifact('org.example',
+				'faulty', '1.0')])
+		self.assertEqual([str(artifact) for artifact in resolution.missing],
+				['org.example:malformed:1.0', 'org.example:unversioned:1.0'])
+		self.assertEqual(len(resolution), 4)
+
 if __name__ == '__main__':
 	main()
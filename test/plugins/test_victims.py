@@ -0,0 +1,101 @@
+from multiprocessing.pool import ThreadPool
+from os import close, remove
+from tempfile import mkstemp
+from unittest import TestCase, main
+from jsnoop.plugins import victims
+
+def make_entry(sha512, cves, classes):
+	return {'fields': {
+			'hash'		: sha512,
+			'cves'		: cves,
+			'name'		: 'lib-%s' % sha512,
+			'vendor'	: 'vendor',
+			'version'	: '1.0',
+			'hashes'	: {'sha512': {'files': {
+					'C%d.class' % i: h for i, h in enumerate(classes)}}}
+		}}
+
+class TestLocalDatabase(TestCase):
+	def setUp(self):
+		self.updates = [
+				make_entry('jar-a', ['CVE-2013-0001'], ['c1', 'c2', 'c3']),
+				make_entry('jar-b', ['CVE-2013-0002'], ['c3', 'c4']),
+			]
+		self.removals = []
+		self.fetch_json = victims.fetch_json
+		victims.fetch_json = self.fake_fetch_json
+		self.db = victims.LocalDatabase(no_cache=True)
+
+	def fake_fetch_json(self, timestamp, server=None, is_removals=False):
+		return self.removals if is_removals else self.updates
+
+	def test_match_archive(self):
+		self.assertEqual(self.db.match_archive('jar-a'), ['CVE-2013-0001'])
+		self.assertEqual(self.db.match_archive('jar-c'), [])
+
+	def test_match_artifact(self):
+		self.assertEqual(self.db.match_artifact('lib-jar-b', '1.0'),
+						['CVE-2013-0002'])
+		self.assertEqual(self.db.match_artifact('lib-jar-b', '2.0'), [])
+
+	def test_match_file_set(self):
+		# Shaded jar containing all classes of jar-a and some of jar-b
+		self.assertEqual(self.db.match_file_set(['x', 'c1', 'c2', 'c3', 'c4']),
+						['CVE-2013-0001', 'CVE-2013-0002'])
+		self.assertEqual(self.db.match_file_set(['c1', 'c3', 'c4']),
+						['CVE-2013-0002'])
+		self.assertEqual(self.db.match_file_set(['c1', 'c2']), [])
+
+	def test_incremental_update(self):
+		self.updates = [make_entry('jar-b', ['CVE-2013-0002'], ['c5'])]
+		self.removals = [make_entry('jar-a', [], [])]
+		self.db.update()
+		self.assertEqual(self.db.match_archive('jar-a'), [])
+		self.assertEqual(self.db.match_file_set(['c1', 'c2', 'c3']), [])
+		self.assertEqual(self.db.match_file_set(['c3', 'c4']), [])
+		self.assertEqual(self.db.match_file_set(['c5']), ['CVE-2013-0002'])
+
+	def test_entries(self):
+		self.assertEqual(len(self.db.entries), 2)
+		self.assertIn('jar-b', self.db.entries)
+		entry = self.db.entries['jar-b']
+		self.assertEqual(entry['cves'], ['CVE-2013-0002'])
+		self.assertEqual(sorted(entry['classes']), ['c3', 'c4'])
+
+	def test_persistent_store(self):
+		fd, path = mkstemp(prefix='jsnoop.test.victims.')
+		close(fd)
+		try:
+			victims.LocalDatabase(cache=path).close()
+			# Nothing new from the server, everything comes from the store
+			self.updates = []
+			db = victims.LocalDatabase(cache=path)
+			self.assertEqual(db.match_archive('jar-b'), ['CVE-2013-0002'])
+			self.assertEqual(db.match_file_set(['c3', 'c4']), ['CVE-2013-0002'])
+			db.close()
+		finally:
+			remove(path)
+
+	def test_shared_readonly(self):
+		fd, path = mkstemp(prefix='jsnoop.test.victims.')
+		close(fd)
+		try:
+			victims.LocalDatabase(cache=path).close()
+			db = victims.shared_database(path)
+			self.assertIs(victims.shared_database(path), db)
+			self.assertEqual(db.match_archive('jar-a'), ['CVE-2013-0001'])
+			self.assertEqual(db.match_file_set(['c1', 'c2', 'c3']),
+							['CVE-2013-0001'])
+			self.assertRaises(ValueError, db.update)
+			# Eg: scans on a thread pool
+			with ThreadPool(2) as pool:
+				self.assertEqual(pool.map(db.match_archive, ['jar-a'] * 4),
+								[['CVE-2013-0001']] * 4)
+		finally:
+			remove(path)
+
+	def tearDown(self):
+		victims.fetch_json = self.fetch_json
+
+if __name__ == '__main__':
+	main()
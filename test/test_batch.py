@@ -0,0 +1,95 @@
+import zipfile
+from os import close, remove, _exit
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp, mkstemp
+from unittest import TestCase, main
+from unittest.mock import patch
+from jsnoop import batch
+from jsnoop.batch import WorkQueue, BatchScanner, DONE, FAILED, RUNNING
+
+def _crash(path, options):
+	if path.endswith('lib-0.jar'):
+		# The worker is killed, eg: by the OOM killer
+		_exit(1)
+	return _scan(path, options)
+
+_scan = batch._scan
+
+class TestBatchScanner(TestCase):
+	def setUp(self):
+		self.directory = mkdtemp(prefix='jsnoop.test.batch.')
+		self.paths = []
+		for i in range(6):
+			path = join(self.directory, 'lib-%d.jar' % i)
+			with zipfile.ZipFile(path, 'w') as archive:
+				archive.writestr('META-INF/MANIFEST.MF',
+						'Manifest-Version: 1.0\nVersion: %d\n\n' % i)
+			self.paths.append(path)
+		fd, self.queue_path = mkstemp(prefix='jsnoop.test.queue.')
+		close(fd)
+		self.queue = WorkQueue(self.queue_path)
+		self.results = {}
+		self.errors = {}
+
+	def scanner(self, **kwargs):
+		return BatchScanner(self.queue, workers=2,
+				on_result=self.results.__setitem__,
+				on_error=self.errors.__setitem__, **kwargs)
+
+	def test_run(self):
+		missing = join(self.directory, 'missing.jar')
+		self.queue.add(self.paths + [missing])
+		self.queue.add(self.paths[:2])
+		counts = self.scanner(window=3).run()
+		self.assertEqual(counts[DONE], 6)
+		self.assertEqual(counts[FAILED], 1)
+		self.assertEqual(sorted(self.results), self.paths)
+		self.assertEqual([info[0]['name'] for info in
+				self.results.values()].count('lib-0.jar'), 1)
+		self.assertEqual(list(self.errors), [missing])
+		self.assertEqual([path for path, _ in self.queue.failures()],
+				[missing])
+
+	def test_resume(self):
+		self.queue.add(self.paths)
+		# An interrupted run left two paths running and completed one
+		claimed = self.queue.claim(3)
+		self.queue.complete(claimed[0])
+		self.assertEqual(self.queue.counts()[RUNNING], 2)
+		counts = self.scanner().run()
+		self.assertEqual(counts[DONE], 6)
+		self.assertEqual(sorted(self.results), self.paths[1:])
+
+	def test_retry(self):
+		self.queue.add(self.paths[:1])
+		self.queue.fail(self.queue.claim()[0], 'failed')
+		self.assertEqual(self.scanner().run()[FAILED], 1)
+		self.assertEqual(self.scanner().run(max_attempts=2)[DONE], 1)
+
+	def test_killed_worker(self):
+		self.queue.add(self.paths)
+		with patch('jsnoop.batch._scan', _crash):
+			counts = self.scanner(timeout=5).run()
+		self.assertEqual(counts[DONE], 5)
+		self.assertEqual(list(self.errors), self.paths[:1])
+		self.assertTrue(self.errors[self.paths[0]].startswith('TimeoutError'))
+
+	def test_max_attempts(self):
+		self.queue.add(self.paths[:2])
+		# Both were interrupted, the first of them twice
+		self.queue.claim()
+		self.queue.recover()
+		self.queue.claim(2)
+		self.assertEqual(self.queue.recover(max_attempts=2), 1)
+		self.assertEqual(self.queue.failures(),
+				[(self.paths[0], 'Interrupted 2 times')])
+		self.assertEqual(self.scanner().run(max_attempts=2)[DONE], 1)
+
+	def tearDown(self):
+		self.queue.close()
+		remove(self.queue_path)
+		rmtree(self.directory)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,88 @@
+import pickle
+from os import close, remove
+from tempfile import mkstemp
+from unittest import TestCase, main
+from jsnoop.buffer import BufferReader, MappedFile, map_file
+
+class TestBufferReader(TestCase):
+	def setUp(self):
+		self.data = b'Manifest-Version: 1.0\nCreated-By: test\n\ntrailer'
+		self.reader = BufferReader(self.data)
+
+	def test_read(self):
+		self.assertEqual(self.reader.read(8), self.data[:8])
+		self.assertEqual(self.reader.tell(), 8)
+		self.assertEqual(self.reader.read(), self.data[8:])
+		self.assertEqual(self.reader.read(), b'')
+		self.reader.seek(-7, 2)
+		self.assertEqual(self.reader.read(), b'trailer')
+
+	def test_readinto(self):
+		buf = bytearray(4)
+		self.reader.seek(len(self.data) - 2)
+		self.assertEqual(self.reader.readinto(buf), 2)
+		self.assertEqual(bytes(buf[:2]), b'er')
+
+	def test_readlines(self):
+		self.assertEqual(self.reader.readlines(),
+						self.data.splitlines(keepends=True))
+
+	def test_zero_copy(self):
+		source = bytearray(self.data)
+		reader = BufferReader(memoryview(source)[9:16])
+		source[9:16] = b'VERSION'
+		self.assertEqual(reader.read(), b'VERSION')
+
+	def test_pickle(self):
+		self.reader.seek(4)
+		reader = pickle.loads(pickle.dumps(self.reader))
+		self.assertEqual(reader.read(), self.data)
+
+	def test_close(self):
+		self.reader.close()
+		self.assertRaises(ValueError, self.reader.read)
+
+class TestMappedFile(TestCase):
+	def setUp(self):
+		self.data = bytes(range(256)) * 16
+		fd, self.path = mkstemp()
+		with open(fd, 'wb') as f:
+			f.write(self.data)
+
+	def tearDown(self):
+		remove(self.path)
+
+	def test_read(self):
+		with map_file(self.path) as reader:
+			self.assertEqual(reader.name, self.path)
+			reader.seek(-16, 2)
+			self.assertEqual(reader.read(), self.data[-16:])
+			with reader.getbuffer() as view:
+				self.assertEqual(view.nbytes, len(self.data))
+
+	def test_pickle(self):
+		with map_file(self.path) as reader:
+			copy = pickle.loads(pickle.dumps(reader))
+		self.assertIsInstance(copy, MappedFile)
+		self.assertEqual(copy.read(), self.data)
+		copy.close()
+
+	def test_close_with_views(self):
+		reader = map_file(self.path)
+		view = reader.getbuffer()[:4]
+		# Closing must not fail while a view is still in use
+		reader.close()
+		self.assertEqual(view.tobytes(), self.data[:4])
+		view.release()
+
+	def test_unmappable(self):
+		fd, path = mkstemp()
+		close(fd)
+		try:
+			self.assertIsNone(map_file(path))
+		finally:
+			remove(path)
+		self.assertIsNone(map_file(path))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,54 @@
+import hashlib
+from io import BytesIO
+from os import remove
+from tempfile import mkstemp
+from unittest import TestCase, main
+from jsnoop.checksum import MultiDigest, hexdigests, check_algorithms, \
+		required_by, DEFAULT_ALGORITHMS
+
+class TestChecksum(TestCase):
+	def setUp(self):
+		self.algorithms = ['md5', 'sha1', 'sha256', 'sha512']
+		self.data = bytes(range(256)) * 4099
+		self.expected = {algorithm: hashlib.new(algorithm, self.data).hexdigest()
+						for algorithm in self.algorithms}
+
+	def test_streaming(self):
+		multidigest = MultiDigest(self.algorithms)
+		for i in range(0, len(self.data), 1000):
+			multidigest.update(self.data[i:i + 1000])
+		self.assertEqual(multidigest.hexdigests(), self.expected)
+		self.assertEqual(multidigest.size, len(self.data))
+
+	def test_bytesio(self):
+		fileobj = BytesIO(self.data)
+		self.assertEqual(hexdigests(fileobj, self.algorithms), self.expected)
+		self.assertEqual(fileobj.tell(), 0)
+
+	def test_file(self):
+		fd, path = mkstemp()
+		with open(fd, 'wb') as f:
+			f.write(self.data)
+		try:
+			# Use a small buffer so that the chunked path is exercised
+			self.assertEqual(hexdigests(path, self.algorithms, 4096),
+							self.expected)
+		finally:
+			remove(path)
+
+	def test_check_algorithms(self):
+		self.assertEqual(check_algorithms(None), DEFAULT_ALGORITHMS)
+		self.assertEqual(check_algorithms(['sha1', 'blake2b', 'sha1']),
+						['sha1', 'blake2b'])
+		self.assertEqual(check_algorithms('md5'), ['md5'])
+		self.assertRaises(ValueError, check_algorithms, ['nope'])
+
+	def test_required_by(self):
+		class Consumer():
+			required_checksums = ['sha512']
+		class Other():
+			required_checksums = ['sha1', 'sha512']
+		self.assertEqual(required_by(Consumer, Other), ['sha512', 'sha1'])
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,100 @@
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socket import socket
+from socketserver import ThreadingMixIn
+from threading import Thread, Lock
+from time import sleep
+from unittest import TestCase, main
+from jsnoop.httpclient import HttpClient, HttpError
+
+class _Server(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+class _Handler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+	lock = Lock()
+	active = 0
+	peak = 0
+	connections = set()
+
+	def do_GET(self):
+		cls = self.__class__
+		with cls.lock:
+			cls.connections.add(self.client_address)
+			cls.active += 1
+			cls.peak = max(cls.peak, cls.active)
+		sleep(0.01)
+		with cls.lock:
+			cls.active -= 1
+		location = None
+		if self.path == '/missing':
+			body, status = b'not found', 404
+		elif self.path.startswith('/moved/'):
+			# /moved/<n> redirects to /moved/<n - 1> by a relative reference,
+			# /moved/0 to /done by an absolute one
+			hops = int(self.path[7:])
+			location = str(hops - 1) if hops else \
+					'http://%s:%d/done' % self.server.server_address
+			body, status = b'moved', 301
+		else:
+			body, status = self.path.encode(), 200
+		self.send_response(status)
+		if location is not None:
+			self.send_header('Location', location)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+class TestHttpClient(TestCase):
+	def setUp(self):
+		_Handler.connections = set()
+		_Handler.peak = 0
+		self.server = _Server(('127.0.0.1', 0), _Handler)
+		Thread(target=self.server.serve_forever, daemon=True).start()
+		self.base = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+	def tearDown(self):
+		self.server.shutdown()
+		self.server.server_close()
+
+	def test_keep_alive(self):
+		with HttpClient() as client:
+			for i in range(5):
+				self.assertEqual(client.get('%s/%d' % (self.base, i)),
+								b'/%d' % i)
+			self.assertEqual(client.connections, 1)
+		self.assertEqual(len(_Handler.connections), 1)
+
+	def test_not_found(self):
+		with HttpClient() as client:
+			self.assertRaises(HttpError, client.get, self.base + '/missing')
+			status, _, body = client.request(self.base + '/missing')
+			self.assertEqual((status, body), (404, b'not found'))
+
+	def test_redirect(self):
+		with HttpClient() as client:
+			self.assertEqual(client.get(self.base + '/moved/2'), b'/done')
+			self.assertRaises(HttpError, client.get, self.base + '/moved/5')
+
+	def test_get_many(self):
+		urls = ['%s/%d' % (self.base, i) for i in range(20)]
+		urls.append(self.base + '/missing')
+		with HttpClient(max_connections=3) as client:
+			results = client.get_many(urls)
+			self.assertLessEqual(client.connections, 3)
+		self.assertEqual(results[:-1], [b'/%d' % i for i in range(20)])
+		self.assertIsNone(results[-1])
+		self.assertLessEqual(_Handler.peak, 3)
+
+	def test_connection_refused(self):
+		with socket() as unused:
+			unused.bind(('127.0.0.1', 0))
+			port = unused.getsockname()[1]
+		with HttpClient() as client:
+			self.assertRaises(HttpError, client.get,
+							'http://127.0.0.1:%d/' % port)
+
+if __name__ == '__main__':
+	main()
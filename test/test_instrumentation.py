@@ -0,0 +1,48 @@
+import json
+from io import BytesIO, StringIO
+from unittest import TestCase, main
+from jsnoop import instrumentation
+from jsnoop.handlers.simplefile import SimpleFile
+
+class TestInstrumentation(TestCase):
+	def setUp(self):
+		self.data = b'x' * 1000
+
+	def test_disabled(self):
+		sink = instrumentation.MemorySink()
+		SimpleFile('a.txt', BytesIO(self.data))
+		self.assertEqual(sink.stats, {})
+
+	def test_memory_sink(self):
+		sink = instrumentation.enable(instrumentation.MemorySink())
+		SimpleFile('a.txt', BytesIO(self.data))
+		SimpleFile('b.txt', BytesIO(self.data))
+		self.assertEqual(sink.totals('bytes-hashed'), {'SimpleFile': 2000})
+		self.assertEqual(sink.totals('bytes-hashed', by='extension'),
+						{'.txt': 2000})
+		stat = sink.stats[('SimpleFile', '.txt', 'init-seconds')]
+		self.assertEqual(stat['count'], 2)
+
+	def test_json_lines_sink(self):
+		output = StringIO()
+		instrumentation.enable(instrumentation.JsonLinesSink(output))
+		SimpleFile('a.txt', BytesIO(self.data))
+		events = [json.loads(line) for line in output.getvalue().splitlines()]
+		self.assertIn({'handler': 'SimpleFile', 'extension': '.txt',
+				'metric': 'bytes-hashed', 'value': 1000},
+				[{k: v for k, v in event.items() if k != 'time'}
+				for event in events])
+
+	def test_prometheus_sink(self):
+		sink = instrumentation.enable(instrumentation.PrometheusSink())
+		SimpleFile('a.txt', BytesIO(self.data))
+		text = sink.export()
+		self.assertIn('# TYPE jsnoop_bytes_hashed summary', text)
+		self.assertIn('jsnoop_bytes_hashed_sum{handler="SimpleFile",'
+					'extension=".txt"} 1000', text)
+
+	def tearDown(self):
+		instrumentation.disable()
+
+if __name__ == '__main__':
+	main()
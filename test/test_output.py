@@ -0,0 +1,78 @@
+from hashlib import sha512, md5
+from io import BytesIO, StringIO
+from os import close, remove
+from tempfile import mkstemp
+from unittest import TestCase, main
+from jsnoop.output import open_writer, read_records, read_json_lines, \
+		read_binary
+
+def make_record(i):
+	return {
+		'path'		: 'WEB-INF/lib',
+		'name'		: 'lib-%d.jar' % i,
+		'type'		: '.jar',
+		'parent'	: sha512(b'parent').hexdigest(),
+		'handler'	: 'ArchiveFile',
+		'md5'		: md5(b'%d' % i).hexdigest(),
+		'sha512'	: sha512(b'%d' % i).hexdigest(),
+		'size'		: i - 3,
+		'ratio'		: 0.5,
+		'signed'	: i % 2 == 0,
+		'signature'	: None,
+		'manifest'	: {'Implementation-Version': '1.%d' % i},
+		'version'	: [51, 0]
+	}
+
+class TestOutput(TestCase):
+	def setUp(self):
+		self.records = [make_record(i) for i in range(5)]
+
+	def test_binary(self):
+		output = BytesIO()
+		with open_writer(output, 'binary') as writer:
+			writer.write_all(self.records)
+		self.assertEqual(writer.count, 5)
+		output.seek(0)
+		self.assertEqual(list(read_records(output)), self.records)
+		# Digests are stored as raw bytes
+		jsonl = StringIO()
+		with open_writer(jsonl, 'jsonl') as writer:
+			writer.write_all(self.records)
+		self.assertLess(len(output.getvalue()), len(jsonl.getvalue()) / 2)
+
+	def test_jsonl(self):
+		fd, path = mkstemp(prefix='jsnoop.test.output.')
+		close(fd)
+		with open_writer(path, 'jsonl') as writer:
+			writer.write_all(self.records)
+		self.assertEqual(list(read_records(path)), self.records)
+		with open(path) as f:
+			self.assertEqual(list(read_json_lines(f, ['name'])),
+					[{'name': record['name']} for record in self.records])
+		remove(path)
+
+	def test_fields(self):
+		output = BytesIO()
+		with open_writer(output, 'binary') as writer:
+			writer.write_all(self.records)
+			writer.write({'name': 'other', 'sha1': None})
+		output.seek(0)
+		self.assertEqual(list(read_binary(output, ['name', 'sha512']))[-2:],
+				[{'name': 'lib-4.jar', 'sha512': self.records[4]['sha512']},
+				{'name': 'other'}])
+
+	def test_large(self):
+		# Enough data for frames to span the reader's buffer
+		records = [make_record(i) for i in range(10000)]
+		output = BytesIO()
+		with open_writer(output, 'binary') as writer:
+			writer.write_all(records)
+		self.assertGreater(len(output.getvalue()), 1024 * 1024)
+		output.seek(0)
+		self.assertEqual(list(read_records(output)), records)
+
+	def test_unknown_format(self):
+		self.assertRaises(ValueError, open_writer, BytesIO(), 'xml')
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,193 @@
+import zipfile
+from io import BytesIO
+from os import close, remove
+from os.path import basename
+from tempfile import mkstemp
+from unittest import TestCase, main
+from unittest.mock import patch
+from jsnoop import instrumentation
+from jsnoop.buffer import map_file
+from jsnoop.handlers.archivefile import ArchiveChild
+from jsnoop.package import Package, Limits
+
+def build_zip(members):
+	data = BytesIO()
+	with zipfile.ZipFile(data, 'w', zipfile.ZIP_DEFLATED) as archive:
+		for name, content in members:
+			archive.writestr(name, content)
+	return data.getvalue()
+
+class TestPackage(TestCase):
+	def setUp(self):
+		innermost = build_zip([('a.txt', b'a'), ('b.txt', b'b')])
+		inner = build_zip([('innermost.jar', innermost), ('c.txt', b'c')])
+		members = [('inner.jar', inner), ('bomb.txt', b'\x00' * 1024 * 1024)]
+		members += [('%d.txt' % i, b'%d' % i) for i in range(5)]
+		fd, self.filepath = mkstemp(suffix='.zip')
+		close(fd)
+		with open(self.filepath, 'wb') as f:
+			f.write(build_zip(members))
+
+	def tearDown(self):
+		remove(self.filepath)
+
+	def names(self, **kwargs):
+		kwargs.setdefault('process_all_files', True)
+		return [(info['name'], info.get('reason')) for info
+				in Package(self.filepath, **kwargs).info]
+
+	def test_unlimited(self):
+		names = self.names()
+		self.assertEqual(len(names), 12)
+		self.assertNotIn('Truncated', [name[1] for name in names])
+		self.assertEqual(names, self.names(limits=Limits()))
+
+	def test_selected(self):
+		info = Package(self.filepath).info
+		handled = [child['name'] for child in info
+					if child['handler'] != 'Skipped']
+		self.assertEqual(handled, [info[0]['name'], 'inner.jar',
+					'innermost.jar'])
+		skipped = [child for child in info if child['handler'] == 'Skipped']
+		self.assertEqual(len(skipped), 9)
+		bomb = [child for child in skipped if child['name'] == 'bomb.txt'][0]
+		self.assertEqual(bomb['size'], 1024 * 1024)
+		self.assertNotIn('sha512', bomb)
+
+	def test_unlisted_extension(self):
+		manifest = b'Manifest-Version: 1.0\n'
+		inner = build_zip([('META-INF/MANIFEST.MF', manifest)])
+		with zipfile.ZipFile(self.filepath, 'w', zipfile.ZIP_DEFLATED) as archive:
+			archive.writestr('lib.aar', inner)
+			archive.writestr('plugin', inner)
+			archive.writestr('plugin.xyz', inner, zipfile.ZIP_STORED)
+			for i in range(50):
+				archive.writestr('res/%d.xml' % i, b'<resource/>' * 100)
+		sink = instrumentation.enable(instrumentation.MemorySink())
+		try:
+			info = Package(self.filepath, mmap=True).info
+		finally:
+			instrumentation.disable()
+		handlers = dict((child['name'], child['handler']) for child in info)
+		# Archives are found by their content whatever they are named
+		self.assertEqual(handlers['lib.aar'], 'ArchiveFile')
+		self.assertEqual(handlers['plugin'], 'ArchiveFile')
+		self.assertEqual(handlers['plugin.xyz'], 'ArchiveFile')
+		self.assertEqual(handlers['MANIFEST.MF'], 'ManifestFile')
+		self.assertEqual(handlers['0.xml'], 'Skipped')
+		# Resources are skipped without being extracted
+		self.assertEqual(sink.totals('bytes-extracted'),
+						{'ArchiveFile': 3 * (len(inner) + len(manifest))})
+
+	def test_max_depth(self):
+		names = self.names(limits=Limits(max_depth=1))
+		self.assertIn(('inner.jar', None), names)
+		self.assertIn(('inner.jar', 'max-depth'), names)
+		self.assertNotIn(('c.txt', None), names)
+
+	def test_max_ratio(self):
+		names = self.names(limits=Limits(max_ratio=100))
+		self.assertIn(('bomb.txt', 'max-ratio'), names)
+		self.assertIn(('c.txt', None), names)
+
+	def test_max_bytes(self):
+		names = self.names(limits=Limits(max_bytes=1024))
+		self.assertIn(('bomb.txt', 'max-bytes'), names)
+
+	def test_max_members(self):
+		names = self.names(limits=Limits(max_members=3))
+		self.assertEqual(len([name for name in names if name[1] is None]), 4)
+		self.assertEqual(len([name for name in names if name[1]]), 3)
+
+	def test_parallel(self):
+		limits = Limits(max_depth=1, max_ratio=100)
+		self.assertEqual(self.names(limits=limits),
+				self.names(limits=limits, workers=2, pool_type='thread'))
+
+	def test_parallel_process(self):
+		self.assertEqual(Package(self.filepath, process_all_files=True).info,
+				Package(self.filepath, process_all_files=True, workers=2,
+				pool_type='process').info)
+
+	def test_stream(self):
+		released = []
+		release = ArchiveChild.release
+		def tracked(child):
+			released.append(child.filename)
+			release(child)
+		with patch.object(ArchiveChild, 'release', tracked):
+			pkg = Package(self.filepath, stream=True, process_all_files=True)
+			# Nothing is collected up front
+			self.assertIsNone(pkg.info)
+			records = pkg.iter_info()
+			self.assertEqual(next(records)['name'], basename(self.filepath))
+			info = [next(records)]
+			self.assertEqual(released, [])
+			info += list(records)
+		self.assertEqual(info, Package(self.filepath,
+				process_all_files=True).info[1:])
+		# The extracted data of every child is released once it is done
+		self.assertEqual(sorted(released), sorted(child['name']
+				for child in info))
+
+	def test_parallel_max_members(self):
+		limits = Limits(max_members=1)
+		serial = self.names(limits=limits)
+		# A single record stands for the rest of each archive reached
+		self.assertEqual([name for name in serial if name[1]],
+				[('innermost.jar', 'max-members'), ('bomb.txt', 'max-members')])
+		for pool_type in ('thread', 'process'):
+			self.assertEqual(serial, self.names(limits=limits, workers=2,
+					pool_type=pool_type))
+
+	def test_records(self):
+		pkg = Package(self.filepath, process_all_files=True)
+		info = pkg.info
+		self.assertEqual(len(pkg.records), len(info))
+		self.assertEqual(info, list(Package(self.filepath, stream=True,
+				process_all_files=True).iter_info()))
+		# The top level archive is stored once and referenced by its children
+		parent = pkg.records[1].parent
+		self.assertEqual(pkg.table.parent_sha512(parent), info[0]['sha512'])
+		self.assertEqual(info[1]['parent'], info[0]['sha512'])
+
+	def test_checksums(self):
+		info = Package(self.filepath, process_all_files=True,
+					checksums=['sha1']).info
+		archives = [child for child in info if child['type'] in ('.zip', '.jar')]
+		files = [child for child in info if child['type'] == '.txt']
+		# Archives keep their sha512, it identifies them as parents
+		self.assertTrue(all('sha512' in child and 'sha1' in child
+							for child in archives))
+		self.assertTrue(all('sha512' not in child and 'md5' not in child
+							for child in files))
+		self.assertEqual([child['sha1'] for child in info],
+						[child['sha1'] for child in Package(self.filepath,
+						process_all_files=True).info])
+		self.assertRaises(ValueError, Package, self.filepath,
+						checksums=['nope'])
+
+	def test_mmap(self):
+		pkg = Package(self.filepath, process_all_files=True, mmap=True)
+		self.assertEqual(pkg.info, Package(self.filepath,
+				process_all_files=True).info)
+		self.assertTrue(pkg.mapping.closed)
+
+	def test_failed_init(self):
+		path = self.filepath + '.class'
+		with open(path, 'wb') as f:
+			f.write(b'xx')
+		mappings = []
+		def mapped(filepath):
+			mappings.append(map_file(filepath))
+			return mappings[-1]
+		try:
+			# The handler cannot parse the file, the mapping is closed anyway
+			with patch('jsnoop.package.map_file', mapped):
+				self.assertRaises(Exception, Package, path, mmap=True)
+		finally:
+			remove(path)
+		self.assertTrue(mappings[0].closed)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,51 @@
+from hashlib import sha512
+from unittest import TestCase, main
+from jsnoop.record import FileRecord, RecordTable
+
+class TestFileRecord(TestCase):
+	def setUp(self):
+		self.table = RecordTable()
+		self.parent = sha512(b'parent').hexdigest()
+		self.info = {
+			'path'		: 'META-INF',
+			'name'		: 'MANIFEST.MF',
+			'type'		: '.mf',
+			'parent'	: self.parent,
+			'handler'	: 'ManifestFile',
+			'sha1'		: sha512(b'sha1').hexdigest()[:40],
+			'sha512'	: sha512(b'child').hexdigest(),
+			'manifest-info': {'Manifest-Version': '1.0'}
+		}
+
+	def test_roundtrip(self):
+		record = FileRecord.from_dict(self.info, self.table)
+		self.assertEqual(record.digest('sha512'), sha512(b'child').digest())
+		self.assertIsNone(record.digest('md5'))
+		self.assertEqual(record.get('manifest-info'),
+						{'Manifest-Version': '1.0'})
+		converted = record.to_dict(self.table)
+		self.assertEqual(converted, self.info)
+		self.assertEqual(list(converted), list(self.info))
+
+	def test_shared_parent(self):
+		first = FileRecord.from_dict(self.info, self.table)
+		second = FileRecord.from_dict(self.info, self.table)
+		self.assertEqual(first.parent, second.parent)
+		self.assertEqual(len(self.table), 1)
+		self.assertIs(first.algorithms, second.algorithms)
+		self.assertEqual(self.table.parent_id(sha512(b'parent').digest()),
+						first.parent)
+
+	def test_no_parent(self):
+		self.info['parent'] = None
+		record = FileRecord.from_dict(self.info, self.table)
+		self.assertIsNone(record.parent)
+		self.assertIsNone(record.to_dict(self.table)['parent'])
+		self.assertEqual(len(self.table), 0)
+
+	def test_slots(self):
+		record = FileRecord.from_dict(self.info, self.table)
+		self.assertFalse(hasattr(record, '__dict__'))
+
+if __name__ == '__main__':
+	main()
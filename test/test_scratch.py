@@ -0,0 +1,64 @@
+from io import BytesIO
+from os.path import exists, isdir
+from unittest import TestCase, main
+from jsnoop import scratch
+from jsnoop.handlers import AbstractFile
+
+class OnDiskFile(AbstractFile):
+	@property
+	def inmemory(self):
+		return False
+
+class TestScratchSpace(TestCase):
+	def setUp(self):
+		self.scratch = scratch.ScratchSpace()
+
+	def test_persist_and_reuse(self):
+		path = self.scratch.persist('META-INF/A.RSA', BytesIO(b'data'))
+		self.assertTrue(path.endswith('META-INF/A.RSA'))
+		with open(path, 'rb') as f:
+			self.assertEqual(f.read(), b'data')
+		self.scratch.release(path)
+		self.assertFalse(exists(path))
+		# The released slot is used again
+		other = self.scratch.persist('META-INF/B.RSA', BytesIO(b'data'))
+		self.assertEqual(other.split('/')[-3], path.split('/')[-3])
+
+	def test_no_escape(self):
+		path = self.scratch.persist('../../evil', BytesIO(b'data'))
+		self.assertTrue(path.startswith(self.scratch.root))
+
+	def test_memfd(self):
+		with scratch.ScratchSpace(use_memfd=True) as space:
+			path = space.persist('A.RSA', BytesIO(b'data'))
+			with open(path, 'rb') as f:
+				self.assertEqual(f.read(), b'data')
+		# Nothing was written to the file system
+		self.assertIsNone(space.root)
+
+	def test_lazy_root(self):
+		self.assertIsNone(self.scratch.root)
+		self.scratch.persist('A.RSA', BytesIO(b'data'))
+		self.assertTrue(isdir(self.scratch.root))
+
+	def test_handler(self):
+		with self.scratch.activate():
+			self.assertIs(scratch.current(), self.scratch)
+			handler = OnDiskFile('lib/A.RSA', BytesIO(b'data'))
+		self.assertIsNot(scratch.current(), self.scratch)
+		self.assertTrue(handler.filepath.startswith(self.scratch.root))
+		path = handler.filepath
+		handler.close()
+		self.assertFalse(exists(path))
+		self.assertEqual(handler.filepath, 'lib/A.RSA')
+
+	def test_close(self):
+		self.scratch.persist('A.RSA', BytesIO(b'data'))
+		self.scratch.close()
+		self.assertFalse(isdir(self.scratch.root))
+
+	def tearDown(self):
+		self.scratch.close()
+
+if __name__ == '__main__':
+	main()